@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Adaptive Segmentation Timing
+Learns each speaker's pause and utterance-length distributions online and
+derives the segmenter's silence timeout and forced-cut length from them,
+within fixed safe bounds (the live counterpart of analyze_speech_pace.py).
+
+- Silence timeout: pauses are bimodal (short gaps inside a sentence, long
+  gaps between turns). The Otsu split between the two modes is the shortest
+  wait that does not cut sentences; it is only used once the modes are
+  clearly separated, otherwise the configured value stays.
+- Max duration: the 95th percentile of natural utterance lengths plus a
+  margin, so only outliers are force-cut.
+"""
+
+import os
+import threading
+import numpy as np
+
+ADAPTIVE_TIMING = os.getenv('CLOVA_ADAPTIVE_TIMING', '1') == '1'
+SILENCE_BOUNDS = (0.4, 2.0)        # Seconds; the learned silence timeout stays inside
+MAX_DURATION_BOUNDS = (6.0, 20.0)  # Seconds; the learned forced-cut length stays inside
+MIN_PAUSES = 30                    # Observations before the silence timeout adapts
+MIN_UTTERANCES = 20                # Observations before the max duration adapts
+MIN_SEPARATION = 0.5               # Otsu effectiveness required to trust the pause split
+UTTERANCE_MARGIN = 1.2
+HALF_LIFE = 200                    # Observations; older behaviour fades out
+MIN_PAUSE = 0.1                    # Shorter gaps are inside words, not pauses
+
+
+class DecayingHistogram:
+    """Fixed-width bins with exponential forgetting"""
+    def __init__(self, bin_seconds, max_seconds, half_life=HALF_LIFE):
+        self.bin = bin_seconds
+        self.counts = np.zeros(int(round(max_seconds / bin_seconds)) + 1)
+        self.centers = (np.arange(len(self.counts)) + 0.5) * bin_seconds
+        self.decay = 0.5 ** (1.0 / half_life)
+        self.n = 0
+
+    def observe(self, seconds):
+        self.counts *= self.decay
+        self.counts[min(int(seconds / self.bin), len(self.counts) - 1)] += 1.0
+        self.n += 1
+
+    def quantile(self, q):
+        cumulative = np.cumsum(self.counts)
+        if not cumulative[-1]: return None
+        return (int(np.searchsorted(cumulative, q * cumulative[-1])) + 1) * self.bin
+
+    def split(self):
+        """(Otsu threshold between short and long values, separability 0-1)"""
+        total = self.counts.sum()
+        if not total: return None, 0.0
+        p = self.counts / total
+        w0 = np.cumsum(p)
+        mu = np.cumsum(p * self.centers)
+        mu_t = mu[-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            between = np.where((w0 > 0) & (w0 < 1), (mu_t * w0 - mu) ** 2 / (w0 * (1 - w0)), 0.0)
+        k = int(np.argmax(between))
+        var_t = float((p * (self.centers - mu_t) ** 2).sum())
+        return (k + 1) * self.bin, float(between[k]) / var_t if var_t else 0.0
+
+
+class AdaptiveTiming:
+    """Per-speaker silence timeout and max duration; fed by VoiceSegmenter, read by it after each update"""
+    def __init__(self, name, silence_timeout, max_duration, enabled=ADAPTIVE_TIMING):
+        self.name = name
+        self.default_silence = silence_timeout
+        self.default_max = max_duration
+        self.enabled = enabled
+        self.silence_timeout = silence_timeout
+        self.max_duration = max_duration
+        self.lock = threading.Lock()
+        self.pauses = DecayingHistogram(0.02, SILENCE_BOUNDS[1] * 1.5)
+        self.utterances = DecayingHistogram(0.25, MAX_DURATION_BOUNDS[1] * 1.5)
+
+    def pause(self, seconds):
+        """A silence between two voiced frames (measured to the next onset, so never censored by the timeout)"""
+        if seconds < MIN_PAUSE: return
+        with self.lock:
+            self.pauses.observe(seconds)
+            if not self.enabled or self.pauses.n < MIN_PAUSES: return
+            split, separation = self.pauses.split()
+            if split is not None and separation >= MIN_SEPARATION:
+                self.silence_timeout = min(max(split, SILENCE_BOUNDS[0]), SILENCE_BOUNDS[1])
+
+    def utterance(self, seconds):
+        """Length of one utterance, forced cuts included (so long sentences are not censored at the cap)"""
+        with self.lock:
+            self.utterances.observe(seconds)
+            if not self.enabled or self.utterances.n < MIN_UTTERANCES: return
+            self.max_duration = min(max(self.utterances.quantile(0.95) * UTTERANCE_MARGIN, MAX_DURATION_BOUNDS[0]),
+                                    MAX_DURATION_BOUNDS[1])
+
+    def snapshot(self):
+        with self.lock:
+            split, separation = self.pauses.split()
+            p95 = self.utterances.quantile(0.95)
+            return {
+                'adaptive': self.enabled,
+                'silence_timeout': round(self.silence_timeout, 2), 'max_duration': round(self.max_duration, 2),
+                'default_silence_timeout': self.default_silence, 'default_max_duration': self.default_max,
+                'pauses': self.pauses.n, 'utterances': self.utterances.n,
+                'pause_split': round(split, 2) if split is not None else None, 'pause_separation': round(separation, 2),
+                'utterance_p95': round(p95, 2) if p95 is not None else None,
+            }
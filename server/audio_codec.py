@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Segment Encoder
+Packs relay PCM segments for /recognizer/upload. 'wav' is raw 16-bit PCM
+(32 KB/s); 'flac' is lossless and typically 40-60% smaller on speech.
+FLAC uses soundfile (pip install soundfile) if available, else the ffmpeg
+bundled with imageio-ffmpeg, else falls back to WAV.
+"""
+
+import io
+import struct
+import subprocess
+import threading
+import time
+import numpy as np
+
+import metrics
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+try:
+    import imageio_ffmpeg
+except ImportError:
+    imageio_ffmpeg = None
+
+SAMPLE_RATE = 16000
+
+
+def create_wav_header(data_length, sample_rate=SAMPLE_RATE, channels=1, bits_per_sample=16):
+    file_length = data_length + 36
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', file_length, b'WAVE',
+        b'fmt ', 16, 1, channels, sample_rate, sample_rate * channels * 2, channels * 2, bits_per_sample, b'data', data_length
+    )
+
+
+def encode_wav(pcm, sample_rate=SAMPLE_RATE):
+    return create_wav_header(len(pcm), sample_rate) + pcm
+
+
+def encode_flac_soundfile(pcm, sample_rate=SAMPLE_RATE):
+    buf = io.BytesIO()
+    soundfile.write(buf, np.frombuffer(pcm, dtype=np.int16), sample_rate, format='FLAC', subtype='PCM_16')
+    return buf.getvalue()
+
+
+def encode_flac_ffmpeg(pcm, sample_rate=SAMPLE_RATE):
+    cmd = [
+        imageio_ffmpeg.get_ffmpeg_exe(),
+        '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', 'pipe:0',
+        '-f', 'flac', '-compression_level', '5', 'pipe:1'
+    ]
+    return subprocess.run(cmd, input=bytes(pcm), capture_output=True, check=True).stdout
+
+
+def flac_backend():
+    if soundfile is not None: return 'soundfile'
+    if imageio_ffmpeg is not None: return 'ffmpeg'
+    return None
+
+
+# codec -> (encoder, filename, mime)
+CODECS = {
+    'wav': (encode_wav, 'speech.wav', 'audio/wav'),
+    'flac': (encode_flac_soundfile if soundfile is not None else encode_flac_ffmpeg, 'speech.flac', 'audio/flac'),
+}
+
+
+class SegmentEncoder:
+    """Encodes segments on upload workers and keeps size/CPU counters"""
+    def __init__(self, codec='wav'):
+        if codec not in CODECS:
+            print(f"⚠️ Unknown upload codec '{codec}', using wav")
+            codec = 'wav'
+        if codec == 'flac' and flac_backend() is None:
+            print("⚠️ FLAC needs soundfile or imageio-ffmpeg, using wav")
+            codec = 'wav'
+        self.codec = codec
+        self.lock = threading.Lock()
+        self.segments = 0
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+        self.encode_seconds = 0.0
+        self.fallbacks = 0
+
+    def encode(self, pcm):
+        """Return (payload, filename, mime) for the multipart 'media' field"""
+        start = time.perf_counter()
+        codec = self.codec
+        try:
+            encoder, filename, mime = CODECS[codec]
+            payload = encoder(pcm)
+        except Exception as e:
+            print(f"⚠️ {codec} encode failed, sending wav: {e}")
+            encoder, filename, mime = CODECS['wav']
+            payload = encoder(pcm)
+            with self.lock: self.fallbacks += 1
+            metrics.UPLOAD_ENCODE_FALLBACKS.inc(codec=codec)
+            codec = 'wav'
+        elapsed = time.perf_counter() - start
+
+        with self.lock:
+            self.segments += 1
+            self.raw_bytes += len(pcm)
+            self.encoded_bytes += len(payload)
+            self.encode_seconds += elapsed
+        metrics.record_encode(len(pcm), len(payload), elapsed, codec)
+        return payload, filename, mime
+
+    def stats(self):
+        with self.lock:
+            audio_seconds = self.raw_bytes / (SAMPLE_RATE * 2)
+            return {
+                'codec': self.codec,
+                'segments': self.segments,
+                'raw_bytes': self.raw_bytes,
+                'encoded_bytes': self.encoded_bytes,
+                'ratio': round(self.encoded_bytes / self.raw_bytes, 3) if self.raw_bytes else None,
+                'encode_ms_per_audio_s': round(self.encode_seconds * 1000 / audio_seconds, 2) if audio_seconds else None,
+                'fallbacks': self.fallbacks,
+            }
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark: N-channel relay worker path
+Feeds interleaved N-channel Int16 messages (default 8 inputs x 16 kHz, the
+browser's 4096-frame framing) through what clova_relay_stereo.py does per
+message, on one core and without uploads:
+
+- strided: the original per-channel path generalized to N (gain, clip,
+  astype, arr[c::N].tobytes() and RMS per channel, per-message routing)
+- kernel:  ChannelSplitter + FrameRouter (vectorized across all channels)
+- relay:   kernel + one VoiceSegmenter per channel, as the worker runs it
+
+Usage: python bench_channels.py [--channels 8] [--chunk 4096] [--seconds 3]
+"""
+
+import time
+import argparse
+import numpy as np
+
+from channel_dsp import ChannelSplitter, FrameRouter
+from segmenter import VoiceSegmenter
+import clova_relay_stereo as relay
+
+SAMPLE_RATE = 16000
+
+
+def make_audio(channels, chunk, count, seed=0):
+    """One speaker per input taking 1.5 s turns, heard at -8 dB on every other input"""
+    rng = np.random.default_rng(seed)
+    n = chunk * count
+    turn = (np.arange(n) // int(1.5 * SAMPLE_RATE)) % channels
+    voices = rng.normal(0, 300, (channels, n)) * (turn == np.arange(channels)[:, None])
+    mix = voices * 0.6 + voices.sum(axis=0) * 0.4
+    pcm = np.clip(mix.T, -32768, 32767).astype(np.int16).reshape(-1)
+    step = chunk * channels
+    return [pcm[i:i + step].tobytes() for i in range(0, len(pcm), step)]
+
+
+def strided(channels, gain):
+    def run(chunk):
+        arr = np.clip(np.frombuffer(chunk, dtype=np.int16) * gain, -32768, 32767).astype(np.int16)
+        sides = [arr[c::channels].tobytes() for c in range(channels)]
+        rms = [np.sqrt(np.mean(np.frombuffer(s, dtype=np.int16).astype(np.float32) ** 2)) for s in sides]
+        loudest = max(rms)
+        return [s if loudest >= relay.VAD_THRESHOLD and r * relay.DOMINANCE_RATIO >= loudest else bytes(len(s))
+                for s, r in zip(sides, rms)]
+    return run
+
+
+def kernel(channels, gain, chunk_frames, segment=False):
+    dsp = ChannelSplitter(channels, gain, chunk_frames, frame_len=SAMPLE_RATE // 50)
+    router = FrameRouter(channels, relay.VAD_THRESHOLD, relay.DOMINANCE_RATIO, relay.SWITCH_RATIO, SAMPLE_RATE)
+    segmenters = [VoiceSegmenter(relay.VAD_THRESHOLD, relay.SILENCE_TIMEOUT, relay.MAX_DURATION,
+                                 overlap_ms=int(relay.FORCE_OVERLAP * 1000), cut_search_ms=int(relay.CUT_SEARCH * 1000),
+                                 preroll_ms=int(relay.PRE_ROLL * 1000)) for _ in range(channels)] if segment else []
+
+    def run(chunk):
+        dsp.process(chunk)
+        router.route(dsp)
+        for c, seg in enumerate(segmenters):
+            seg.feed(dsp.channel(c))
+    return run, router
+
+
+def measure(fn, chunks, seconds):
+    """Messages per CPU second on this thread, cycling through the inputs"""
+    done, start = 0, time.process_time()
+    while True:
+        for chunk in chunks:
+            fn(chunk)
+        done += len(chunks)
+        elapsed = time.process_time() - start
+        if elapsed >= seconds: return done / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="N-channel relay worker benchmark")
+    parser.add_argument('--channels', type=int, default=8)
+    parser.add_argument('--chunk', type=int, default=4096, help="frames (samples per channel) per WebSocket message")
+    parser.add_argument('--seconds', type=float, default=3.0, help="CPU seconds per variant")
+    parser.add_argument('--gain', type=float, default=relay.DIGITAL_GAIN)
+    args = parser.parse_args()
+
+    chunks = make_audio(args.channels, args.chunk, 64)
+    audio_s = args.chunk * len(chunks) / SAMPLE_RATE
+    print(f"📊 {args.channels} channels x {SAMPLE_RATE // 1000} kHz, {args.chunk}-frame messages, "
+          f"{audio_s:.0f}s of turn-taking speech with crosstalk")
+
+    run, router = kernel(args.channels, args.gain, args.chunk)
+    for chunk in chunks: run(chunk)
+    stats = router.stats()
+    print(f"🔀 Frame routing over {audio_s:.0f}s: {sum(stats['passed_seconds'].values()):.1f}s passed, "
+          f"{sum(stats['muted_seconds'].values()):.1f}s crosstalk muted, {stats['saved_total']:.1f}s saved vs per-message")
+
+    print(f"\n{'variant':<10} {'msgs/s':>10} {'x realtime':>11} {'CPU %':>7}")
+    for name, fn in (('strided', strided(args.channels, args.gain)),
+                     ('kernel', kernel(args.channels, args.gain, args.chunk)[0]),
+                     ('relay', kernel(args.channels, args.gain, args.chunk, segment=True)[0])):
+        rate = measure(fn, chunks, args.seconds)
+        realtime = rate * args.chunk / SAMPLE_RATE  # Seconds of N-channel audio per CPU second
+        print(f"{name:<10} {rate:>10.0f} {realtime:>11.0f} {100 / realtime:>6.2f}%")
+
+
+if __name__ == "__main__":
+    main()
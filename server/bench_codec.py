@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark: upload encoding (CPU cost vs bytes saved)
+Cuts recorded sessions in server/recordings into relay-sized segments and
+encodes each one with every available upload codec.
+
+Usage: python bench_codec.py [--dir recordings] [--segment 8] [--verify]
+"""
+
+import os
+import io
+import wave
+import argparse
+import resource
+import time
+import numpy as np
+
+import audio_codec
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), 'recordings')
+
+
+def load_channels(path):
+    """Return a list of mono Int16 PCM byte strings (one per channel), or None if not 16 kHz PCM"""
+    with wave.open(path, 'rb') as w:
+        if w.getframerate() != audio_codec.SAMPLE_RATE or w.getsampwidth() != 2:
+            return None
+        channels = w.getnchannels()
+        arr = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+    return [arr[c::channels].tobytes() for c in range(channels)]
+
+
+def backends():
+    found = [('wav', audio_codec.encode_wav)]
+    if audio_codec.soundfile is not None:
+        found.append(('flac/soundfile', audio_codec.encode_flac_soundfile))
+    if audio_codec.imageio_ffmpeg is not None:
+        found.append(('flac/ffmpeg', audio_codec.encode_flac_ffmpeg))
+    return found
+
+
+def cpu_seconds():
+    # ffmpeg runs as a child process, so count children too
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + kids.ru_utime + kids.ru_stime
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload codec benchmark")
+    parser.add_argument('--dir', default=RECORDINGS_DIR)
+    parser.add_argument('--segment', type=float, default=8.0, help="segment length in seconds")
+    parser.add_argument('--verify', action='store_true', help="decode FLAC and check it is bit-exact")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        print(f"⚠️ {args.dir} not found")
+        return
+    files = sorted(f for f in os.listdir(args.dir) if f.lower().endswith('.wav'))
+    seg_bytes = int(args.segment * audio_codec.SAMPLE_RATE) * 2
+    segments = []
+    for name in files:
+        channels = load_channels(os.path.join(args.dir, name))
+        if channels is None:
+            print(f"⏭️ Skipping {name} (not 16 kHz 16-bit)")
+            continue
+        for pcm in channels:
+            segments.extend(pcm[i:i + seg_bytes] for i in range(0, len(pcm), seg_bytes) if len(pcm) - i >= 3200)
+    if not segments:
+        print(f"⚠️ No 16 kHz WAV recordings in {args.dir}")
+        return
+
+    raw = sum(len(s) for s in segments)
+    audio_seconds = raw / (audio_codec.SAMPLE_RATE * 2)
+    print(f"🎧 {len(segments)} segments, {audio_seconds:.0f}s of audio, {raw / 1e6:.1f} MB raw PCM\n")
+    print(f"{'codec':<16} {'MB':>8} {'ratio':>7} {'KB/s audio':>11} {'wall ms/s':>10} {'cpu ms/s':>9}")
+
+    for name, encoder in backends():
+        cpu0, wall0 = cpu_seconds(), time.perf_counter()
+        encoded = [encoder(s) for s in segments]
+        wall = time.perf_counter() - wall0
+        cpu = cpu_seconds() - cpu0
+        total = sum(len(e) for e in encoded)
+        print(f"{name:<16} {total / 1e6:>8.2f} {total / raw:>7.3f} {total / 1024 / audio_seconds:>11.1f} "
+              f"{wall * 1000 / audio_seconds:>10.2f} {cpu * 1000 / audio_seconds:>9.2f}")
+
+        if args.verify and name.startswith('flac') and audio_codec.soundfile is not None:
+            for pcm, blob in zip(segments, encoded):
+                decoded, _ = audio_codec.soundfile.read(io.BytesIO(blob), dtype='int16')
+                assert decoded.tobytes() == pcm, f"{name} is not lossless"
+            print(f"  ✅ {name} decodes bit-exact")
+
+
+if __name__ == "__main__":
+    main()
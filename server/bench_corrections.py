@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark: corrections.json replacement
+Compares the original per-entry str.replace loop with CorrectionEngine
+for dictionary sizes from a handful of entries up to thousands.
+
+Usage: python bench_corrections.py [--transcripts 2000] [--sizes 10,100,1000,5000]
+"""
+
+import os
+import random
+import argparse
+import time
+
+from correction_engine import CorrectionEngine
+
+BOOSTING_FILE = os.path.join(os.path.dirname(__file__), 'boostings.txt')
+
+
+def legacy_apply(corrections, text):
+    """The loop ClovaRelayServer.apply_corrections used before the automaton"""
+    if not text: return text
+    for wrong, correct in corrections.items():
+        if wrong in text:
+            text = text.replace(wrong, correct)
+    return text
+
+
+def load_words():
+    with open(BOOSTING_FILE, 'r', encoding='utf-8', errors='ignore') as f:
+        return [w.strip() for w in f if len(w.strip()) >= 2]
+
+
+def misrecognize(word, rng):
+    """Fake an STT error by swapping one Hangul syllable"""
+    i = rng.randrange(len(word))
+    return word[:i] + chr(rng.randint(0xAC00, 0xD7A3)) + word[i + 1:]
+
+
+def make_corrections(words, size, rng):
+    corrections = {}
+    while len(corrections) < size:
+        word = rng.choice(words)
+        corrections[misrecognize(word, rng)] = word
+    return corrections
+
+
+def make_transcripts(words, corrections, count, rng):
+    wrongs = list(corrections)
+    transcripts = []
+    for _ in range(count):
+        line = [rng.choice(words) for _ in range(rng.randint(5, 25))]
+        for _ in range(rng.randint(0, 2)):
+            line.insert(rng.randrange(len(line) + 1), rng.choice(wrongs))
+        transcripts.append(' '.join(line))
+    return transcripts
+
+
+def time_it(fn, transcripts):
+    start = time.perf_counter()
+    for t in transcripts: fn(t)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Correction engine benchmark")
+    parser.add_argument('--transcripts', type=int, default=2000)
+    parser.add_argument('--sizes', default='10,100,1000,5000')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = load_words()
+    print(f"📚 {len(words)} vocabulary words, {args.transcripts} transcripts per run\n")
+    print(f"{'entries':>8} {'build ms':>9} {'legacy µs/line':>15} {'engine µs/line':>15} {'speedup':>8}")
+
+    for size in [int(s) for s in args.sizes.split(',')]:
+        corrections = make_corrections(words, size, rng)
+        transcripts = make_transcripts(words, corrections, args.transcripts, rng)
+
+        start = time.perf_counter()
+        engine = CorrectionEngine(corrections)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        legacy = time_it(lambda t: legacy_apply(corrections, t), transcripts)
+        compiled = time_it(engine.apply, transcripts)
+        per_line = 1e6 / len(transcripts)
+        print(f"{size:>8} {build_ms:>9.1f} {legacy * per_line:>15.1f} {compiled * per_line:>15.1f} "
+              f"{legacy / compiled:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark: end-to-end relay replay
+Plays 16 kHz WAV files from server/recordings into a relay over WebSocket
+with the browser's framing (binary Int16 PCM messages of 4096 samples per
+channel; interleaved across inputs for the stereo/N-channel relay) in real time or faster, and
+reports time-to-first-transcript, end-of-speech-to-transcript latency,
+segment counts and uploaded bytes.
+
+By default the relay runs in-process, once per combination of --set values,
+so settings can be compared on the same audio:
+
+  python bench_replay.py --relay mono --set SILENCE_TIMEOUT=0.6,1.0 --set MAX_DURATION=8,15
+  python bench_replay.py --relay stereo --set DOMINANCE_RATIO=1.05,1.5
+  python bench_replay.py --url ws://localhost:3001   # replay into a running relay as-is
+
+For the stereo relay, <name>_Left.wav / <name>_Right.wav pairs (as written
+by the session recorder; one file per label with CLOVA_CHANNEL_LABELS) are
+interleaved back into one stream. Its channel count follows CLOVA_CHANNELS.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import wave
+import uuid
+import asyncio
+import argparse
+import importlib
+import itertools
+import numpy as np
+import websockets
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), 'recordings')
+SAMPLE_RATE = 16000
+CHUNK_SAMPLES = 4096  # ScriptProcessor buffer size in audioProcessor.js
+RELAYS = {'mono': ('clova_relay', 1), 'stereo': ('clova_relay_stereo', 2)}
+
+
+def read_wav(path):
+    """(Int16 array shaped [frames, channels], channels) or None if not 16 kHz 16-bit"""
+    with wave.open(path, 'rb') as w:
+        if w.getframerate() != SAMPLE_RATE or w.getsampwidth() != 2: return None
+        channels = w.getnchannels()
+        arr = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+    return arr.reshape(-1, channels)
+
+
+def load_inputs(directory, names, channels, labels=('Left', 'Right')):
+    """[(label, interleaved Int16 array)] matching the relay's channel count"""
+    files = names or sorted(f for f in os.listdir(directory) if f.lower().endswith('.wav'))
+    inputs, used = [], set()
+    for name in files:
+        if name in used: continue
+        path = name if os.path.isabs(name) else os.path.join(directory, name)
+        arr = read_wav(path)
+        if arr is None:
+            print(f"⏭️ Skipping {name} (not 16 kHz 16-bit)")
+            continue
+        if channels == 1:
+            mono = arr[:, 0] if arr.shape[1] == 1 else arr.mean(axis=1).astype(np.int16)
+            inputs.append((name, mono))
+            continue
+        if arr.shape[1] >= channels:
+            inputs.append((name, arr[:, :channels].reshape(-1)))
+            continue
+        # Recorder output: <base>_<label>.wav per channel, found from the first label's file
+        m = re.match(rf'(.*)_{re.escape(labels[0])}\.wav$', name, re.IGNORECASE)
+        partners = [os.path.join(os.path.dirname(path), f"{m.group(1)}_{label}.wav") for label in labels[1:]] if m else []
+        parts = [read_wav(p) if os.path.exists(p) else None for p in partners]
+        if not m or any(p is None for p in parts):
+            print(f"⏭️ Skipping {name} ({arr.shape[1]} channel(s); the relay needs {channels} channels or "
+                  f"{'/'.join(f'_{label}' for label in labels)} files)")
+            continue
+        parts = [arr] + parts
+        n = min(len(p) for p in parts)
+        inputs.append((m.group(1), np.stack([p[:n, 0] for p in parts], axis=1).reshape(-1)))
+        used.update(os.path.basename(p) for p in partners)
+    return inputs
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+class ReplayClient:
+    """One WebSocket connection; collects transcripts and answers stats requests"""
+    def __init__(self, url):
+        self.url = url
+        self.ws = None
+        self.transcripts = []  # (recv monotonic time, message)
+        self.replies = {}
+        self.reader = None
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, max_size=None)
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for raw in self.ws:
+                msg = json.loads(raw)
+                if msg.get('type') == 'transcript':
+                    self.transcripts.append((time.monotonic(), msg))
+                elif msg.get('type') in self.replies:
+                    future = self.replies.pop(msg['type'])
+                    if not future.done(): future.set_result(msg)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+    async def request(self, command, reply_type, timeout=5.0):
+        future = asyncio.get_running_loop().create_future()
+        self.replies[reply_type] = future
+        await self.ws.send(json.dumps({'command': command}))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return {}
+
+    async def close(self):
+        await self.ws.close()
+        if self.reader: await self.reader
+
+
+async def replay(url, label, audio, channels, speed, chunk_samples, tail):
+    client = ReplayClient(url)
+    await client.connect()
+    before = await client.request('get_upload_stats', 'upload_stats')
+    # Fresh station per run so the session sample clock starts at 0
+    await client.ws.send(json.dumps({'command': 'start', 'station': f"bench-{uuid.uuid4().hex[:8]}"}))
+
+    step = chunk_samples * channels
+    sent_at = []  # (end sample of chunk per channel, monotonic send time)
+    start = time.monotonic()
+    for i in range(0, len(audio), step):
+        chunk = audio[i:i + step]
+        samples = (i + len(chunk)) // channels
+        if speed > 0:
+            delay = start + samples / SAMPLE_RATE / speed - time.monotonic()
+            if delay > 0: await asyncio.sleep(delay)
+        await client.ws.send(chunk.tobytes())
+        sent_at.append((samples, time.monotonic()))
+    audio_end = time.monotonic()
+    await client.ws.send(json.dumps({'command': 'stop'}))
+
+    # Wait for the last lines: stop flushes the open segment; uploads and reordering take a while
+    deadline = audio_end + tail
+    while time.monotonic() < deadline: await asyncio.sleep(0.1)
+    after = await client.request('get_upload_stats', 'upload_stats')
+    await client.close()
+
+    ends = np.array([s for s, _ in sent_at])
+    latencies = []
+    for received, msg in client.transcripts:
+        if msg.get('end') is None: continue
+        idx = min(int(np.searchsorted(ends, msg['end'] * SAMPLE_RATE)), len(sent_at) - 1)
+        latencies.append(received - sent_at[idx][1])
+
+    enc0, enc1 = before.get('encoding', {}), after.get('encoding', {})
+    return {
+        'input': label,
+        'audio_s': len(audio) / channels / SAMPLE_RATE,
+        'wall_s': audio_end - start,
+        'transcripts': len(client.transcripts),
+        'ttft_s': client.transcripts[0][0] - start if client.transcripts else None,
+        'eos_p50_s': percentile(latencies, 50),
+        'eos_p90_s': percentile(latencies, 90),
+        'eos_max_s': max(latencies) if latencies else None,
+        'segments': enc1.get('segments', 0) - enc0.get('segments', 0),
+        'uploaded_bytes': enc1.get('encoded_bytes', 0) - enc0.get('encoded_bytes', 0),
+        'chars': sum(len(m.get('text', '')) for _, m in client.transcripts),
+    }
+
+
+def parse_sets(items):
+    """['A=1,2', 'B=3'] -> [{'A': 1.0, 'B': 3.0}, {'A': 2.0, 'B': 3.0}]"""
+    axes = []
+    for item in items or []:
+        key, _, values = item.partition('=')
+        axes.append([(key.strip(), float(v)) for v in values.split(',') if v.strip()])
+    return [dict(combo) for combo in itertools.product(*axes)] if axes else [{}]
+
+
+async def start_relay(kind):
+    module = importlib.import_module(RELAYS[kind][0])
+    server = module.ClovaRelayServer()
+    await asyncio.to_thread(server.uploader.start)
+    server.transcript_log.start()
+    ws_server = await module.serve(server.handle_client, 'localhost', 0)
+    port = list(ws_server.sockets)[0].getsockname()[1]
+    return module, ws_server, f"ws://localhost:{port}"
+
+
+def fmt(value, spec='.2f'):
+    return '-' if value is None else format(value, spec)
+
+
+def print_report(rows):
+    print(f"\n{'config':<34} {'input':<24} {'audio s':>8} {'lines':>6} {'TTFT s':>7} "
+          f"{'EoS p50':>8} {'EoS p90':>8} {'EoS max':>8} {'segs':>5} {'KB up':>8}")
+    for row in rows:
+        print(f"{row['config'][:34]:<34} {row['input'][:24]:<24} {row['audio_s']:>8.1f} {row['transcripts']:>6} "
+              f"{fmt(row['ttft_s']):>7} {fmt(row['eos_p50_s']):>8} {fmt(row['eos_p90_s']):>8} "
+              f"{fmt(row['eos_max_s']):>8} {row['segments']:>5} {row['uploaded_bytes'] / 1024:>8.0f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Replay recordings through a relay and measure latency")
+    parser.add_argument('files', nargs='*', help="WAV files (default: every .wav in --dir)")
+    parser.add_argument('--dir', default=RECORDINGS_DIR)
+    parser.add_argument('--relay', choices=RELAYS, default='mono')
+    parser.add_argument('--url', help="replay into a running relay instead of an in-process one")
+    parser.add_argument('--speed', type=float, default=1.0, help="1 = real time, 4 = 4x faster, 0 = as fast as possible")
+    parser.add_argument('--chunk', type=int, default=CHUNK_SAMPLES, help="samples per channel per message")
+    parser.add_argument('--tail', type=float, default=8.0, help="seconds to wait for late transcripts after the audio")
+    parser.add_argument('--set', action='append', metavar='NAME=V1,V2',
+                        help="relay setting to sweep, e.g. SILENCE_TIMEOUT=0.6,1.0 (repeatable)")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    module_name, channels = RELAYS[args.relay]
+    labels = None
+    if channels > 1:
+        # N-channel relay: count and labels from its settings (CLOVA_CHANNELS / CLOVA_CHANNEL_LABELS)
+        relay = importlib.import_module(module_name)
+        labels = relay.channel_labels(relay.CHANNEL_LABELS, relay.CHANNELS)
+        channels = len(labels)
+    inputs = load_inputs(args.dir, args.files, channels, labels)
+    if not inputs:
+        print(f"⚠️ No usable 16 kHz WAV recordings in {args.dir}")
+        return
+
+    configs = parse_sets(args.set)
+    module = ws_server = None
+    url = args.url
+    if url:
+        if args.set: print("⚠️ --set is ignored with --url (the running relay keeps its settings)")
+        configs = [{}]
+    else:
+        module, ws_server, url = await start_relay(args.relay)
+
+    rows = []
+    for config in configs:
+        for key, value in config.items():
+            if module is not None:
+                if not hasattr(module, key):
+                    print(f"⚠️ {module.__name__} has no setting {key}")
+                setattr(module, key, value)
+        name = ' '.join(f"{k}={v:g}" for k, v in config.items()) or 'default'
+        for label, audio in inputs:
+            print(f"▶️ {name} | {label} ({len(audio) / channels / SAMPLE_RATE:.0f}s at {f'{args.speed:g}x' if args.speed else 'max speed'})")
+            row = await replay(url, label, audio, channels, args.speed, args.chunk, args.tail)
+            rows.append({'config': name, **row})
+
+    print_report(rows)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    if ws_server:
+        ws_server.close()
+        await ws_server.wait_closed()
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    try: asyncio.run(main())
+    except KeyboardInterrupt: pass
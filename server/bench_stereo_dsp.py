@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark: stereo relay DSP (per-chunk gain, clip, deinterleave, RMS)
+Compares the original per-chunk numpy path (float64 gain, clip, astype,
+strided .tobytes() per side, RMS from bytes again) with the fused
+ChannelSplitter kernel on one core, and checks both produce the same audio.
+
+Usage: python bench_stereo_dsp.py [--chunk 4096] [--seconds 3] [--gain 30]
+"""
+
+import time
+import argparse
+import numpy as np
+
+from channel_dsp import ChannelSplitter
+
+SAMPLE_RATE = 16000
+
+
+def calculate_rms(audio_data):
+    """Baseline: as clova_relay_stereo.py computed it before the kernel"""
+    if not audio_data: return 0
+    arr = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
+    return np.sqrt(np.mean(arr**2))
+
+
+def legacy(chunk, gain):
+    arr = np.frombuffer(chunk, dtype=np.int16)
+    arr = np.clip(arr * gain, -32768, 32767).astype(np.int16)
+    left_raw = arr[0::2].tobytes()
+    right_raw = arr[1::2].tobytes()
+    return left_raw, right_raw, calculate_rms(left_raw), calculate_rms(right_raw)
+
+
+def fused(kernel):
+    def run(chunk, gain):
+        kernel.process(chunk)
+        return kernel.channel(0), kernel.channel(1), float(kernel.rms[0]), float(kernel.rms[1])
+    return run
+
+
+def measure(fn, chunks, gain, seconds):
+    """Chunks per CPU second on this thread, cycling through the inputs"""
+    done, start = 0, time.process_time()
+    while True:
+        for chunk in chunks:
+            fn(chunk, gain)
+        done += len(chunks)
+        elapsed = time.process_time() - start
+        if elapsed >= seconds: return done / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stereo DSP kernel microbenchmark")
+    parser.add_argument('--chunk', type=int, default=4096, help="frames (samples per channel) per WebSocket message")
+    parser.add_argument('--seconds', type=float, default=3.0, help="CPU seconds per variant")
+    parser.add_argument('--gain', type=float, default=30.0)
+    args = parser.parse_args()
+
+    # Speech-level noise on both mics; some chunks clip after gain
+    rng = np.random.default_rng(0)
+    chunks = [np.clip(rng.normal(0, 400 * (1 + i % 4), args.chunk * 2), -32768, 32767).astype(np.int16).tobytes()
+              for i in range(32)]
+    kernel = fused(ChannelSplitter(2, args.gain, args.chunk))
+
+    for chunk in chunks:
+        a, b = legacy(chunk, args.gain), kernel(chunk, args.gain)
+        assert a[0] == bytes(b[0]) and a[1] == bytes(b[1]), "kernel output differs from the original path"
+        assert abs(a[2] - b[2]) <= 1e-3 * max(1.0, a[2]) and abs(a[3] - b[3]) <= 1e-3 * max(1.0, a[3])
+    print(f"✅ Outputs identical on {len(chunks)} chunks ({args.chunk} frames, gain {args.gain:g})")
+
+    print(f"\n{'variant':<10} {'chunks/s':>10} {'frames/s':>12} {'x realtime':>11}")
+    rates = {}
+    for name, fn in (('before', legacy), ('after', kernel)):
+        rates[name] = rate = measure(fn, chunks, args.gain, args.seconds)
+        print(f"{name:<10} {rate:>10.0f} {rate * args.chunk:>12.3g} {rate * args.chunk / SAMPLE_RATE:>11.0f}")
+    print(f"\nSpeed-up: {rates['after'] / rates['before']:.2f}x per core")
+
+
+if __name__ == "__main__":
+    main()
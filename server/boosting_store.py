@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Boosting Store
+Keeps the keyword-boosting list per session and serializes the upload
+params blob once per change instead of once per segment. boostings.txt is
+re-read only when its mtime changes; session keyword additions and
+removals are applied in memory.
+"""
+
+import os
+import re
+import json
+import threading
+import time
+
+BOOSTING_FILE = os.path.join(os.path.dirname(__file__), 'boostings.txt')
+MTIME_CHECK_INTERVAL = 2.0  # Seconds between stat() calls on boostings.txt
+
+
+def split_words(text):
+    # Split by both newlines and commas
+    return [w.strip() for w in re.split(r'[,\n]+', text) if w.strip()]
+
+
+class BoostingFile:
+    """boostings.txt word list, shared by all sessions and reloaded on mtime change"""
+    def __init__(self, path=BOOSTING_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.words = ()
+        self.version = 0
+        self.checked_at = 0.0
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        """Reload if the file changed; returns the current version"""
+        now = time.monotonic()
+        if not force and now - self.checked_at < MTIME_CHECK_INTERVAL: return self.version
+        with self.lock:
+            self.checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime if os.path.exists(self.path) else None
+                if mtime == self.mtime and not force: return self.version
+                words = ()
+                if mtime is not None:
+                    with open(self.path, 'r', encoding='utf-8', errors='ignore') as f:
+                        words = tuple(split_words(f.read()))
+                self.mtime = mtime
+                self.words = words
+                self.version += 1
+                print(f"📚 Loaded {len(words)} boosting keywords. Examples: {list(words[:5])}")
+            except Exception as e:
+                print(f"⚠️ {e}")
+            return self.version
+
+
+class BoostingStore:
+    """Versioned boosting list for one session, with a cached params JSON blob"""
+    def __init__(self, base, limit=1000, params=None):
+        self.base = base
+        self.limit = limit
+        self.params = params or {}
+        self.lock = threading.Lock()
+        self.extra = {}        # Session keywords (dict as ordered set), sent before base words
+        self.removed = set()   # Base words hidden for this session
+        self.version = 0
+        self._built_for = None  # (own version, base version) of the cached blob
+        self._words = []
+        self._boostings = []
+        self._params_json = None
+
+    def set_extra(self, words):
+        """Replace the session keywords (update_keywords semantics)"""
+        with self.lock:
+            self.extra = dict.fromkeys(w.strip() for w in words if w.strip())
+            self.version += 1
+
+    def add(self, words):
+        with self.lock:
+            for w in words:
+                w = w.strip()
+                if not w: continue
+                self.extra[w] = None
+                self.removed.discard(w)
+            self.version += 1
+
+    def remove(self, words):
+        with self.lock:
+            for w in words:
+                w = w.strip()
+                self.extra.pop(w, None)
+                self.removed.add(w)
+            self.version += 1
+
+    def _rebuild(self):
+        key = (self.version, self.base.refresh())
+        if key == self._built_for: return
+        merged = dict.fromkeys(self.extra)
+        for w in self.base.words:
+            if w not in self.removed: merged.setdefault(w, None)
+        words = list(merged)
+        if self.limit: words = words[:self.limit]
+        boostings = [{"words": ",".join(words)}] if words else []
+        self._words = words
+        self._boostings = boostings
+        self._params_json = json.dumps({**self.params, 'boostings': boostings})
+        self._built_for = key
+
+    def params_json(self):
+        """Upload params, serialized once per change"""
+        with self.lock:
+            self._rebuild()
+            return self._params_json
+
+    def boostings(self):
+        with self.lock:
+            self._rebuild()
+            return self._boostings
+
+    def word_count(self):
+        with self.lock:
+            self._rebuild()
+            return len(self._words)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Channel DSP Kernel
+Splits interleaved Int16 PCM into per-channel Int16 buffers with digital
+gain and clipping applied, and computes each channel's RMS, in one pass
+over buffers allocated once and reused for every chunk. The returned views
+are only valid until the next process() call; consumers that keep audio
+(segmenter buffers, recognizer queues) copy what they need.
+
+FrameRouter then decides per 20 ms frame which channels carry the speaker
+(winner-takes-all with hysteresis) and zeroes the losing frames in place.
+"""
+
+import numpy as np
+
+
+class ChannelSplitter:
+    """Interleaved Int16 in; gained, clipped per-channel Int16 views and RMS out"""
+    def __init__(self, channels=2, gain=1.0, max_frames=4096, frame_len=320):
+        self.channels = channels
+        self.gain = np.float32(gain)
+        self.frame_len = frame_len  # Samples per routing frame (20 ms at 16 kHz)
+        self.frames = 0
+        self.n_frames = 0           # Whole routing frames in the last chunk
+        self.rms = np.zeros(channels, dtype=np.float32)
+        self._allocate(max_frames)
+
+    def _allocate(self, frames):
+        self.capacity = frames
+        self.work = np.empty((self.channels, frames), dtype=np.float32)  # Planar; gain/clip in place
+        self.out = np.empty((self.channels, frames), dtype=np.int16)     # One contiguous row per channel
+        self.zeros = np.zeros(frames, dtype=np.int16)
+        self.sumsq = np.empty(self.channels, dtype=np.float32)
+        self.frame_sumsq = np.empty((self.channels, frames // self.frame_len), dtype=np.float32)
+        self.frame_rms = np.empty_like(self.frame_sumsq)  # (channels, frames) of the last chunk
+
+    def process(self, chunk):
+        """Returns the frame count; read results via channel(c), silence() and rms"""
+        src = np.frombuffer(chunk, dtype=np.int16)
+        n = len(src) // self.channels
+        if n > self.capacity: self._allocate(n)  # Only when the client's chunk size grows
+        self.frames = n
+        self.n_frames = nf = n // self.frame_len
+        if not n:
+            self.rms[:] = 0
+            return 0
+        # Deinterleave and gain in one strided pass, then contiguous per-channel rows
+        src = src[:n * self.channels].reshape(n, self.channels).T
+        work = self.work[:, :n]
+        np.multiply(src, self.gain, out=work, dtype=np.float32)
+        np.clip(work, -32768, 32767, out=work)
+        # Energy per routing frame; the chunk RMS is their sum plus the partial tail frame
+        whole = nf * self.frame_len
+        frame_sumsq = self.frame_sumsq[:, :nf]
+        framed = work[:, :whole].reshape(self.channels, nf, self.frame_len)
+        np.einsum('cfl,cfl->cf', framed, framed, out=frame_sumsq)
+        np.sqrt(frame_sumsq / self.frame_len, out=self.frame_rms[:, :nf])
+        np.sum(frame_sumsq, axis=1, out=self.sumsq)
+        if whole < n: self.sumsq += np.einsum('ij,ij->i', work[:, whole:], work[:, whole:])
+        np.divide(self.sumsq, n, out=self.sumsq)
+        np.sqrt(self.sumsq, out=self.rms)
+        np.copyto(self.out[:, :n], work, casting='unsafe')  # Truncate to Int16 like astype()
+        return n
+
+    def channel(self, c):
+        """Byte view of channel c from the last process() call"""
+        return memoryview(self.out[c, :self.frames]).cast('B')
+
+    def silence(self):
+        """Byte view of digital silence as long as the last chunk"""
+        return memoryview(self.zeros[:self.frames]).cast('B')
+
+
+class FrameRouter:
+    """Winner-takes-all per routing frame, decided for a whole chunk at once
+
+    A frame is decisive when every channel is below the VAD threshold (nobody
+    speaks) or the loudest channel beats the runner-up by switch_ratio; the
+    other frames keep the last decisive owner, so crosstalk that is only a
+    little louder for a moment does not flip the route. Ambiguous frames
+    with no owner yet (speech starting after quiet) pass every channel within
+    dominance_ratio of the loudest, like the old per-message rule.
+    """
+    NONE = -1
+
+    def __init__(self, channels, vad_threshold, dominance_ratio, switch_ratio, sample_rate=16000):
+        self.channels = channels
+        self.vad_threshold = vad_threshold
+        self.dominance_ratio = dominance_ratio
+        self.switch_ratio = max(switch_ratio, dominance_ratio)
+        self.sample_rate = sample_rate
+        self.owner = self.NONE  # Carried across chunks
+        self.index = np.arange(channels)[:, None]
+        self.passed = np.zeros(channels)  # Seconds routed to each channel's processor
+        self.muted = np.zeros(channels)   # Voiced seconds withheld (crosstalk)
+        self.saved = np.zeros(channels)   # Of those, seconds the per-message rule would have passed
+
+    def route(self, dsp):
+        """Zero the losing frames of dsp.out in place; returns the (channels,) mask of the last frame"""
+        nf, fl, n = dsp.n_frames, dsp.frame_len, dsp.frames
+        if not nf:
+            # Shorter than a frame: follow the current owner
+            on = self.index[:, 0] == self.owner if self.owner != self.NONE else dsp.rms >= self.vad_threshold
+            dsp.out[~on, :n] = 0
+            return on
+
+        rms = dsp.frame_rms[:, :nf]
+        loudest = rms.argmax(axis=0)
+        top = rms[loudest, np.arange(nf)]
+        runner_up = np.partition(rms, -2, axis=0)[-2] if self.channels > 1 else np.zeros(nf, dtype=rms.dtype)
+        quiet = top < self.vad_threshold
+        decisive = quiet | (top > runner_up * self.switch_ratio)
+
+        # Forward-fill the last decisive owner (the previous chunk's owner before the first one)
+        claim = np.where(quiet, self.NONE, loudest)
+        last = np.where(decisive, np.arange(nf), -1)
+        np.maximum.accumulate(last, out=last)
+        owner = np.where(last >= 0, claim[np.maximum(last, 0)], self.owner)
+        self.owner = int(owner[-1])
+
+        on = self.index == owner
+        shared = (owner == self.NONE) & ~quiet
+        on |= shared & (rms * self.dominance_ratio >= top)
+
+        # Per-message rule on the chunk RMS, for the savings report
+        chunk_top = dsp.rms.max()
+        if chunk_top < self.vad_threshold: legacy = np.zeros(self.channels, dtype=bool)
+        else: legacy = dsp.rms * self.dominance_ratio >= chunk_top
+
+        voiced = rms >= self.vad_threshold
+        withheld = voiced & ~on
+        frame_seconds = fl / self.sample_rate
+        self.passed += on.sum(axis=1) * frame_seconds
+        self.muted += withheld.sum(axis=1) * frame_seconds
+        self.saved += (withheld & legacy[:, None]).sum(axis=1) * frame_seconds
+
+        dsp.out[:, :nf * fl].reshape(self.channels, nf, fl)[~on] = 0
+        tail = on[:, -1]
+        if nf * fl < n: dsp.out[~tail, nf * fl:n] = 0
+        return tail
+
+    def stats(self, labels=None):
+        labels = labels or [str(c) for c in range(self.channels)]
+        return {
+            'switch_ratio': self.switch_ratio, 'dominance_ratio': self.dominance_ratio,
+            'passed_seconds': {l: round(float(s), 2) for l, s in zip(labels, self.passed)},
+            'muted_seconds': {l: round(float(s), 2) for l, s in zip(labels, self.muted)},
+            'saved_seconds': {l: round(float(s), 2) for l, s in zip(labels, self.saved)},
+            'saved_total': round(float(self.saved.sum()), 2),
+        }
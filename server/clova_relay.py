@@ -2,266 +2,377 @@ import os
 import asyncio
 import json
 import queue
-import threading
 import time
-import struct
-import requests
-import numpy as np
 from dotenv import load_dotenv
 import websockets
 from websockets.server import serve
+from upload_dispatcher import UploadDispatcher
+from audio_codec import SegmentEncoder
+from correction_engine import CorrectionEngine
+from segmenter import VoiceSegmenter
+from pipeline import Pipeline, QueueSource, TapStage, SegmentStage, StreamStage
+from stitcher import SeamStitcher
+from timeline import span_fields, merge_records, format_conversation
+from adaptive_timing import AdaptiveTiming, ADAPTIVE_TIMING
+from reorder_buffer import OrderedDelivery
+from grpc_stream import StreamingRecognizer
+from boosting_store import BoostingFile, BoostingStore
+import llm_clients
+from plan_cache import PlanCache, plan_key
+from transcript_log import TranscriptLog, log_name
+from session_recorder import SessionRecorder, recording_name, RECORD_AUDIO
+from resilience import post_with_retry, RETRYABLE_STATUS, TRANSIENT_ERRORS, CircuitOpenError
+from relay_spool import RelaySpool
+import metrics
 
 load_dotenv()
 
-# Clova Speech API Info
-INVOKE_URL = "https://clovaspeech-gw.ncloud.com/external/v1/13590/4a8afe9a7aa788833f0e7ffeca45f57e94e549ac92209e374650cbe2119c885a"
-SECRET_KEY = "65132a9940b14133989e7e325e8c2518"
+# Clova Speech API Info (CLOVA_UPLOAD_URL overrides, e.g. to point at mock_clova.py)
+INVOKE_URL = os.getenv('CLOVA_UPLOAD_URL', "https://clovaspeech-gw.ncloud.com/external/v1/13590/4a8afe9a7aa788833f0e7ffeca45f57e94e549ac92209e374650cbe2119c885a")
+SECRET_KEY = os.getenv('CLOVA_UPLOAD_SECRET', "65132a9940b14133989e7e325e8c2518")
 
 # [Settings]
 # Mono mode settings
-VAD_THRESHOLD = 300     # Threshold for voice activity detection
-SILENCE_TIMEOUT = 3.0   # Send after 3 seconds of silence
-MAX_DURATION = 15.0     # Force send after 15 seconds
-
-def create_wav_header(data_length, sample_rate=16000, channels=1, bits_per_sample=16):
-    file_length = data_length + 36
-    return struct.pack(
-        '<4sI4s4sIHHIIHH4sI',
-        b'RIFF', file_length, b'WAVE',
-        b'fmt ', 16, 1, channels, sample_rate, sample_rate * channels * 2, channels * 2, bits_per_sample, b'data', data_length
-    )
+VAD_THRESHOLD = 300     # Frame RMS threshold for voice activity detection
+SILENCE_TIMEOUT = 1.0   # Send after 1 second of silence (measured in samples, not wall time)
+MAX_DURATION = 10.0     # Force send after 10 seconds of audio
+FORCE_OVERLAP = 0.8     # Seconds repeated at the start of the segment after a forced cut (words dropped by stitcher.py)
+CUT_SEARCH = 0.5        # Forced cuts land on the quietest frame within this many seconds before the limit
+PRE_ROLL = 0.3          # Seconds of audio before the first voiced frame kept at the start of each segment
+# Both are starting values; with CLOVA_ADAPTIVE_TIMING=1 (default) each station learns its own (adaptive_timing.py)
+IDLE_FLUSH = 1.0        # Close an open segment if the client stops sending for this long
+DEFAULT_STATION = 'default'  # Session used when 'start' carries no station/room id
+REORDER_MAX_HOLD = 3.0  # Max seconds a finished line waits for an earlier, slower upload
+# 'upload': VAD segments via /recognizer/upload, 'stream': continuous gRPC recognize stream
+RECOGNIZER_MODE = os.getenv('CLOVA_RELAY_MODE', 'upload')
+BOOSTING_LIMIT = 1000   # Max boosting words per request (session keywords first)
 
-class ClovaRelayServer:
-    def __init__(self):
-        self.websocket_clients = set()
+# Upload params; serialized once per boosting change by BoostingStore
+UPLOAD_PARAMS = {
+    'language': 'ko-KR',
+    'completion': 'sync',
+    'diarization': {
+        'enable': False
+    }
+}
+
+# Upload settings
+UPLOAD_WORKERS = int(os.getenv('CLOVA_UPLOAD_WORKERS', 4))    # Max concurrent uploads
+UPLOAD_QUEUE_SIZE = int(os.getenv('CLOVA_UPLOAD_QUEUE', 64))  # Segments allowed to wait
+UPLOAD_CODEC = os.getenv('CLOVA_UPLOAD_CODEC', 'wav')         # 'wav' or 'flac' (lossless, smaller)
+UPLOAD_ATTEMPTS = int(os.getenv('CLOVA_UPLOAD_ATTEMPTS', 3))  # Tries per segment (jittered backoff) before spooling
+
+# Treatment plan settings
+PLAN_PROMPT_VERSION = 1  # Bump when the treatment plan prompt changes so cached plans are not reused
+# provider='fastest' races the configured providers (see llm_clients.hedged_completion, LLM_HEDGE_DELAY)
+
+class RelaySession:
+    """Per-room state: audio buffer, worker thread, boostings and subscribers"""
+    def __init__(self, session_id, server):
+        self.id = session_id
+        self.server = server
+        self.subscribers = set()
         self.is_recording = False
         self.audio_queue = queue.Queue()
-        self.worker_thread = None
-        self.boostings = self.load_boostings()
-        self.corrections = self.load_corrections()
-        
-        # Buffer for single channel
-        self.audio_buffer = bytearray()
-        self.last_input_time = time.time()
-        self.last_send_time = time.time()
+        self.pipeline = None
+        self.boostings = BoostingStore(server.boosting_file, BOOSTING_LIMIT, UPLOAD_PARAMS)
 
-    def load_boostings(self):
-        boostings = []
-        try:
-            boosting_file = os.path.join(os.path.dirname(__file__), 'boostings.txt')
-            if os.path.exists(boosting_file):
-                content = open(boosting_file, 'r', encoding='utf-8', errors='ignore').read().strip()
-                if content:
-                    # Split by both newlines and commas
-                    import re
-                    all_words = [w.strip() for w in re.split(r'[,\n]+', content) if w.strip()]
-                    
-                    # Limit to 1000 words
-                    limited_words = all_words[:1000]
-                    if limited_words:
-                        boostings.append({"words": ",".join(limited_words)})
-                    print(f"📚 Loaded {len(limited_words)} boosting keywords. Examples: {limited_words[:5]}")
-        except Exception as e: print(f"⚠️ {e}")
-        return boostings
+        # Segmentation runs on the sample clock of this session's audio; the timing object outlives the session
+        self.timing = server.timing_for(session_id)
+        self.segmenter = VoiceSegmenter(VAD_THRESHOLD, SILENCE_TIMEOUT, MAX_DURATION, timing=self.timing,
+                                        overlap_ms=int(FORCE_OVERLAP * 1000), cut_search_ms=int(CUT_SEARCH * 1000),
+                                        preroll_ms=int(PRE_ROLL * 1000))
 
-    def load_corrections(self):
-        try:
-            file_path = os.path.join(os.path.dirname(__file__), 'corrections.json')
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"⚠️ Failed to load corrections: {e}")
-        return {}
+        # Transcripts are released in segment order
+        self.next_seq = 0
+        self.delivery = None
+        self.last_sent = None  # (seq, end_sample) of the previous segment, to link overlapped continuations
+        self.stitcher = SeamStitcher()
 
-    def save_corrections(self, new_data):
-        try:
-            file_path = os.path.join(os.path.dirname(__file__), 'corrections.json')
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(new_data, f, ensure_ascii=False, indent=2)
-            self.corrections = new_data
-            print(f"✅ Saved {len(new_data)} corrections")
-        except Exception as e:
-            print(f"⚠️ Failed to save corrections: {e}")
+        self.mode = RECOGNIZER_MODE
+        self.recognizer = None
 
-    def apply_corrections(self, text):
-        if not text: return text
-        for wrong, correct in self.corrections.items():
-            if wrong in text:
-                text = text.replace(wrong, correct)
-        return text
+        # Durable record of this session's final lines (session_logs/<id>-<time>.jsonl)
+        self.log_name = log_name(session_id)
+        self.recorder = None  # Optional raw audio archive into recordings/
+
+    def log_line(self, seq, raw, text, start_sample, end_sample, **seam):
+        # Unstitched text plus the seam fields, so readers can stitch the log the same way
+        self.server.transcript_log.append(self.log_name, {
+            'seq': seq, 'speaker': 'Director', 'start_sample': start_sample, 'end_sample': end_sample,
+            'raw': raw, 'text': text, **seam
+        })
+
+    def spool_segment(self, segment, seq, seam):
+        """Keep the audio on disk; the spool drainer delivers the line late under its original seq"""
+        self.server.spool.put(segment.audio, {
+            'station': self.id, 'log': self.log_name, 'seq': seq, 'speaker': 'Director',
+            'start_sample': segment.start_sample, 'end_sample': segment.end_sample,
+            'params': self.boostings.params_json(), **seam
+        })
 
     async def broadcast(self, msg_type, data):
-        if self.websocket_clients:
-            print(f"📡 Broadcasting to {len(self.websocket_clients)} clients")
-            msg = json.dumps({"type": msg_type, **data})
-            await asyncio.gather(*[c.send(msg) for c in self.websocket_clients], return_exceptions=True)
+        if self.subscribers:
+            print(f"📡 [{self.id}] Broadcasting to {len(self.subscribers)} clients")
+            msg = json.dumps({"type": msg_type, "station": self.id, **data})
+            start = time.perf_counter()
+            await asyncio.gather(*[c.send(msg) for c in self.subscribers], return_exceptions=True)
+            metrics.BROADCAST_SECONDS.observe(time.perf_counter() - start, type=msg_type)
 
-    def send_buffer(self, loop):
-        if len(self.audio_buffer) < 3200: # Ignore < 0.1s
-            self.audio_buffer = bytearray()
-            return
+    async def deliver(self, payload):
+        """Ordered final lines: drop words repeated across forced-cut seams, then broadcast"""
+        payload = self.stitcher.apply(payload)
+        if payload: await self.broadcast('transcript', payload)
 
-        current_buffer = self.audio_buffer[:]
-        self.audio_buffer = bytearray()
-        self.last_send_time = time.time()
+    def update_keywords(self, new_keywords, action='set'):
+        if action == 'add': self.boostings.add(new_keywords)
+        elif action == 'remove': self.boostings.remove(new_keywords)
+        else: self.boostings.set_extra(new_keywords)
+        print(f"📚 [{self.id}] Updated boostings ({action}): {self.boostings.word_count()} (v{self.boostings.version})")
 
-        threading.Thread(target=self._send_request, args=(current_buffer, loop)).start()
+    def send_segment(self, segment):
+        if segment.speech_samples < 1600: # Ignore < 0.1s of speech (pre-roll not counted)
+            print(f"🔇 [{self.id}] Dropped {segment.duration:.2f}s segment with {segment.speech_samples / 16000:.2f}s speech")
+            return
 
-    def _send_request(self, audio_data, loop):
+        seq = self.next_seq
+        self.next_seq += 1
+        # Continuation of a forced cut: its head repeats the previous segment's tail
+        seam = {}
+        if segment.overlap_samples and self.last_sent and self.last_sent[1] > segment.start_sample:
+            seam = {'continues': self.last_sent[0], 'overlap': round(segment.overlap, 3)}
+        self.last_sent = (seq, segment.end_sample)
+        metrics.SEGMENT_SECONDS.observe(segment.duration, reason=segment.reason)
+        icon = "⚡" if segment.reason == 'force' else "✨"
+        print(f"{icon} [{self.id}] #{seq} {segment.reason.title()} Send "
+              f"({segment.start:.1f}s-{segment.end:.1f}s, speech {segment.speech_samples / 16000:.1f}s)")
+        if not self.server.uploader.submit(self._send_request, segment, seq, seam, key=self.id):
+            self.delivery.submit_threadsafe(seq, None)
+
+    def _send_request(self, http, segment, seq, seam):
+        result = None
+        audio_data = segment.audio
+        outcome, sent_at = 'exception', time.perf_counter()
         try:
             url = f"{INVOKE_URL}/recognizer/upload"
             headers = {'X-CLOVASPEECH-API-KEY': SECRET_KEY}
-            params = {
-                'language': 'ko-KR',
-                'completion': 'sync',
-                'boostings': self.boostings,
-                'diarization': {
-                    'enable': False
-                }
-            }
-            # Mono WAV
-            wav = create_wav_header(len(audio_data), channels=1) + audio_data
+            # Mono WAV or FLAC, encoded here on the upload worker
+            media, filename, mime = self.server.encoder.encode(audio_data)
             files = {
-                'media': ('speech.wav', wav, 'audio/wav'),
-                'params': (None, json.dumps(params), 'application/json')
+                'media': (filename, media, mime),
+                'params': (None, self.boostings.params_json(), 'application/json')
             }
             
-            res = requests.post(url, headers=headers, files=files, timeout=10)
+            sent_at = time.perf_counter()
+            res = post_with_retry(http, url, self.server.spool.breaker, UPLOAD_ATTEMPTS, headers=headers, files=files, timeout=10)
+            outcome = 'http_error'
             
             if res.status_code == 200:
                 data = res.json()
                 text = data.get('text', '')
+                outcome = 'ok' if text else 'empty'
                 if text:
                     # Apply corrections
                     original_text = text
-                    text = self.apply_corrections(text)
+                    text = self.server.apply_corrections(text)
                     if text != original_text:
                         print(f"🔧 Corrected: '{original_text}' -> '{text}'")
                     
-                    print(f"📝 Transcript: {text}")
-                    asyncio.run_coroutine_threadsafe(
-                        self.broadcast('transcript', {'text': text, 'speaker': 'Director'}), loop
-                    )
+                    print(f"📝 [{self.id}] #{seq} Transcript: {text}")
+                    self.log_line(seq, original_text, text, segment.start_sample, segment.end_sample, **seam)
+                    result = {
+                        'text': text, 'speaker': 'Director', 'seq': seq,
+                        **span_fields(segment.start_sample, segment.end_sample), **seam
+                    }
                 else:
-                    print(f"⚪ Empty response")
+                    print(f"⚪ [{self.id}] Empty response")
             else:
-                print(f"❌ API Error {res.status_code}: {res.text}")
+                print(f"❌ [{self.id}] API Error {res.status_code}: {res.text}")
+                if res.status_code in RETRYABLE_STATUS: self.spool_segment(segment, seq, seam)
+        except CircuitOpenError:
+            outcome = 'circuit_open'
+            self.spool_segment(segment, seq, seam)
         except Exception as e:
-            print(f"❌ Request Failed: {e}")
+            print(f"❌ [{self.id}] Request Failed: {e}")
+            if isinstance(e, TRANSIENT_ERRORS): self.spool_segment(segment, seq, seam)
+        finally:
+            if outcome != 'circuit_open':
+                metrics.record_upload(len(audio_data) / 32000, time.perf_counter() - sent_at, outcome)
+            # Every sequence number is reported, even empty or failed ones
+            self.delivery.submit_threadsafe(seq, result)
 
-    def main_worker(self, loop):
-        print("🎧 Mono Processing Started")
-        
-        while self.is_recording:
-            try:
-                chunk = self.audio_queue.get(timeout=0.1)
-                
-                # Assume input is already mono Int16 PCM from frontend
-                self.audio_buffer.extend(chunk)
-                self.last_input_time = time.time()
-
-                # Calculate RMS for VAD logging (optional)
-                if len(chunk) > 0:
-                    arr = np.frombuffer(chunk, dtype=np.int16).astype(np.float32)
-                    rms = np.sqrt(np.mean(arr**2))
-                    # print(f"RMS: {rms:.0f}") # Too noisy, maybe log occasionally
-
-                # Check force send
-                time_since_send = time.time() - self.last_send_time
-                if len(self.audio_buffer) > 320000 or time_since_send > MAX_DURATION: # 20s or max duration
-                    print("⚡ Force Send (Duration/Size)")
-                    self.send_buffer(loop)
-
-            except queue.Empty:
-                # Check silence timeout
-                if len(self.audio_buffer) > 0 and (time.time() - self.last_input_time > SILENCE_TIMEOUT):
-                    print("✨ Silence Send")
-                    self.send_buffer(loop)
-                continue
-
-    async def start_recording(self, loop):
+    def _on_stream_result(self, text, is_final, start_sample, end_sample):
+        raw, text = text, self.server.apply_corrections(text)
+        payload = {'text': text, 'speaker': 'Director', **span_fields(start_sample, end_sample)}
+
+        if is_final:
+            seq = self.next_seq
+            self.next_seq += 1
+            payload['seq'] = seq
+            print(f"📝 [{self.id}] #{seq} Transcript: {text}")
+            self.log_line(seq, raw, text, start_sample, end_sample)
+            self.delivery.submit_threadsafe(seq, payload)
+        else:
+            self.delivery.send_unordered_threadsafe(lambda p: self.broadcast('transcript_partial', p), payload)
+
+    def build_pipeline(self):
+        """queue -> [recorder] -> segmenter + upload, or gRPC stream (Clova end-points, silence included)"""
+        stages = []
+        if self.recorder: stages.append(TapStage('record', lambda frame: self.recorder.write(frame.pcm)))
+        if self.recognizer: stages.append(StreamStage(self.recognizer))
+        else: stages.append(SegmentStage(self.segmenter, self.send_segment, IDLE_FLUSH))
+        # Input is already mono Int16 PCM from the frontend; the pipeline clock continues the segmenter's
+        pipeline = Pipeline(f"mono:{self.id}", QueueSource(self.audio_queue), stages)
+        pipeline.sample_pos = self.segmenter.sample_pos
+        return pipeline
+
+    async def start(self, loop, mode=None, record=None):
         if self.is_recording: return
         self.is_recording = True
         while not self.audio_queue.empty(): self.audio_queue.get()
         
-        self.worker_thread = threading.Thread(target=self.main_worker, args=(loop,), daemon=True)
-        self.worker_thread.start()
-        print("✅ Recording Started")
+        if self.delivery is None:
+            self.delivery = OrderedDelivery(loop, self.deliver, REORDER_MAX_HOLD)
+        if mode in ('upload', 'stream'): self.mode = mode
+        if self.mode == 'stream':
+            self.recognizer = StreamingRecognizer(self.id, self.boostings.boostings(), self._on_stream_result)
+            # One session clock across modes
+            self.recognizer.samples_fed = self.segmenter.sample_pos
+            self.recognizer.start()
+        if RECORD_AUDIO if record is None else record:
+            self.recorder = SessionRecorder(recording_name(self.id))
+            await asyncio.to_thread(self.recorder.start)
+        
+        self.pipeline = self.build_pipeline()
+        self.pipeline.start()
+        print(f"✅ [{self.id}] Recording Started ({self.mode})")
 
-    async def stop_recording(self):
+    async def stop(self):
+        if not self.is_recording: return
         self.is_recording = False
-        if self.worker_thread: self.worker_thread.join(timeout=1)
-        print("✅ Recording Stopped")
+        # Drains what arrived before stop and closes the last utterance; joined off the event loop so other rooms keep flowing
+        if self.pipeline: await asyncio.to_thread(self.pipeline.stop, 1)
+        if self.recognizer:
+            await asyncio.to_thread(self.recognizer.close)
+            self.segmenter.sample_pos = self.recognizer.samples_fed
+            self.recognizer = None
+        if self.recorder:
+            await asyncio.to_thread(self.recorder.close)
+            self.recorder = None
+        print(f"✅ [{self.id}] Recording Stopped")
 
-    def _call_openai(self, prompt):
-        api_key = os.getenv('OPENAI_API_KEY') or os.getenv('VITE_OPENAI_API_KEY')
-        if not api_key: return "❌ OpenAI API Key missing"
-        
-        try:
-            res = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={"Authorization": f"Bearer {api_key}"},
-                json={
-                    "model": "gpt-4o",
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.7
-                },
-                timeout=30
-            )
-            if res.status_code == 200:
-                return res.json()['choices'][0]['message']['content']
-            return f"❌ OpenAI Error {res.status_code}: {res.text}"
-        except Exception as e:
-            return f"❌ OpenAI Request Failed: {e}"
 
-    def _call_gemini(self, prompt):
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key: return "❌ Gemini API Key missing"
-        
+class ClovaRelayServer:
+    def __init__(self):
+        self.websocket_clients = set()
+        self.sessions = {}        # station/room id -> RelaySession
+        self.client_sessions = {} # websocket -> RelaySession
+        self.timing = {}          # station/room id -> AdaptiveTiming, kept across sessions and reconnects
+        self.boosting_file = BoostingFile()  # Shared base list, reloaded on mtime change
+        self.corrections = self.load_corrections()
+        self.correction_engine = CorrectionEngine(self.corrections)
+        self.uploader = UploadDispatcher(INVOKE_URL, UPLOAD_WORKERS, UPLOAD_QUEUE_SIZE, name="clova-upload")
+        self.encoder = SegmentEncoder(UPLOAD_CODEC)
+        self.plan_cache = PlanCache()
+        self.transcript_log = TranscriptLog()
+        self.spool = RelaySpool('mono', INVOKE_URL, SECRET_KEY, self.encoder, self.transcript_log,
+                                self.apply_corrections, self.live_delivery)
+        metrics.REGISTRY.gauge('relay_audio_queue_depth', 'Audio buffers waiting for the session worker', lambda: {
+            (('station', sid),): s.audio_queue.qsize() for sid, s in list(self.sessions.items())
+        })
+        metrics.REGISTRY.gauge('clova_upload_pending', 'Segments waiting for an upload worker',
+                               lambda: self.uploader.stats()['pending'])
+        metrics.REGISTRY.gauge('relay_silence_timeout_seconds', 'Current (learned) silence timeout per speaker', lambda: {
+            (('speaker', sid),): t.silence_timeout for sid, t in list(self.timing.items())
+        })
+        metrics.REGISTRY.gauge('relay_max_duration_seconds', 'Current (learned) forced-cut length per speaker', lambda: {
+            (('speaker', sid),): t.max_duration for sid, t in list(self.timing.items())
+        })
+
+    def timing_for(self, station_id):
+        """Learned timing for a station; starts over if the configured defaults changed"""
+        timing = self.timing.get(station_id)
+        if timing is None or (timing.default_silence, timing.default_max, timing.enabled) != (
+                SILENCE_TIMEOUT, MAX_DURATION, bool(ADAPTIVE_TIMING)):
+            timing = self.timing[station_id] = AdaptiveTiming(station_id, SILENCE_TIMEOUT, MAX_DURATION, bool(ADAPTIVE_TIMING))
+        return timing
+
+    def live_delivery(self, meta):
+        """Ordered delivery of the recording a recovered segment belongs to, while it is still live"""
+        session = self.sessions.get(meta['station'])
+        if session and session.log_name == meta['log']: return session.delivery
+        return None
+
+    def load_corrections(self):
         try:
-            # Gemini 1.5 Flash (or Pro)
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={api_key}"
-            res = requests.post(
-                url,
-                headers={"Content-Type": "application/json"},
-                json={
-                    "contents": [{"parts": [{"text": prompt}]}]
-                },
-                timeout=30
-            )
-            if res.status_code == 200:
-                return res.json()['candidates'][0]['content']['parts'][0]['text']
-            return f"❌ Gemini Error {res.status_code}: {res.text}"
+            file_path = os.path.join(os.path.dirname(__file__), 'corrections.json')
+            if os.path.exists(file_path):
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
         except Exception as e:
-            return f"❌ Gemini Request Failed: {e}"
+            print(f"⚠️ Failed to load corrections: {e}")
+        return {}
 
-    def _call_claude(self, prompt):
-        api_key = os.getenv('ANTHROPIC_API_KEY')
-        if not api_key: return "❌ Anthropic API Key missing"
-        
+    def save_corrections(self, new_data):
         try:
-            res = requests.post(
-                "https://api.anthropic.com/v1/messages",
-                headers={
-                    "x-api-key": api_key,
-                    "anthropic-version": "2023-06-01",
-                    "content-type": "application/json"
-                },
-                json={
-                    "model": "claude-3-5-sonnet-20240620",
-                    "max_tokens": 1000,
-                    "messages": [{"role": "user", "content": prompt}]
-                },
-                timeout=30
-            )
-            if res.status_code == 200:
-                return res.json()['content'][0]['text']
-            return f"❌ Claude Error {res.status_code}: {res.text}"
+            file_path = os.path.join(os.path.dirname(__file__), 'corrections.json')
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(new_data, f, ensure_ascii=False, indent=2)
+            self.corrections = new_data
+            # Rebuild once here; workers pick up the new automaton on their next transcript
+            self.correction_engine = CorrectionEngine(new_data)
+            print(f"✅ Saved {len(new_data)} corrections")
         except Exception as e:
-            return f"❌ Claude Request Failed: {e}"
+            print(f"⚠️ Failed to save corrections: {e}")
+
+    def apply_corrections(self, text):
+        if not text: return text
+        return self.correction_engine.apply(text)
+
+    async def broadcast(self, msg_type, data):
+        if self.websocket_clients:
+            print(f"📡 Broadcasting to {len(self.websocket_clients)} clients")
+            msg = json.dumps({"type": msg_type, **data})
+            await asyncio.gather(*[c.send(msg) for c in self.websocket_clients], return_exceptions=True)
+
+    async def attach(self, websocket, station_id=None):
+        """Subscribe a client to a room, creating the session on first use"""
+        current = self.client_sessions.get(websocket)
+        station_id = str(station_id) if station_id else (current.id if current else DEFAULT_STATION)
+        if current and current.id == station_id: return current
+        if current:
+            closed = self.detach(websocket)  # Last subscriber left the old room: stop its recording
+            if closed: await closed.stop()
+
+        session = self.sessions.get(station_id)
+        if session is None:
+            session = self.sessions[station_id] = RelaySession(station_id, self)
+            print(f"🏥 Session opened: {station_id} ({len(self.sessions)} active)")
+        session.subscribers.add(websocket)
+        self.client_sessions[websocket] = session
+        return session
+
+    def detach(self, websocket):
+        session = self.client_sessions.pop(websocket, None)
+        if session is None: return None
+        session.subscribers.discard(websocket)
+        if not session.subscribers:
+            self.sessions.pop(session.id, None)
+            print(f"🏥 Session closed: {session.id} ({len(self.sessions)} active)")
+            return session
+        return None
+
+    async def generate_treatment_plan(self, transcript, patient_name='환자', provider='openai', on_delta=None, refresh=False,
+                                      hedge_delay=None, on_reset=None):
+        """Returns (plan, provider that wrote it); on_delta(text, provider) is awaited per streamed chunk,
+        on_reset(provider) when the streaming provider failed and its preview should be discarded"""
+        key = plan_key(transcript, patient_name, provider, PLAN_PROMPT_VERSION)
+        cached = None if refresh else self.plan_cache.get(key)
+        if cached is not None:
+            print(f"🗃️ Plan cache hit ({provider}, {self.plan_cache.hits} hits / {self.plan_cache.misses} misses)")
+            if on_delta: await on_delta(cached, provider)
+            return cached, provider
 
-    async def generate_treatment_plan(self, transcript, patient_name='환자', provider='openai'):
         print(f"🧠 Generating Plan using {provider}...")
         
         prompt = f"""# Role
@@ -290,49 +401,117 @@ class ClovaRelayServer:
 다음 주 여행 가신다고 하셨는데, 무리하지 마시고 즐겁게 다녀오세요.
 """
         
-        if provider == 'gemini':
-            result = self._call_gemini(prompt)
-        elif provider == 'claude':
-            result = self._call_claude(prompt)
-        else:
-            result = self._call_openai(prompt)
-            
-        print(f"✅ Plan Generated ({len(result)} chars)")
-        return result
+        # Runs on the LLM pool
+        used = provider
+        try:
+            if provider == 'fastest':
+                result, used = await llm_clients.hedged_completion(
+                    prompt, on_delta, hedge_delay=llm_clients.HEDGE_DELAY if hedge_delay is None else hedge_delay,
+                    on_reset=on_reset)
+            else:
+                result = await llm_clients.stream_completion(
+                    provider, prompt, (lambda text: on_delta(text, provider)) if on_delta else None)
+        except llm_clients.LLMError as e:
+            result = f"❌ {e}"
+
+        print(f"✅ Plan Generated by {used} ({len(result)} chars)")
+        if result and not result.startswith("❌"):
+            await asyncio.to_thread(self.plan_cache.put, key, result)
+            if used != provider:
+                await asyncio.to_thread(self.plan_cache.put, plan_key(transcript, patient_name, used, PLAN_PROMPT_VERSION), result)
+        return result, used
+
+    async def send_treatment_plan(self, websocket, data):
+        transcript = data.get('transcript', '')
+        provider = data.get('provider', 'openai')
+        if data.get('log'):
+            # A logged recording (either relay) merged across speakers in spoken order, instead of client text
+            records = await asyncio.to_thread(self.transcript_log.tail, data['log'], int(data.get('limit', 500)))
+            transcript = format_conversation(merge_records(records)) or transcript
+
+        async def on_delta(text, source):
+            await websocket.send(json.dumps({'type': 'treatment_plan_delta', 'delta': text, 'provider': source}))
+
+        async def on_reset(source):
+            await websocket.send(json.dumps({'type': 'treatment_plan_reset', 'provider': source}))
+
+        try:
+            plan, used = await self.generate_treatment_plan(transcript, data.get('patient_name') or '환자', provider, on_delta,
+                                                            refresh=bool(data.get('refresh')),
+                                                            hedge_delay=data.get('hedge_delay'), on_reset=on_reset)
+            # In 'fastest' mode this is the winning provider; the final plan supersedes any deltas
+            await websocket.send(json.dumps({
+                'type': 'treatment_plan',
+                'plan': plan,
+                'provider': used
+            }))
+        except websockets.exceptions.ConnectionClosed: pass
 
     async def handle_client(self, websocket):
-        # Enforce single client: Clear existing clients to prevent duplicates
-        if self.websocket_clients:
-            print(f"⚠️ New client connected. Clearing {len(self.websocket_clients)} old clients.")
-            self.websocket_clients.clear()
-            
         self.websocket_clients.add(websocket)
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
         try:
             async for message in websocket:
                 if isinstance(message, bytes):
-                    if self.is_recording: self.audio_queue.put(message)
+                    session = self.client_sessions.get(websocket)
+                    if session and session.is_recording:
+                        metrics.record_audio(len(message))
+                        session.audio_queue.put(message)
                 else:
                     try:
                         data = json.loads(message)
                         cmd = data.get('command')
+                        station_id = data.get('station') or data.get('room')
                         
                         if cmd == 'start': 
-                            await self.start_recording(loop)
+                            await (await self.attach(websocket, station_id)).start(loop, data.get('mode'), data.get('record'))
                         elif cmd == 'stop': 
-                            await self.stop_recording()
+                            session = self.client_sessions.get(websocket)
+                            if session: await session.stop()
+                        elif cmd == 'join':
+                            await self.attach(websocket, station_id)
                         elif cmd == 'update_keywords':
-                            # Same keyword update logic
                             new_keywords = data.get('keywords', [])
                             if new_keywords:
-                                base_keywords = self.load_boostings()
-                                combined_words = []
-                                if base_keywords:
-                                    combined_words.extend(base_keywords[0]['words'].split(','))
-                                combined_words.extend(new_keywords)
-                                unique_words = list(set([w.strip() for w in combined_words if w.strip()]))
-                                self.boostings = [{"words": ",".join(unique_words[:1000])}] # Limit 1000
-                                print(f"📚 Updated boostings: {len(unique_words[:1000])}")
+                                (await self.attach(websocket, station_id)).update_keywords(new_keywords)
+                        elif cmd in ('add_keywords', 'remove_keywords'):
+                            (await self.attach(websocket, station_id)).update_keywords(data.get('keywords', []), cmd.split('_')[0])
+                        elif cmd == 'get_sessions':
+                            await websocket.send(json.dumps({'type': 'sessions', 'sessions': {
+                                sid: {'recording': s.is_recording, 'mode': s.mode, 'clients': len(s.subscribers)}
+                                for sid, s in self.sessions.items()
+                            }}))
+                        elif cmd == 'get_timing':
+                            await websocket.send(json.dumps({'type': 'timing', 'speakers': {
+                                sid: t.snapshot() for sid, t in self.timing.items()
+                            }}))
+                        elif cmd == 'get_upload_stats':
+                            await websocket.send(json.dumps({
+                                'type': 'upload_stats', **self.uploader.stats(), 'encoding': self.encoder.stats(),
+                                **self.spool.stats()
+                            }))
+                        elif cmd == 'get_llm_stats':
+                            await websocket.send(json.dumps({
+                                'type': 'llm_stats', 'preferred': llm_clients.preferred_order(),
+                                'providers': llm_clients.latency_stats()
+                            }))
+                        elif cmd == 'get_transcript_log':
+                            # Recover a consultation after a tab close or relay restart
+                            # The station's newest log: the live session's once it has a line, else the
+                            # previous one (the session itself is closed when its last client leaves)
+                            name = data.get('log') or await asyncio.to_thread(self.transcript_log.latest,
+                                                                              station_id or DEFAULT_STATION)
+                            records = await asyncio.to_thread(self.transcript_log.tail, name, int(data.get('limit', 200))) if name else []
+                            records.sort(key=lambda r: r.get('seq', 0))  # Recovered lines are appended late
+                            records = SeamStitcher().apply_all(records)
+                            await websocket.send(json.dumps({
+                                'type': 'transcript_log', 'log': name, 'records': records,
+                                'logs': await asyncio.to_thread(self.transcript_log.sessions)
+                            }))
+                        elif cmd == 'get_metrics':
+                            await websocket.send(json.dumps({'type': 'metrics', 'metrics': metrics.REGISTRY.snapshot()}))
+                        elif cmd == 'get_plan_cache_stats':
+                            await websocket.send(json.dumps({'type': 'plan_cache_stats', **self.plan_cache.stats()}))
                         elif cmd == 'get_corrections':
                             await self.broadcast('corrections', {'data': self.corrections})
                         elif cmd == 'save_corrections':
@@ -340,22 +519,24 @@ class ClovaRelayServer:
                             self.save_corrections(new_corrections)
                             await self.broadcast('corrections', {'data': self.corrections})
                         elif cmd == 'generate_treatment_plan':
-                            transcript = data.get('transcript', '')
-                            provider = data.get('provider', 'openai')
-                            plan = await self.generate_treatment_plan(transcript, provider)
-                            await websocket.send(json.dumps({
-                                'type': 'treatment_plan',
-                                'plan': plan,
-                                'provider': provider
-                            }))
+                            # Own task so this client's audio keeps flowing while the plan streams
+                            asyncio.create_task(self.send_treatment_plan(websocket, data))
                     except json.JSONDecodeError:
                         pass
         except: pass
-        finally: self.websocket_clients.discard(websocket)
+        finally:
+            self.websocket_clients.discard(websocket)
+            closed = self.detach(websocket)
+            if closed: await closed.stop()
 
     async def run(self):
+        # Open upload connections before the first segment arrives
+        await asyncio.to_thread(self.uploader.start)
+        self.transcript_log.start()
+        self.spool.start()
+        metrics.serve_http()
         async with serve(self.handle_client, "localhost", 3001):
-            print(f"🚀 Clova Relay (Mono Mode)")
+            print(f"🚀 Clova Relay (Mono Mode, multi-session, {UPLOAD_WORKERS} upload workers, {self.encoder.codec})")
             await asyncio.Future()
 
 if __name__ == "__main__":
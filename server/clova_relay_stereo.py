@@ -1,203 +1,320 @@
-import os, asyncio, json, queue, threading, time, struct, requests, numpy as np
+import os, asyncio, itertools, json, queue, time
 from dotenv import load_dotenv
 from websockets.server import serve
+from upload_dispatcher import UploadDispatcher
+from audio_codec import SegmentEncoder
+from reorder_buffer import OrderedDelivery
+from segmenter import VoiceSegmenter
+from channel_dsp import FrameRouter
+from pipeline import Pipeline, QueueSource, TapStage, SplitStage, RouteStage, Fanout, SegmentStage, StreamStage
+from stitcher import SeamStitcher
+from timeline import TimelineMerger, span_fields, merge_records, format_conversation
+from adaptive_timing import AdaptiveTiming, ADAPTIVE_TIMING
+from grpc_stream import StreamingRecognizer
+from boosting_store import BoostingFile, BoostingStore
+from transcript_log import TranscriptLog, log_name
+from session_recorder import SessionRecorder, recording_name, RECORD_AUDIO
+from resilience import post_with_retry, RETRYABLE_STATUS, TRANSIENT_ERRORS, CircuitOpenError
+from relay_spool import RelaySpool
+import metrics
 
 load_dotenv()
 
-# Clova Speech API Info
-INVOKE_URL = "https://clovaspeech-gw.ncloud.com/external/v1/13590/4a8afe9a7aa788833f0e7ffeca45f57e94e549ac92209e374650cbe2119c885a"
-SECRET_KEY = "65132a9940b14133989e7e325e8c2518"
+# Clova Speech API Info (CLOVA_UPLOAD_URL overrides, e.g. to point at mock_clova.py)
+INVOKE_URL = os.getenv('CLOVA_UPLOAD_URL', "https://clovaspeech-gw.ncloud.com/external/v1/13590/4a8afe9a7aa788833f0e7ffeca45f57e94e549ac92209e374650cbe2119c885a")
+SECRET_KEY = os.getenv('CLOVA_UPLOAD_SECRET', "65132a9940b14133989e7e325e8c2518")
 
 # [Settings]
 DIGITAL_GAIN = 30.0     # High gain to pick up whispers
 VAD_THRESHOLD = 500     # Low threshold (since we rely on Ratio)
 DOMINANCE_RATIO = 1.05  # Extreme Winner-Takes-All (1.05x louder wins)
-SILENCE_TIMEOUT = 1.0   # Send after 1s silence
-MAX_DURATION = 10.0     # Force send every 10s
-
-def create_wav_header(data_length, sample_rate=16000, channels=1, bits_per_sample=16):
-    file_length = data_length + 36
-    return struct.pack(
-        '\u003c4sI4s4sIHHIIHH4sI',
-        b'RIFF', file_length, b'WAVE',
-        b'fmt ', 16, 1, 1, 16000, 32000, 2, 16, b'data', data_length
-    )
-
-def calculate_rms(audio_data):
-    if not audio_data: return 0
-    try:
-        arr = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32)
-        return np.sqrt(np.mean(arr**2))
-    except: return 0
+FRAME_ROUTING = 1       # 1 = decide per 20 ms frame (FrameRouter), 0 = once per message
+SWITCH_RATIO = 1.4      # Frame routing hysteresis: the other channel must be this much louder to take over
+SILENCE_TIMEOUT = 1.0   # Send after 1s silence (measured in samples)
+MAX_DURATION = 10.0     # Force send every 10s of audio
+FORCE_OVERLAP = 0.8     # Seconds repeated at the start of the segment after a forced cut (words dropped by stitcher.py)
+CUT_SEARCH = 0.5        # Forced cuts land on the quietest frame within this many seconds before the limit
+PRE_ROLL = 0.3          # Seconds of audio before the first voiced frame kept at the start of each segment
+# Both are starting values; with CLOVA_ADAPTIVE_TIMING=1 (default) each channel learns its own (adaptive_timing.py)
+REORDER_MAX_HOLD = 3.0  # Max seconds a finished line waits for an earlier, slower upload
+TIMELINE_MAX_HOLD = float(os.getenv('CLOVA_TIMELINE_MAX_HOLD', 4.0))  # Max seconds a line waits for an earlier-spoken one on another channel
+SAMPLE_RATE = 16000
+# Inputs on the audio interface (interleaved Int16) and the speaker label of each;
+# the frontend maps 'Left'/'Right' to roles, multi-bed boxes name their inputs (e.g. CLOVA_CHANNEL_LABELS=Bed1,Bed2,Bed3,Bed4)
+CHANNELS = int(os.getenv('CLOVA_CHANNELS', 2))
+CHANNEL_LABELS = os.getenv('CLOVA_CHANNEL_LABELS', 'Left,Right' if CHANNELS == 2 else '')
+RECOGNIZER_MODE = os.getenv('CLOVA_RELAY_MODE', 'upload')  # 'upload' segments or 'stream' via gRPC
+UPLOAD_WORKERS = int(os.getenv('CLOVA_UPLOAD_WORKERS', 4))    # Max concurrent uploads
+UPLOAD_QUEUE_SIZE = int(os.getenv('CLOVA_UPLOAD_QUEUE', 64))  # Segments allowed to wait
+UPLOAD_CODEC = os.getenv('CLOVA_UPLOAD_CODEC', 'wav')         # 'wav' or 'flac' (lossless, smaller)
+UPLOAD_ATTEMPTS = int(os.getenv('CLOVA_UPLOAD_ATTEMPTS', 3))  # Tries per segment (jittered backoff) before spooling
+
+def channel_labels(labels=None, count=None):
+    """One unique label per input: given labels first, then Ch<n> for the rest"""
+    if isinstance(labels, str): labels = [l.strip() for l in labels.split(',') if l.strip()]
+    labels = list(labels or [])
+    count = count or len(labels) or CHANNELS
+    labels = labels[:count] + [f"Ch{c + 1}" for c in range(len(labels), count)]
+    if len(set(labels)) != len(labels): raise ValueError(f"Duplicate channel labels: {labels}")
+    return labels
 
 class ChannelProcessor:
     """Manages buffer and sending for a single channel"""
     def __init__(self, name, server):
-        self.name = name # 'Left' or 'Right' (Mapped to '치료실', '원장님' in frontend)
+        self.name = name # Channel label, e.g. 'Left' or 'Right' (Mapped to '치료실', '원장님' in frontend)
         self.server = server
-        self.buffer = bytearray()
-        self.last_input_time = time.time()
-        self.last_send_time = time.time()
+        # Segments are cut on this channel's sample clock; the timing object outlives the recording
+        self.segmenter = VoiceSegmenter(VAD_THRESHOLD, SILENCE_TIMEOUT, MAX_DURATION, timing=server.timing_for(name),
+                                        overlap_ms=int(FORCE_OVERLAP * 1000), cut_search_ms=int(CUT_SEARCH * 1000),
+                                        preroll_ms=int(PRE_ROLL * 1000))
+        self.last_sent = None  # (seq, end_sample) of the previous segment, to link overlapped continuations
+        self.partial_start = None  # Stream mode: start of the utterance Clova is still recognizing
+        self.recognizer = None
+        self.log_name = server.log_name  # Late uploads still land in this recording's log
 
-    def add_data(self, data, loop):
-        if not data: return
-        
-        self.buffer.extend(data)
-        self.last_input_time = time.time()
-        
-        # Check force send conditions
-        time_since_send = time.time() - self.last_send_time
-        if len(self.buffer) > 320000 or time_since_send > MAX_DURATION: # 20s or max duration
-            print(f"⚡ [{self.name}] Force Send")
-            self.send(loop)
-
-    def check_silence(self, loop):
-        # Send if we have data and it's been silent for a while
-        if len(self.buffer) > 0 and (time.time() - self.last_input_time > SILENCE_TIMEOUT):
-            # print(f"✨ [{self.name}] Silence Send")
-            self.send(loop)
-
-    def send(self, loop):
-        if len(self.buffer) < 4000: # Ignore very short chunks (< 0.25s)
-            self.buffer = bytearray()
+    def log_line(self, seq, text, start_sample, end_sample, **seam):
+        # Unstitched text plus the seam fields, so readers can stitch the log the same way
+        self.server.transcript_log.append(self.log_name, {
+            'seq': seq, 'speaker': self.name, 'start_sample': start_sample, 'end_sample': end_sample,
+            'raw': text, 'text': text, **seam
+        })
+
+    def spool(self, audio_data, seq, span, seam):
+        """Keep the audio on disk; the spool drainer delivers the line late under its original seq"""
+        self.server.spool.put(audio_data, {
+            'log': self.log_name, 'seq': seq, 'speaker': self.name, 'start_sample': span[0], 'end_sample': span[1],
+            'params': self.server.boostings.params_json(), **seam
+        })
+
+    def start_stream(self, delivery):
+        """Stream mode: this channel feeds a long-lived gRPC recognize stream"""
+        def on_result(text, is_final, start_sample, end_sample):
+            payload = {'text': text, 'speaker': self.name, **span_fields(start_sample, end_sample)}
+            self.partial_start = None if is_final else start_sample
+            if is_final:
+                payload['seq'] = seq = self.server.next_seq()
+                print(f"📝 [{self.name}] #{seq}: {text}")
+                self.log_line(seq, text, start_sample, end_sample)
+                delivery.submit_threadsafe(seq, payload)
+            else:
+                delivery.send_unordered_threadsafe(lambda p: self.server.broadcast('transcript_partial', p), payload)
+
+        self.recognizer = StreamingRecognizer(self.name, self.server.boostings.boostings(), on_result)
+        self.recognizer.start()
+
+    def horizon(self):
+        """Earliest session sample a line of this channel not yet sent for recognition can start at"""
+        if self.recognizer:
+            return self.partial_start if self.partial_start is not None else self.recognizer.samples_fed
+        return self.segmenter.horizon()
+
+    def send(self, segment):
+        if segment.speech_samples < 2000: # Ignore < 0.125s of speech (pre-roll not counted)
+            print(f"🔇 [{self.name}] Dropped {segment.duration:.2f}s segment with {segment.speech_samples / SAMPLE_RATE:.2f}s speech")
             return
 
-        current_buffer = self.buffer[:]
-        self.buffer = bytearray()
-        self.last_send_time = time.time()
+        metrics.SEGMENT_SECONDS.observe(segment.duration, reason=segment.reason, channel=self.name)
+        if segment.reason == 'force': print(f"⚡ [{self.name}] Force Send")
+        span = (segment.start_sample, segment.end_sample)  # Session samples
 
-        # Send in a separate thread to avoid blocking the audio loop
-        threading.Thread(target=self._send_request, args=(current_buffer, loop)).start()
+        # Hand off to the shared upload pool to avoid blocking the audio loop
+        seq, delivery, timeline = self.server.next_seq(), self.server.delivery, self.server.timeline
+        # Continuation of a forced cut: its head repeats the previous segment's tail
+        seam = {}
+        if segment.overlap_samples and self.last_sent and self.last_sent[1] > segment.start_sample:
+            seam = {'continues': self.last_sent[0], 'overlap': round(segment.overlap, 3)}
+        self.last_sent = (seq, segment.end_sample)
+        timeline.expect(self.name, seq, segment.start_sample)  # Holds later-starting lines of other channels
+        if not self.server.uploader.submit(self._send_request, segment.audio, seq, span, delivery, timeline, seam, key=self.name):
+            timeline.settle(self.name, seq)
+            delivery.submit_threadsafe(seq, None)
 
-    def _send_request(self, audio_data, loop):
+    def _send_request(self, http, audio_data, seq, span, delivery, timeline, seam):
+        result = None
+        outcome, sent_at = 'exception', time.perf_counter()
         try:
             url = f"{INVOKE_URL}/recognizer/upload"
             headers = {'X-CLOVASPEECH-API-KEY': SECRET_KEY}
-            params = {
-                'language': 'ko-KR',
-                'completion': 'sync',
-                'boostings': self.server.boostings
-            }
-            wav = create_wav_header(len(audio_data)) + audio_data
+            media, filename, mime = self.server.encoder.encode(audio_data)
             files = {
-                'media': ('speech.wav', wav, 'audio/wav'),
-                'params': (None, json.dumps(params), 'application/json')
+                'media': (filename, media, mime),
+                'params': (None, self.server.boostings.params_json(), 'application/json')
             }
             
             # print(f"📤 [{self.name}] Sending {len(audio_data)} bytes...")
-            res = requests.post(url, headers=headers, files=files, timeout=10)
+            sent_at = time.perf_counter()
+            res = post_with_retry(http, url, self.server.spool.breaker, UPLOAD_ATTEMPTS, headers=headers, files=files, timeout=10)
+            outcome = 'http_error'
             
             if res.status_code == 200:
                 text = res.json().get('text', '')
+                outcome = 'ok' if text else 'empty'
                 if text:
-                    print(f"📝 [{self.name}]: {text}")
-                    # Broadcast to frontend
+                    print(f"📝 [{self.name}] #{seq}: {text}")
+                    self.log_line(seq, text, span[0], span[1], **seam)
+                    # Broadcast to frontend (in seq order, via the reorder stage)
                     # Note: Frontend expects 'Left' or 'Right' as speaker to map to roles
-                    asyncio.run_coroutine_threadsafe(
-                        self.server.broadcast('transcript', {'text': text, 'speaker': self.name}), loop
-                    )
+                    result = {'text': text, 'speaker': self.name, 'seq': seq, **span_fields(*span), **seam}
+            else:
+                print(f"❌ [{self.name}] API Error {res.status_code}: {res.text}")
+                if res.status_code in RETRYABLE_STATUS: self.spool(audio_data, seq, span, seam)
+        except CircuitOpenError:
+            outcome = 'circuit_open'
+            self.spool(audio_data, seq, span, seam)
         except Exception as e:
             print(f"❌ [{self.name}] Error: {e}")
+            if isinstance(e, TRANSIENT_ERRORS): self.spool(audio_data, seq, span, seam)
+        finally:
+            if outcome != 'circuit_open':
+                metrics.record_upload(len(audio_data) / (2 * SAMPLE_RATE), time.perf_counter() - sent_at, outcome)
+            if result is None: timeline.settle(self.name, seq)  # No line coming (a spooled one arrives late)
+            delivery.submit_threadsafe(seq, result)
 
 class ClovaRelayServer:
     def __init__(self):
         self.websocket_clients = set()
         self.is_recording = False
         self.audio_queue = queue.Queue()
-        self.worker_thread = None
-        self.boostings = self.load_boostings()
+        self.pipeline = None
+        # Full boostings.txt list (no cap); params JSON built once per change
+        self.boostings = BoostingStore(BoostingFile(), None, {'language': 'ko-KR', 'completion': 'sync'})
+        self.uploader = UploadDispatcher(INVOKE_URL, UPLOAD_WORKERS, UPLOAD_QUEUE_SIZE, name="clova-upload")
+        self.encoder = SegmentEncoder(UPLOAD_CODEC)
         
-        # Processors for Left (Director) and Right (Treatment Room)
-        self.proc_left = None
-        self.proc_right = None
+        # One processor per input, in interleaving order (default: Left = Director, Right = Treatment Room)
+        self.labels = channel_labels(CHANNEL_LABELS, CHANNELS)
+        self.processors = []
 
-    def load_boostings(self):
-        boostings = []
-        try:
-            boosting_file = os.path.join(os.path.dirname(__file__), 'boostings.txt')
-            if os.path.exists(boosting_file):
-                words = [line.strip() for line in open(boosting_file, 'r', encoding='utf-8') if line.strip()]
-                if words: boostings.append({"words": ",".join(words)})
-                print(f"📚 {len(words)} keywords")
-        except Exception as e: print(f"⚠️ {e}")
-        return boostings
+        # Session-scoped transcript ordering (reset on each start)
+        self.seq_counter = itertools.count()
+        self.delivery = None
+        self.mode = RECOGNIZER_MODE
+        self.transcript_log = TranscriptLog()
+        self.log_name = log_name('stereo')
+        self.spool = RelaySpool('stereo', INVOKE_URL, SECRET_KEY, self.encoder, self.transcript_log,
+                                delivery_for=lambda meta: self.delivery if meta['log'] == self.log_name else None)
+        self.recorder = None  # Optional raw audio archive (one WAV per channel)
+        self.timing = {}      # Channel name -> AdaptiveTiming, kept across recordings
+        self.stitcher = SeamStitcher()
+        self.router = None    # FrameRouter of the current recording
+        self.timeline = None  # TimelineMerger of the current recording
+        metrics.REGISTRY.gauge('relay_audio_queue_depth', 'Audio buffers waiting for the worker', self.audio_queue.qsize)
+        metrics.REGISTRY.gauge('clova_upload_pending', 'Segments waiting for an upload worker',
+                               lambda: self.uploader.stats()['pending'])
+        metrics.REGISTRY.gauge('relay_silence_timeout_seconds', 'Current (learned) silence timeout per speaker', lambda: {
+            (('speaker', name),): t.silence_timeout for name, t in list(self.timing.items())
+        })
+        metrics.REGISTRY.gauge('relay_max_duration_seconds', 'Current (learned) forced-cut length per speaker', lambda: {
+            (('speaker', name),): t.max_duration for name, t in list(self.timing.items())
+        })
+        metrics.REGISTRY.gauge('relay_routing_saved_seconds',
+                               'Voiced audio per-message routing would have sent that frame routing withheld (this recording)',
+                               lambda: self.routing_samples('saved_seconds'))
+        metrics.REGISTRY.gauge('relay_routing_muted_seconds', 'Voiced audio withheld as crosstalk (this recording)',
+                               lambda: self.routing_samples('muted_seconds'))
+
+    def next_seq(self):
+        return next(self.seq_counter)
+
+    def routing_stats(self):
+        return self.router.stats(self.labels) if self.router else None
+
+    def routing_samples(self, key):
+        stats = self.routing_stats()
+        return {(('channel', name),): value for name, value in stats[key].items()} if stats else {}
+
+    def timing_for(self, name):
+        """Learned timing for a channel; starts over if the configured defaults changed"""
+        timing = self.timing.get(name)
+        if timing is None or (timing.default_silence, timing.default_max, timing.enabled) != (
+                SILENCE_TIMEOUT, MAX_DURATION, bool(ADAPTIVE_TIMING)):
+            timing = self.timing[name] = AdaptiveTiming(name, SILENCE_TIMEOUT, MAX_DURATION, bool(ADAPTIVE_TIMING))
+        return timing
 
     async def broadcast(self, msg_type, data):
         if self.websocket_clients:
             msg = json.dumps({"type": msg_type, **data})
+            start = time.perf_counter()
             await asyncio.gather(*[c.send(msg) for c in self.websocket_clients], return_exceptions=True)
+            metrics.BROADCAST_SECONDS.observe(time.perf_counter() - start, type=msg_type)
 
-    def main_worker(self, loop):
-        print("🎧 Stereo Separation Started (Winner Takes All)")
-        last_log = 0
-        
-        while self.is_recording:
-            try:
-                # 1. Get Chunk
-                chunk = self.audio_queue.get(timeout=0.1)
-                
-                # 2. Deinterleave & Gain
-                try:
-                    arr = np.frombuffer(chunk, dtype=np.int16)
-                    # Apply Gain and Clip
-                    arr = np.clip(arr * DIGITAL_GAIN, -32768, 32767).astype(np.int16)
-                    
-                    # Even: Left, Odd: Right
-                    left_raw = arr[0::2].tobytes()
-                    right_raw = arr[1::2].tobytes()
-                    
-                    # RMS Calc
-                    rms_l = calculate_rms(left_raw)
-                    rms_r = calculate_rms(right_raw)
-                    
-                    if time.time() - last_log > 1.0:
-                         print(f"MIC L:{rms_l:.0f} R:{rms_r:.0f}")
-                         last_log = time.time()
-
-                    # 3. Winner Takes All Logic
-                    # If both are quiet, ignore (Noise Gate)
-                    if rms_l < VAD_THRESHOLD and rms_r < VAD_THRESHOLD:
-                        pass 
-                    
-                    # Left is dominant (1.2x louder) -> Left wins
-                    elif rms_l > rms_r * DOMINANCE_RATIO:
-                        self.proc_left.add_data(left_raw, loop)
-                        
-                    # Right is dominant (1.2x louder) -> Right wins
-                    elif rms_r > rms_l * DOMINANCE_RATIO:
-                        self.proc_right.add_data(right_raw, loop)
-                        
-                    # Similar volume -> Allow both (Independent speech or ambiguous)
-                    else:
-                        self.proc_left.add_data(left_raw, loop)
-                        self.proc_right.add_data(right_raw, loop)
-                        
-                except Exception as e:
-                    print(f"⚠️ Process Error: {e}")
-
-            except queue.Empty:
-                # Check silence timeouts when no data
-                if self.proc_left: self.proc_left.check_silence(loop)
-                if self.proc_right: self.proc_right.check_silence(loop)
-                continue
-
-    async def start_recording(self, loop):
+    async def deliver(self, payload, timeline=None):
+        """Ordered final lines: drop words repeated across forced-cut seams, then broadcast and merge"""
+        line = self.stitcher.apply(payload)
+        if line: await self.broadcast('transcript', line)
+        if timeline:
+            if line: timeline.push(line)
+            else: timeline.settle(payload.get('speaker'), payload.get('seq'))
+
+    async def deliver_conversation(self, line):
+        """Merged timeline: every channel's lines in the order they were spoken"""
+        await self.broadcast('conversation', line)
+
+    def build_pipeline(self):
+        """queue -> [recorder] -> split -> meter -> route -> per channel: segmenter + upload, or gRPC stream"""
+        split = SplitStage(len(self.processors), DIGITAL_GAIN)
+        self.router = FrameRouter(len(self.processors), VAD_THRESHOLD, DOMINANCE_RATIO, SWITCH_RATIO, SAMPLE_RATE) if FRAME_ROUTING else None
+        last_log = [0]
+
+        def log_levels(frame):
+            if time.time() - last_log[0] > 1.0:
+                print("MIC " + " ".join(f"{p.name}:{r:.0f}" for p, r in zip(self.processors, frame.rms)))
+                last_log[0] = time.time()
+
+        stages = []
+        if self.recorder: stages.append(TapStage('record', lambda frame: self.recorder.write(frame.pcm)))  # Pre-gain
+        stages += [split, TapStage('meter', log_levels),
+                   # Losing channels get digital silence: the sample clock stays continuous and
+                   # pauses/end-pointing still see the gap, without transcribing crosstalk
+                   RouteStage(split, self.router, VAD_THRESHOLD, DOMINANCE_RATIO)]
+        stages.append(Fanout([
+            (proc.name, c, [StreamStage(proc.recognizer)] if self.mode == 'stream'
+             else [SegmentStage(proc.segmenter, proc.send, SILENCE_TIMEOUT)])
+            for c, proc in enumerate(self.processors)
+        ]))
+        return Pipeline(f"stereo:{len(self.processors)}ch", QueueSource(self.audio_queue, len(self.processors)), stages)
+
+    async def start_recording(self, loop, mode=None, record=None, labels=None):
         if self.is_recording: return
+        # Initialize Processors
+        # Default labels 'Left' and 'Right' match frontend expectations; a client may send its own (one per input).
+        # The capture side always interleaves CHANNELS inputs, so any other count would split the audio wrongly
+        if labels:
+            labels = channel_labels(labels)
+            if len(labels) != CHANNELS: raise ValueError(f"{len(labels)} channel labels for {CHANNELS} input channels")
+            self.labels = labels
         self.is_recording = True
         while not self.audio_queue.empty(): self.audio_queue.get()
+        self.log_name = log_name('stereo')  # One log per recording
+        self.processors = [ChannelProcessor(label, self) for label in self.labels]
+        self.seq_counter = itertools.count()
+        self.stitcher = SeamStitcher()
+        # Channels share the recording's sample clock (sample 0 = first sample after start); lines are merged on it
+        timeline = self.timeline = TimelineMerger(loop, self.deliver_conversation,
+                                                  {proc.name: proc.horizon for proc in self.processors}, TIMELINE_MAX_HOLD)
+        self.delivery = OrderedDelivery(loop, lambda payload: self.deliver(payload, timeline), REORDER_MAX_HOLD)
+        if mode in ('upload', 'stream'): self.mode = mode
+        if self.mode == 'stream':
+            for proc in self.processors: proc.start_stream(self.delivery)
+        if RECORD_AUDIO if record is None else record:
+            self.recorder = SessionRecorder(recording_name('stereo'), tuple(self.labels))
+            await asyncio.to_thread(self.recorder.start)
         
-        # Initialize Processors
-        # Name them 'Left' and 'Right' to match frontend expectations
-        self.proc_left = ChannelProcessor("Left", self)
-        self.proc_right = ChannelProcessor("Right", self)
-        
-        self.worker_thread = threading.Thread(target=self.main_worker, args=(loop,), daemon=True)
-        self.worker_thread.start()
-        print("✅ Recording Started")
+        # Segments and streams per channel; buffers received before stop are still routed, then the last utterances close
+        self.pipeline = self.build_pipeline()
+        self.pipeline.start()
+        print(f"✅ Recording Started ({', '.join(self.labels)})")
 
     async def stop_recording(self):
         self.is_recording = False
-        if self.worker_thread: self.worker_thread.join(timeout=1)
+        if self.pipeline: await asyncio.to_thread(self.pipeline.stop, 1)
+        if self.recorder:
+            await asyncio.to_thread(self.recorder.close)
+            self.recorder = None
+        for proc in self.processors:
+            if proc.recognizer:
+                await asyncio.to_thread(proc.recognizer.close)
+                proc.recognizer = None
         print("✅ Recording Stopped")
 
     async def handle_client(self, websocket):
@@ -206,17 +323,65 @@ class ClovaRelayServer:
         try:
             async for message in websocket:
                 if isinstance(message, bytes):
-                    if self.is_recording: self.audio_queue.put(message)
+                    if self.is_recording:
+                        metrics.record_audio(len(message), channels=len(self.processors))
+                        self.audio_queue.put(message)
                 else:
-                    cmd = json.loads(message).get('command')
-                    if cmd == 'start': await self.start_recording(loop)
+                    data = json.loads(message)
+                    cmd = data.get('command')
+                    if cmd == 'start':
+                        try: await self.start_recording(loop, data.get('mode'), data.get('record'), data.get('labels'))
+                        except ValueError as e:
+                            print(f"⚠️ Start rejected: {e}")
+                            await websocket.send(json.dumps({'type': 'error', 'message': str(e)}))
                     elif cmd == 'stop': await self.stop_recording()
+                    elif cmd in ('update_keywords', 'add_keywords', 'remove_keywords'):
+                        words = data.get('keywords', [])
+                        if cmd == 'add_keywords': self.boostings.add(words)
+                        elif cmd == 'remove_keywords': self.boostings.remove(words)
+                        elif words: self.boostings.set_extra(words)
+                        print(f"📚 Updated boostings: {self.boostings.word_count()} (v{self.boostings.version})")
+                    elif cmd == 'get_transcript_log':
+                        name = data.get('log') or self.log_name
+                        records = await asyncio.to_thread(self.transcript_log.tail, name, int(data.get('limit', 200)))
+                        records.sort(key=lambda r: r.get('seq', 0))  # Recovered lines are appended late
+                        records = SeamStitcher().apply_all(records)
+                        await websocket.send(json.dumps({
+                            'type': 'transcript_log', 'log': name, 'records': records,
+                            'logs': await asyncio.to_thread(self.transcript_log.sessions)
+                        }))
+                    elif cmd == 'get_conversation':
+                        # One recording's lines across channels in spoken order, plus the text for plan generation
+                        name = data.get('log') or self.log_name
+                        records = await asyncio.to_thread(self.transcript_log.tail, name, int(data.get('limit', 500)))
+                        lines = merge_records(records)
+                        await websocket.send(json.dumps({
+                            'type': 'conversation_log', 'log': name, 'sample_rate': SAMPLE_RATE, 'lines': lines,
+                            'transcript': format_conversation(lines)
+                        }))
+                    elif cmd == 'get_metrics':
+                        await websocket.send(json.dumps({'type': 'metrics', 'metrics': metrics.REGISTRY.snapshot()}))
+                    elif cmd == 'get_timing':
+                        await websocket.send(json.dumps({'type': 'timing', 'speakers': {
+                            name: t.snapshot() for name, t in self.timing.items()
+                        }}))
+                    elif cmd == 'get_upload_stats':
+                        await websocket.send(json.dumps({
+                            'type': 'upload_stats', **self.uploader.stats(), 'encoding': self.encoder.stats(),
+                            **self.spool.stats(), 'routing': self.routing_stats(),
+                            'timeline': self.timeline.stats() if self.timeline else None
+                        }))
         except: pass
         finally: self.websocket_clients.discard(websocket)
 
     async def run(self):
+        # Open upload connections before the first segment arrives
+        await asyncio.to_thread(self.uploader.start)
+        self.transcript_log.start()
+        self.spool.start()
+        metrics.serve_http()
         async with serve(self.handle_client, "localhost", 3001):
-            print(f"🚀 Clova Relay (Gain:{DIGITAL_GAIN}, Ratio:{DOMINANCE_RATIO})")
+            print(f"🚀 Clova Relay (Gain:{DIGITAL_GAIN}, Ratio:{DOMINANCE_RATIO}, Channels:{','.join(self.labels)}, Routing:{'frame' if FRAME_ROUTING else 'message'}, Codec:{self.encoder.codec})")
             await asyncio.Future()
 
 if __name__ == "__main__":
@@ -3,37 +3,35 @@
 """
 Naver Clova Speech Recognition Bridge
 Captures stereo microphone input, separates channels, and streams to Naver Clova gRPC API
+(pipeline.py: PyAudio -> split -> meter -> per speaker: VAD gate -> gRPC stream;
+clova_voice_prod.py is another configuration of the same bridge)
 """
 
-import os
 import asyncio
 import json
-import numpy as np
-import pyaudio
-import grpc
+import time
 from dotenv import load_dotenv
 import websockets
 from websockets.server import serve
 
-# Import generated gRPC code
-import nest_pb2
-import nest_pb2_grpc
+from grpc_stream import StreamingRecognizer, CLOVA_API_URL, CLOVA_SECRET
+from pipeline import Pipeline, PyAudioSource, SplitStage, TapStage, GateStage, Fanout, StreamStage
+import metrics
 
 # Load environment variables
 load_dotenv()
 
-CLOVA_API_URL = os.getenv('CLOVA_SPEECH_INVOKE_URL', 'clovaspeech-gw.ncloud.com:50051')
-CLOVA_SECRET = os.getenv('CLOVA_SPEECH_SECRET')
-
 # Audio settings
 SAMPLE_RATE = 16000
 CHANNELS = 2
 CHUNK_SIZE = 1024  # Samples per channel
-FORMAT = pyaudio.paInt16
+DEVICE_INDEX = None  # Default input device
 
 # VAD settings (simple volume-based)
-VAD_THRESHOLD = 500  # RMS threshold for speech detection
-SILENCE_DURATION = 1.5  # seconds of silence before stopping
+VAD_THRESHOLD = 500  # RMS threshold for speech detection; quieter buffers are not streamed
+
+# Speaker per input channel: left = Doctor, right = Nurse
+SPEAKERS = (('Doctor', 0), ('Nurse', 1))
 
 # Medical keywords for boosting
 MEDICAL_KEYWORDS = [
@@ -46,219 +44,151 @@ MEDICAL_KEYWORDS = [
 
 
 class VoiceRecognitionBridge:
-    def __init__(self):
-        self.audio = pyaudio.PyAudio()
-        self.stream = None
+    def __init__(self, channels=CHANNELS, speakers=SPEAKERS, device=DEVICE_INDEX, chunk_size=CHUNK_SIZE,
+                 vad_threshold=VAD_THRESHOLD, title="Voice Recognition Bridge"):
+        self.channels = channels
+        self.speakers = speakers
+        self.vad_threshold = vad_threshold  # 0 = stream everything, silence included
+        self.title = title
+        self.source = PyAudioSource(channels, chunk_size, device)
+        self.pipeline = None
+        self.recognizers = {}
         self.is_recording = False
         self.websocket_clients = set()
-        
-        # gRPC streams for left (Doctor) and right (Nurse)
-        self.grpc_streams = {'Doctor': None, 'Nurse': None}
-        
-    def calculate_rms(self, audio_data):
-        """Calculate RMS (Root Mean Square) volume"""
-        arr = np.frombuffer(audio_data, dtype=np.int16)
-        return np.sqrt(np.mean(arr**2))
-    
-    def simple_vad(self, audio_data):
-        """Simple volume-based VAD"""
-        rms = self.calculate_rms(audio_data)
-        return rms > VAD_THRESHOLD
-    
-    def separate_stereo(self, stereo_data):
-        """Separate stereo audio into left and right channels"""
-        arr = np.frombuffer(stereo_data, dtype=np.int16)
-        stereo = arr.reshape(-1, 2)
-        left = stereo[:, 0].tobytes()
-        right = stereo[:, 1].tobytes()
-        return left, right
-    
+        self.event_loop = None
+
+        metrics.REGISTRY.gauge('relay_audio_queue_depth', 'Audio buffers waiting for the pipeline',
+                               self.source.queue.qsize)
+
     async def broadcast_to_clients(self, message):
         """Send message to all connected WebSocket clients"""
         if self.websocket_clients:
+            start = time.perf_counter()
             await asyncio.gather(
                 *[client.send(json.dumps(message)) for client in self.websocket_clients],
                 return_exceptions=True
             )
-    
-    def create_grpc_channel(self):
-        """Create authenticated gRPC channel"""
-        credentials = grpc.ssl_channel_credentials()
-        channel = grpc.secure_channel(CLOVA_API_URL, credentials)
-        
-        # Create metadata with authorization
-        metadata = [('authorization', f'Bearer {CLOVA_SECRET}')]
-        
-        return channel, metadata
-    
-    async def grpc_stream_handler(self, speaker):
-        """Handle gRPC streaming for one speaker (Doctor or Nurse)"""
-        try:
-            channel, metadata = self.create_grpc_channel()
-            stub = nest_pb2_grpc.NestServiceStub(channel)
-            
-            # Create config
-            config = {
-                'language': 'ko-KR',
-                'completion': 'sync',
-                'boostings': MEDICAL_KEYWORDS
-            }
-            
-            config_msg = nest_pb2.NestRequest(
-                config=nest_pb2.NestConfig(config=json.dumps(config))
-            )
-            
-            # Start bi-directional stream
-            call = stub.recognize(metadata=metadata)
-            
-            # Send config first
-            await asyncio.to_thread(call.write, config_msg)
-            
-            print(f"[{speaker}] gRPC stream started")
-            
-            # Listen for responses
-            async for response in asyncio.to_thread(call):
-                if response.contents:
-                    try:
-                        result = json.loads(response.contents)
-                        text = result.get('text', '')
-                        
-                        if text:
-                            await self.broadcast_to_clients({
-                                'type': 'transcript',
-                                'speaker': speaker,
-                                'text': text
-                            })
-                            print(f"[{speaker}] {text}")
-                    except json.JSONDecodeError:
-                        pass
-            
-        except Exception as e:
-            print(f"[{speaker}] gRPC Error: {e}")
-            await self.broadcast_to_clients({
-                'type': 'error',
+            metrics.BROADCAST_SECONDS.observe(time.perf_counter() - start, type=message.get('type'))
+
+    def broadcast_threadsafe(self, message):
+        asyncio.run_coroutine_threadsafe(self.broadcast_to_clients(message), self.event_loop)
+
+    def result_handler(self, speaker):
+        def on_result(text, is_final, start_sample, end_sample):
+            if is_final: print(f"[{speaker}] {text}")
+            self.broadcast_threadsafe({
+                'type': 'transcript' if is_final else 'transcript_partial',
                 'speaker': speaker,
-                'message': str(e)
+                'text': text
             })
-    
-    async def audio_callback(self, audio_data):
-        """Process captured audio data"""
-        if not self.is_recording:
-            return
-        
-        # Calculate and send audio level
-        rms = self.calculate_rms(audio_data)
-        normalized_level = min(rms / 32768.0, 1.0)
-        
-        await self.broadcast_to_clients({
-            'type': 'meter',
-            'level': normalized_level
-        })
-        
-        # VAD check
-        is_speech = self.simple_vad(audio_data)
-        
-        # Separate stereo channels
-        left, right = self.separate_stereo(audio_data)
-        
-        # Send to gRPC streams
-        if is_speech and self.grpc_streams['Doctor']:
-            chunk_msg = nest_pb2.NestRequest(chunk=left)
-            await asyncio.to_thread(self.grpc_streams['Doctor'].write, chunk_msg)
-        
-        if is_speech and self.grpc_streams['Nurse']:
-            chunk_msg = nest_pb2.NestRequest(chunk=right)
-            await asyncio.to_thread(self.grpc_streams['Nurse'].write, chunk_msg)
-    
+        return on_result
+
+    def send_level(self, frame):
+        """Level meter (0-1) of the loudest input"""
+        self.broadcast_threadsafe({'type': 'meter', 'level': min(float(frame.rms.max()) / 32768.0, 1.0)})
+
+    def build_pipeline(self):
+        gate = [GateStage(self.vad_threshold)] if self.vad_threshold else []
+        branches = [(speaker, channel, gate + [StreamStage(self.recognizers[speaker])])
+                    for speaker, channel in self.speakers]
+        return Pipeline('microphone', self.source, [
+            SplitStage(self.channels),
+            TapStage('meter', self.send_level),
+            Fanout(branches),
+        ])
+
     async def start_recording(self):
         """Start audio capture and gRPC streaming"""
         if self.is_recording:
             return
-        
+
         print("Starting recording...")
         self.is_recording = True
-        
-        # Start gRPC streams
-        asyncio.create_task(self.grpc_stream_handler('Doctor'))
-        asyncio.create_task(self.grpc_stream_handler('Nurse'))
-        
-        # Start audio capture
-        self.stream = self.audio.open(
-            format=FORMAT,
-            channels=CHANNELS,
-            rate=SAMPLE_RATE,
-            input=True,
-            frames_per_buffer=CHUNK_SIZE,
-            stream_callback=lambda in_data, frame_count, time_info, status: (in_data, pyaudio.paContinue)
-        )
-        
-        self.stream.start_stream()
-        
-        # Audio processing loop
-        while self.is_recording:
-            if self.stream.is_active():
-                audio_data = self.stream.read(CHUNK_SIZE, exception_on_overflow=False)
-                await self.audio_callback(audio_data)
-            await asyncio.sleep(0.01)
-    
+        self.event_loop = asyncio.get_running_loop()
+        self.source.clear()
+
+        # One reconnecting gRPC stream per speaker
+        self.recognizers = {speaker: StreamingRecognizer(speaker, MEDICAL_KEYWORDS, self.result_handler(speaker))
+                            for speaker, _ in self.speakers}
+        for recognizer in self.recognizers.values():
+            recognizer.start()
+
+        self.pipeline = self.build_pipeline()
+        try:
+            await asyncio.to_thread(self.pipeline.start)  # Opens the PortAudio stream
+        except Exception as e:
+            print(f"❌ Audio Error: {e}")
+            await self.broadcast_to_clients({'type': 'error', 'message': str(e)})
+            await self.stop_recording()
+            return
+        print("Microphone stream started")
+
     async def stop_recording(self):
         """Stop audio capture and gRPC streaming"""
         if not self.is_recording:
             return
-        
+
         print("Stopping recording...")
         self.is_recording = False
-        
-        if self.stream:
-            self.stream.stop_stream()
-            self.stream.close()
-            self.stream = None
-        
-        # Close gRPC streams
-        for speaker, stream in self.grpc_streams.items():
-            if stream:
-                await asyncio.to_thread(stream.done)
-                self.grpc_streams[speaker] = None
-    
+
+        # Stops PortAudio, then streams what was already captured
+        if self.pipeline:
+            await asyncio.to_thread(self.pipeline.stop, 2)
+            self.pipeline = None
+        for recognizer in self.recognizers.values():
+            await asyncio.to_thread(recognizer.close)
+        self.recognizers = {}
+
+        print("Recording stopped")
+
     async def handle_websocket(self, websocket):
         """Handle WebSocket client connection"""
         self.websocket_clients.add(websocket)
-        print(f"Client connected. Total clients: {len(self.websocket_clients)}")
-        
+        print(f"✅ Client connected. Total: {len(self.websocket_clients)}")
+
         try:
             async for message in websocket:
-                data = json.loads(message)
-                command = data.get('command')
-                
-                if command == 'start':
-                    await self.start_recording()
-                elif command == 'stop':
-                    await self.stop_recording()
-        
+                try:
+                    data = json.loads(message)
+                    command = data.get('command')
+
+                    print(f"Command: {command}")
+
+                    if command == 'start':
+                        await self.start_recording()
+                    elif command == 'stop':
+                        await self.stop_recording()
+                    elif command == 'get_metrics':
+                        await websocket.send(json.dumps({'type': 'metrics', 'metrics': metrics.REGISTRY.snapshot()}))
+                except json.JSONDecodeError as e:
+                    print(f"JSON error: {e}")
+
         except websockets.exceptions.ConnectionClosed:
             pass
         finally:
-            self.websocket_clients.remove(websocket)
-            print(f"Client disconnected. Total clients: {len(self.websocket_clients)}")
-    
+            self.websocket_clients.discard(websocket)
+            print(f"❌ Client disconnected. Total: {len(self.websocket_clients)}")
+
     async def run_server(self):
         """Run WebSocket server"""
+        metrics.serve_http()
         async with serve(self.handle_websocket, "localhost", 3001):
-            print("🎙️ Voice Recognition Bridge running on ws://localhost:3001")
+            print(f"🎙️ {self.title} running on ws://localhost:3001")
             print(f"🔗 Clova API: {CLOVA_API_URL}")
             print(f"🔑 Secret Key: {'✓' if CLOVA_SECRET else '✗'}")
+            print(f"🎧 {self.channels} channel(s): {', '.join(f'{s}=ch{c}' for s, c in self.speakers)}")
             await asyncio.Future()  # Run forever
-    
+
     def close(self):
         """Cleanup resources"""
-        self.audio.terminate()
+        self.source.terminate()
 
 
-async def main():
-    bridge = VoiceRecognitionBridge()
+async def main(bridge=None):
+    bridge = bridge or VoiceRecognitionBridge()
     try:
         await bridge.run_server()
-    except KeyboardInterrupt:
+    except (KeyboardInterrupt, asyncio.CancelledError):
         print("\nShutting down...")
         await bridge.stop_recording()
         bridge.close()
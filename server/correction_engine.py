@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+STT Correction Engine
+Aho-Corasick automaton over corrections.json, applied in a single
+leftmost-longest pass instead of one str.replace per dictionary entry.
+Small dictionaries use an equivalent longest-first regex, which runs in C
+and beats a per-character Python scan until a few hundred entries.
+"""
+
+import re
+from collections import deque
+
+REGEX_MAX_PATTERNS = 256  # Above this the automaton is faster (see bench_corrections.py)
+
+
+class CorrectionEngine:
+    """Compiled multi-pattern replacer for transcript corrections"""
+
+    def __init__(self, corrections=None):
+        self.build(corrections or {})
+
+    def build(self, corrections):
+        """Compile the automaton. Called once per corrections change, never per transcript."""
+        self.corrections = {k: v for k, v in corrections.items() if k}
+        self.regex = None
+        if self.corrections and len(self.corrections) <= REGEX_MAX_PATTERNS:
+            # Longest alternative first == longest match at each position
+            ordered = sorted(self.corrections, key=len, reverse=True)
+            self.regex = re.compile('|'.join(re.escape(w) for w in ordered))
+
+        goto = [{}]       # state -> {char: next_state}
+        lengths = [()]    # state -> lengths of patterns ending here (incl. via fail links)
+
+        for wrong in self.corrections:
+            state = 0
+            for ch in wrong:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    lengths.append(())
+                state = nxt
+            lengths[state] = (len(wrong),)
+
+        # Breadth-first failure links; output sets are merged so the scan never follows them
+        fail = [0] * len(goto)
+        pending = deque(goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, nxt in goto[state].items():
+                pending.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                if lengths[fail[nxt]]:
+                    lengths[nxt] = tuple(sorted(set(lengths[nxt] + lengths[fail[nxt]]), reverse=True))
+
+        self.goto = goto
+        self.fail = fail
+        self.lengths = lengths
+
+    def __len__(self):
+        return len(self.corrections)
+
+    def apply(self, text):
+        """Replace every leftmost-longest match in one scan of the text"""
+        if not text or not self.corrections: return text
+        if self.regex is not None:
+            return self.regex.sub(lambda m: self.corrections[m.group(0)], text)
+        goto, fail, lengths = self.goto, self.fail, self.lengths
+
+        # Longest match starting at each position
+        best = {}
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for length in lengths[state]:
+                start = i - length + 1
+                if best.get(start, 0) < length:
+                    best[start] = length
+        if not best: return text
+
+        # Leftmost-longest, non-overlapping
+        out = []
+        pos = 0
+        for start in sorted(best):
+            if start < pos: continue
+            length = best[start]
+            out.append(text[pos:start])
+            out.append(self.corrections[text[start:start + length]])
+            pos = start + length
+        out.append(text[pos:])
+        return ''.join(out)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Clova Streaming Recognizer
+Feeds relay PCM frames into a long-lived NestService.recognize stream
+(one per session or channel) and reports partial and final results.
+"""
+
+import os
+import json
+import queue
+import threading
+import time
+from collections import deque
+import grpc
+from dotenv import load_dotenv
+
+import nest_pb2
+import nest_pb2_grpc
+from metrics import CLOVA_REQUESTS, CLOVA_AUDIO_SECONDS, CLOVA_BILLED_SECONDS, UPLOAD_LATENCY
+
+load_dotenv()
+
+# CLOVA_GRPC_TARGET overrides (e.g. mock_clova.py); CLOVA_GRPC_INSECURE=1 for a plaintext local server
+CLOVA_API_URL = os.getenv('CLOVA_GRPC_TARGET') or os.getenv('CLOVA_SPEECH_INVOKE_URL', 'clovaspeech-gw.ncloud.com:50051')
+GRPC_INSECURE = os.getenv('CLOVA_GRPC_INSECURE', '0') == '1'
+CLOVA_SECRET = os.getenv('CLOVA_SPEECH_SECRET')
+SAMPLE_RATE = 16000
+RECONNECT_DELAY = 1.0  # Seconds before reopening a stream that ended while recording
+FRAME_POLL = 0.1       # Seconds a request iterator waits for a frame before checking it is still current
+
+_CLOSE = object()
+
+
+def open_channel(target):
+    if GRPC_INSECURE: return grpc.insecure_channel(target)
+    return grpc.secure_channel(target, grpc.ssl_channel_credentials())
+
+
+def parse_response(contents):
+    """Return (text, is_final, start_ms, end_ms) from a NestResponse payload"""
+    result = json.loads(contents)
+    body = result.get('transcription') or result
+    text = body.get('text', '')
+    # Responses without end-point info are whole results
+    is_final = body.get('epFlag', True)
+    return text, is_final, body.get('startTimestamp'), body.get('endTimestamp')
+
+
+class StreamingRecognizer:
+    """One gRPC recognize stream; reconnects until closed"""
+    def __init__(self, name, boostings, on_result, url=CLOVA_API_URL, secret=CLOVA_SECRET):
+        self.name = name
+        self.boostings = boostings
+        self.on_result = on_result  # fn(text, is_final, start_sample, end_sample)
+        self.url = url
+        self.secret = secret
+        self.frames = queue.Queue()
+        self.read_lock = threading.Lock()  # Taking a frame and advancing the clock, vs. retiring a stream
+        self.generation = 0        # Bumped when a call ends; older request iterators stop taking frames
+        self.closed = False
+        self.thread = None
+        self.samples_fed = 0       # Session sample clock position of the next frame
+        self.stream_origin = 0     # Sample position where the current stream started
+        self.fed_at = deque(maxlen=4096)  # (samples_fed, monotonic time) for result latency
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name=f"grpc-{self.name}", daemon=True)
+        self.thread.start()
+
+    def feed(self, pcm):
+        self.frames.put(pcm)
+
+    def close(self, timeout=2.0):
+        self.closed = True
+        self.frames.put(_CLOSE)
+        if self.thread: self.thread.join(timeout=timeout)
+
+    def _requests(self, generation):
+        config = {
+            'language': 'ko-KR',
+            'completion': 'sync',
+            'boostings': self.boostings
+        }
+        yield nest_pb2.NestRequest(config=nest_pb2.NestConfig(config=json.dumps(config)))
+        with self.read_lock: self.stream_origin = self.samples_fed
+        while True:
+            # An ended call's iterator can still be waiting here; checked under the lock, it never takes
+            # (and counts) a frame meant for the next stream
+            with self.read_lock:
+                if generation != self.generation: return
+                try: frame = self.frames.get(timeout=FRAME_POLL)
+                except queue.Empty: continue
+                if frame is _CLOSE: return
+                self.samples_fed += len(frame) // 2
+                self.fed_at.append((self.samples_fed, time.monotonic()))
+            seconds = len(frame) / (2 * SAMPLE_RATE)
+            CLOVA_AUDIO_SECONDS.inc(seconds, mode='stream')
+            CLOVA_BILLED_SECONDS.inc(seconds, mode='stream')
+            yield nest_pb2.NestRequest(chunk=bytes(frame))
+
+    def _to_samples(self, ms):
+        if ms is None: return None
+        return self.stream_origin + int(ms) * SAMPLE_RATE // 1000
+
+    def _observe_latency(self, end_sample):
+        """Time from feeding the result's last sample to receiving the result"""
+        CLOVA_REQUESTS.inc(status='ok', mode='stream')
+        if end_sample is None: return
+        for fed, at in list(self.fed_at):  # Copy: the request thread appends concurrently
+            if fed >= end_sample:
+                UPLOAD_LATENCY.observe(time.monotonic() - at, mode='stream')
+                return
+
+    def _run(self):
+        metadata = [('authorization', f'Bearer {self.secret}')]
+        while not self.closed:
+            generation = self.generation
+            channel = open_channel(self.url)
+            try:
+                stub = nest_pb2_grpc.NestServiceStub(channel)
+                print(f"[{self.name}] gRPC stream started")
+                for response in stub.recognize(self._requests(generation), metadata=metadata):
+                    if not response.contents: continue
+                    try:
+                        text, is_final, start_ms, end_ms = parse_response(response.contents)
+                    except (json.JSONDecodeError, AttributeError):
+                        continue
+                    if text and is_final: self._observe_latency(self._to_samples(end_ms))
+                    if text:
+                        self.on_result(text, is_final, self._to_samples(start_ms), self._to_samples(end_ms))
+                print(f"[{self.name}] gRPC stream ended")
+            except Exception as e:
+                CLOVA_REQUESTS.inc(status='exception', mode='stream')
+                print(f"❌ [{self.name}] gRPC Error: {e}")
+            finally:
+                with self.read_lock: self.generation += 1  # Retire this call's request iterator
+                channel.close()
+            if not self.closed: time.sleep(RECONNECT_DELAY)
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+LLM Clients
+Streaming OpenAI / Gemini / Claude calls for treatment plan generation.
+Requests run on a small thread pool per provider (never on the event
+loop), so a stalled provider cannot hold the threads a backup needs; each
+pool thread keeps one keep-alive session, and text deltas are handed back
+to the event loop as they arrive. hedged_completion races providers
+("fastest" mode), guided by per-provider latency histograms.
+"""
+
+import os
+import json
+import time
+import asyncio
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from metrics import LLM_LATENCY, LLM_FAILURES
+
+LLM_WORKERS = int(os.getenv('LLM_WORKERS', 4))  # Threads per provider
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30  # Max silence between streamed chunks
+HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', 4.0))  # Start a backup provider if no text arrives by then
+
+_local = threading.local()
+
+
+class LLMError(Exception):
+    """Provider call failed; str(e) is shown to the user after '❌ '"""
+
+
+def _session(provider):
+    sessions = getattr(_local, 'sessions', None)
+    if sessions is None:
+        sessions = _local.sessions = {}
+    if provider not in sessions:
+        session = sessions[provider] = requests.Session()
+        session.mount('https://', _CallAdapter())
+        session.mount('http://', _CallAdapter())
+    return sessions[provider]
+
+
+class _Call:
+    """One provider request in flight on a pool thread; cancel() aborts its connection from any thread"""
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def attach(self, conn):
+        with self.lock: self.conn = conn
+        if self.cancelled.is_set(): self._abort(conn)
+
+    def finish(self):
+        """The worker is done: its connection is back in the keep-alive pool and must not be aborted"""
+        with self.lock: self.conn = None
+
+    def cancel(self):
+        self.cancelled.set()
+        with self.lock: conn = self.conn
+        if conn is not None: self._abort(conn)
+
+    @staticmethod
+    def _abort(conn):
+        # Shutting the socket down wakes a read blocked on response headers or the next
+        # streamed byte; the pool discards the broken connection
+        sock = getattr(conn, 'sock', None)
+        if sock is None: return
+        try: sock.shutdown(socket.SHUT_RDWR)
+        except OSError: pass
+
+
+def _track(pool_cls):
+    class Pool(pool_cls):
+        def _get_conn(self, timeout=None):
+            conn = super()._get_conn(timeout)
+            call = getattr(_local, 'call', None)
+            if call: call.attach(conn)
+            return conn
+    return Pool
+
+
+class _CallAdapter(HTTPAdapter):
+    """Hands each connection a request uses to the thread's current _Call"""
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': _track(HTTPConnectionPool),
+                                                   'https': _track(HTTPSConnectionPool)}
+
+
+def _post(provider, label, url, **kwargs):
+    try:
+        res = _session(provider).post(url, stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+    except Exception as e:
+        raise LLMError(f"{label} Request Failed: {e}")
+    if res.status_code != 200:
+        raise LLMError(f"{label} Error {res.status_code}: {res.text}")
+    return res
+
+
+def _sse_data(res):
+    """Yield the payload of each 'data:' line of a server-sent event stream"""
+    res.encoding = 'utf-8'
+    # chunk_size=None hands over bytes as they arrive instead of filling 512-byte reads
+    for line in res.iter_lines(chunk_size=None, decode_unicode=True):
+        if line and line.startswith('data:'):
+            yield line[5:].strip()
+
+
+def stream_openai(prompt):
+    api_key = os.getenv('OPENAI_API_KEY') or os.getenv('VITE_OPENAI_API_KEY')
+    if not api_key: raise LLMError("OpenAI API Key missing")
+
+    res = _post('openai', "OpenAI", "https://api.openai.com/v1/chat/completions",
+                headers={"Authorization": f"Bearer {api_key}"},
+                json={
+                    "model": "gpt-4o",
+                    "messages": [{"role": "user", "content": prompt}],
+                    "temperature": 0.7,
+                    "stream": True
+                })
+    with res:
+        for data in _sse_data(res):
+            if data == '[DONE]': break
+            choices = json.loads(data).get('choices') or [{}]
+            text = choices[0].get('delta', {}).get('content')
+            if text: yield text
+
+
+def stream_gemini(prompt):
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key: raise LLMError("Gemini API Key missing")
+
+    # Gemini 1.5 Flash (or Pro)
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:streamGenerateContent?alt=sse&key={api_key}"
+    res = _post('gemini', "Gemini", url,
+                headers={"Content-Type": "application/json"},
+                json={"contents": [{"parts": [{"text": prompt}]}]})
+    with res:
+        for data in _sse_data(res):
+            for candidate in json.loads(data).get('candidates', []):
+                for part in candidate.get('content', {}).get('parts', []):
+                    if part.get('text'): yield part['text']
+
+
+def stream_claude(prompt):
+    api_key = os.getenv('ANTHROPIC_API_KEY')
+    if not api_key: raise LLMError("Anthropic API Key missing")
+
+    res = _post('claude', "Claude", "https://api.anthropic.com/v1/messages",
+                headers={
+                    "x-api-key": api_key,
+                    "anthropic-version": "2023-06-01",
+                    "content-type": "application/json"
+                },
+                json={
+                    "model": "claude-3-5-sonnet-20240620",
+                    "max_tokens": 1000,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "stream": True
+                })
+    with res:
+        for data in _sse_data(res):
+            event = json.loads(data)
+            if event.get('type') == 'error':
+                raise LLMError(f"Claude Error: {event.get('error', {}).get('message', data)}")
+            if event.get('type') == 'content_block_delta':
+                text = event.get('delta', {}).get('text')
+                if text: yield text
+
+
+PROVIDERS = {
+    'openai': stream_openai,
+    'gemini': stream_gemini,
+    'claude': stream_claude,
+}
+
+# One pool per provider: hedged backups never queue behind a stalled provider's requests
+EXECUTORS = {name: ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix=f"llm-{name}") for name in PROVIDERS}
+
+API_KEY_ENV = {
+    'openai': ('OPENAI_API_KEY', 'VITE_OPENAI_API_KEY'),
+    'gemini': ('GEMINI_API_KEY',),
+    'claude': ('ANTHROPIC_API_KEY',),
+}
+
+# Per-provider latency (metrics.LLM_LATENCY): phase 'first_text' and 'complete'
+
+
+def configured():
+    return [name for name in PROVIDERS if any(os.getenv(env) for env in API_KEY_ENV[name])]
+
+
+def preferred_order(providers=None):
+    """Configured providers, fastest median completion first; unmeasured ones keep PROVIDERS order"""
+    names = [p for p in (providers or configured()) if p in PROVIDERS]
+    def rank(item):
+        i, name = item
+        p50 = LLM_LATENCY.child(provider=name, phase='complete').quantile(0.5)
+        return (p50 if p50 is not None else float('inf'), i)
+    return [name for _, name in sorted(enumerate(names), key=rank)]
+
+
+def latency_stats():
+    return {
+        name: {
+            'first_text': LLM_LATENCY.child(provider=name, phase='first_text').snapshot(),
+            'complete': LLM_LATENCY.child(provider=name, phase='complete').snapshot(),
+            'failures': LLM_FAILURES.value(provider=name),
+        } for name in PROVIDERS
+    }
+
+
+async def stream_completion(provider, prompt, on_delta=None):
+    """Run a provider stream on its pool; await on_delta(text) per chunk; return the full text.
+    Cancelling the awaiting task aborts the connection, so the worker returns to its pool at
+    once, whether it was waiting for response headers or for the next chunk."""
+    loop = asyncio.get_running_loop()
+    deltas = asyncio.Queue()
+    done = object()
+    call = _Call()
+    if provider not in PROVIDERS: provider = 'openai'
+    fn = PROVIDERS[provider]
+
+    def run():
+        _local.call = call
+        try:
+            if call.cancelled.is_set(): return  # Cancelled while queued
+            for text in fn(prompt):
+                if call.cancelled.is_set(): break  # Leaving the generator closes the response
+                loop.call_soon_threadsafe(deltas.put_nowait, text)
+        except LLMError as e:
+            loop.call_soon_threadsafe(deltas.put_nowait, e)
+        except Exception as e:
+            loop.call_soon_threadsafe(deltas.put_nowait, LLMError(f"{provider} Request Failed: {e}"))
+        finally:
+            _local.call = None
+            call.finish()
+            if not loop.is_closed(): loop.call_soon_threadsafe(deltas.put_nowait, done)
+
+    start = time.monotonic()
+    future = loop.run_in_executor(EXECUTORS[provider], run)
+    parts = []
+    try:
+        while True:
+            item = await deltas.get()
+            if item is done: break
+            if isinstance(item, LLMError):
+                LLM_FAILURES.inc(provider=provider)
+                raise item
+            if not parts: LLM_LATENCY.observe(time.monotonic() - start, provider=provider, phase='first_text')
+            parts.append(item)
+            if on_delta: await on_delta(item)
+    finally:
+        call.cancel()
+    LLM_LATENCY.observe(time.monotonic() - start, provider=provider, phase='complete')
+    return ''.join(parts)
+
+
+async def hedged_completion(prompt, on_delta=None, providers=None, hedge_delay=HEDGE_DELAY, on_reset=None):
+    """Race providers: start the preferred one, add the next if no text arrives within
+    hedge_delay (or immediately if one fails). The first complete answer wins and the
+    rest are cancelled. Deltas are forwarded only from the leader (the first provider to
+    produce text), as on_delta(text, provider). If the leader fails, on_reset(provider) is
+    awaited so the preview can be cleared, and the next provider to produce text leads,
+    starting with everything it produced so far. Returns (text, provider)."""
+    order = preferred_order(providers)
+    if not order: raise LLMError("No LLM API key configured")
+
+    leader = None
+    first_text = asyncio.Event()
+    running = {}  # task -> provider
+    produced = {}  # provider -> text so far
+    errors = []
+
+    def launch():
+        name = order.pop(0)
+        async def forward(text):
+            nonlocal leader
+            produced[name] = produced.get(name, '') + text
+            first_text.set()
+            if leader is None:
+                leader = name
+                text = produced[name]  # A new leader after a failure brings its earlier text along
+            if on_delta and leader == name: await on_delta(text, name)
+        running[asyncio.create_task(stream_completion(name, prompt, forward))] = name
+        print(f"🏁 Hedged plan: started {name}")
+
+    launch()
+    try:
+        while running:
+            waiters = set(running)
+            hedge = None
+            if order and not first_text.is_set():
+                hedge = asyncio.create_task(asyncio.wait_for(first_text.wait(), hedge_delay))
+                waiters.add(hedge)
+            finished, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            if hedge:
+                hedge.cancel()
+                if hedge in finished:
+                    finished.discard(hedge)
+                    if hedge.cancelled() or hedge.exception(): launch()  # No text in time
+            for task in finished:
+                name = running.pop(task)
+                if task.exception() is None:
+                    return task.result(), name
+                errors.append(str(task.exception()))
+                if leader == name:
+                    leader = None
+                    if on_reset: await on_reset(name)
+                if order: launch()
+        raise LLMError(" / ".join(errors))
+    finally:
+        for task in running: task.cancel()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Metrics
+Lightweight thread-safe counters, gauges and latency histograms
+(Prometheus-style cumulative buckets) shared by the relays. The registry
+renders Prometheus text for an optional local HTTP endpoint (METRICS_PORT)
+and a JSON snapshot for the 'get_metrics' WebSocket command.
+"""
+
+import os
+import math
+import time
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))  # 0 = no HTTP endpoint
+BILLING_UNIT = float(os.getenv('CLOVA_BILLING_UNIT', 15.0))  # Seconds; each request is billed in whole units
+
+# Seconds; covers 10 ms frames up to slow LLM completions
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+SEGMENT_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 6.0, 8.0, 10.0, 15.0, 20.0, 30.0)
+FANOUT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+STAGE_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _label_text(key):
+    return ','.join(f'{k}="{v}"' for k, v in key)
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram; quantiles are interpolated inside the bucket"""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        i = 0
+        while i < len(self.buckets) and seconds > self.buckets[i]: i += 1
+        with self.lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def quantile(self, q):
+        with self.lock:
+            if not self.count: return None
+            rank = q * self.count
+            seen = 0
+            for i, n in enumerate(self.counts):
+                if n and seen + n >= rank:
+                    lower = self.buckets[i - 1] if i > 0 else 0.0
+                    if i == len(self.buckets): return lower  # +Inf bucket: best we can say
+                    return lower + (self.buckets[i] - lower) * (rank - seen) / n
+                seen += n
+            return self.buckets[-1]
+
+    def snapshot(self):
+        p50, p90, p99 = self.quantile(0.5), self.quantile(0.9), self.quantile(0.99)
+        with self.lock:
+            return {
+                'count': self.count,
+                'mean': round(self.sum / self.count, 4) if self.count else None,
+                'p50': round(p50, 4) if p50 is not None else None,
+                'p90': round(p90, 4) if p90 is not None else None,
+                'p99': round(p99, 4) if p99 is not None else None,
+            }
+
+
+class RateMeter:
+    """Events per second over a sliding window of one-second buckets"""
+    def __init__(self, window=10):
+        self.window = window
+        self.lock = threading.Lock()
+        self.buckets = deque()  # [second, count]
+
+    def mark(self, n=1):
+        now = int(time.monotonic())
+        with self.lock:
+            if self.buckets and self.buckets[-1][0] == now: self.buckets[-1][1] += n
+            else: self.buckets.append([now, n])
+            while self.buckets[0][0] <= now - self.window: self.buckets.popleft()
+
+    def rate(self):
+        now = int(time.monotonic())
+        with self.lock:
+            total = sum(n for second, n in self.buckets if second > now - self.window)
+        return total / self.window
+
+
+class Counter:
+    kind = 'counter'
+    def __init__(self, name, help):
+        self.name, self.help = name, help
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock: self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock: return self.values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self.lock: return [(self.name, key, v) for key, v in self.values.items()]
+
+    def snapshot(self):
+        with self.lock: return {_label_text(key): round(v, 3) for key, v in self.values.items()}
+
+
+class Gauge(Counter):
+    """Set directly, or read from fn() at scrape time: a number, or {((label, value), ...): number}"""
+    kind = 'gauge'
+    def __init__(self, name, help, fn=None):
+        super().__init__(name, help)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        with self.lock: self.values[_label_key(labels)] = value
+
+    def _collect(self):
+        if self.fn is None: return
+        try:
+            result = self.fn()
+        except Exception:
+            return
+        with self.lock:
+            if isinstance(result, dict):
+                self.values = {_label_key(dict(labels)): v for labels, v in result.items()}
+            else:
+                self.values = {(): result}
+
+    def samples(self):
+        self._collect()
+        return super().samples()
+
+    def snapshot(self):
+        self._collect()
+        return super().snapshot()
+
+
+class Histogram:
+    kind = 'histogram'
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.buckets = name, help, tuple(buckets)
+        self.lock = threading.Lock()
+        self.children = {}
+
+    def child(self, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            hist = self.children.get(key)
+            if hist is None: hist = self.children[key] = LatencyHistogram(self.buckets)
+            return hist
+
+    def observe(self, value, **labels):
+        self.child(**labels).observe(value)
+
+    def samples(self):
+        out = []
+        with self.lock: children = list(self.children.items())
+        for key, hist in children:
+            with hist.lock: counts, total, count = list(hist.counts), hist.sum, hist.count
+            cumulative = 0
+            for bound, n in zip(list(self.buckets) + [math.inf], counts):
+                cumulative += n
+                le = '+Inf' if bound == math.inf else repr(bound)
+                out.append((self.name + '_bucket', key + (('le', le),), cumulative))
+            out.append((self.name + '_sum', key, total))
+            out.append((self.name + '_count', key, count))
+        return out
+
+    def snapshot(self):
+        with self.lock: children = list(self.children.items())
+        return {_label_text(key): hist.snapshot() for key, hist in children}
+
+
+class Registry:
+    """Named metrics; re-registering a name returns the existing metric"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None: metric = self.metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help=''):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help='', fn=None):
+        gauge = self._get(Gauge, name, help)
+        if fn is not None: gauge.fn = fn
+        return gauge
+
+    def histogram(self, name, help='', buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self.lock: metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                labels = f"{{{_label_text(key)}}}" if key else ''
+                lines.append(f"{name}{labels} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        with self.lock: metrics = list(self.metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = Registry()
+
+# Shared relay metrics (same names in every relay so dashboards can compare)
+AUDIO_CHUNKS = REGISTRY.counter('relay_audio_chunks_total', 'Audio buffers received from clients or the microphone')
+AUDIO_SECONDS = REGISTRY.counter('relay_audio_seconds_total', 'Audio received, in seconds per channel')
+AUDIO_RATE = RateMeter()
+REGISTRY.gauge('relay_audio_chunks_per_second', 'Audio buffers received per second (10 s window)', AUDIO_RATE.rate)
+SEGMENT_SECONDS = REGISTRY.histogram('relay_segment_duration_seconds', 'Duration of segments sent for recognition',
+                                     SEGMENT_BUCKETS)
+UPLOAD_LATENCY = REGISTRY.histogram('clova_upload_latency_seconds', 'Clova /recognizer/upload round trip')
+CLOVA_REQUESTS = REGISTRY.counter('clova_requests_total', 'Clova requests by outcome (ok, empty, http_error, exception)')
+CLOVA_AUDIO_SECONDS = REGISTRY.counter('clova_audio_seconds_total', 'Audio sent to Clova, in seconds')
+CLOVA_BILLED_SECONDS = REGISTRY.counter('clova_billed_audio_seconds_total',
+                                        f'Audio seconds billed (uploads rounded up to {BILLING_UNIT:g} s units)')
+BROADCAST_SECONDS = REGISTRY.histogram('relay_broadcast_seconds', 'Time to fan a message out to all subscribers',
+                                       FANOUT_BUCKETS)
+UPLOAD_RAW_BYTES = REGISTRY.counter('clova_upload_raw_bytes_total', 'PCM bytes of uploaded segments before encoding, by codec sent')
+UPLOAD_ENCODED_BYTES = REGISTRY.counter('clova_upload_encoded_bytes_total', 'Bytes sent as the multipart media field, by codec')
+UPLOAD_ENCODE_SECONDS = REGISTRY.counter('clova_upload_encode_seconds_total', 'CPU time spent encoding segments, by codec')
+UPLOAD_ENCODE_FALLBACKS = REGISTRY.counter('clova_upload_encode_fallbacks_total', 'Segments sent as wav because the codec failed')
+LLM_LATENCY = REGISTRY.histogram('llm_latency_seconds', 'LLM latency by provider and phase (first_text, complete)')
+LLM_FAILURES = REGISTRY.counter('llm_failures_total', 'Failed LLM requests by provider')
+
+
+def record_upload(audio_seconds, latency, outcome, mode='upload'):
+    """Account one recognition request (upload path)"""
+    CLOVA_REQUESTS.inc(status=outcome, mode=mode)
+    UPLOAD_LATENCY.observe(latency, mode=mode)
+    CLOVA_AUDIO_SECONDS.inc(audio_seconds, mode=mode)
+    billed = math.ceil(audio_seconds / BILLING_UNIT) * BILLING_UNIT if BILLING_UNIT > 0 else audio_seconds
+    CLOVA_BILLED_SECONDS.inc(billed, mode=mode)
+
+
+def record_encode(raw_bytes, encoded_bytes, seconds, codec):
+    """Account one encoded upload segment under the codec actually sent"""
+    UPLOAD_RAW_BYTES.inc(raw_bytes, codec=codec)
+    UPLOAD_ENCODED_BYTES.inc(encoded_bytes, codec=codec)
+    UPLOAD_ENCODE_SECONDS.inc(seconds, codec=codec)
+
+
+def _compression_ratio():
+    with UPLOAD_RAW_BYTES.lock: raw = dict(UPLOAD_RAW_BYTES.values)
+    with UPLOAD_ENCODED_BYTES.lock: encoded = dict(UPLOAD_ENCODED_BYTES.values)
+    return {key: round(encoded.get(key, 0) / n, 3) for key, n in raw.items() if n}
+
+
+REGISTRY.gauge('clova_upload_compression_ratio', 'Encoded / raw upload bytes by codec (bandwidth saved = 1 - ratio)',
+               _compression_ratio)
+
+
+def record_audio(nbytes, channels=1, sample_rate=16000):
+    AUDIO_CHUNKS.inc()
+    AUDIO_RATE.mark()
+    AUDIO_SECONDS.inc(nbytes / (2 * channels * sample_rate))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args): pass
+
+
+def serve_http(port=METRICS_PORT, registry=REGISTRY, host='127.0.0.1'):
+    """Start the Prometheus endpoint on a daemon thread; returns the server or None if disabled"""
+    if not port: return None
+    handler = type('MetricsHandler', (_Handler,), {'registry': registry})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        print(f"⚠️ Metrics endpoint unavailable on port {port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    print(f"📊 Metrics at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Mock Clova Speech Server
+Local stand-in for the Clova gateway for offline and load testing:
+- HTTP  POST .../recognizer/upload (multipart 'media' + 'params'), HEAD/GET for keep-alive
+- gRPC  NestService.recognize (config message, then PCM chunks)
+
+Transcripts are deterministic (seeded by the audio content), so repeated
+runs are comparable. Latency, jitter, errors and throttling are configurable.
+
+Usage:
+  python mock_clova.py --latency 0.3 --jitter 0.1 --rtf 0.05 --error-rate 0.05 --max-concurrent 4
+Then point the relays and process_recordings.py at it:
+  CLOVA_UPLOAD_URL=http://127.0.0.1:8089 CLOVA_GRPC_TARGET=127.0.0.1:50061 CLOVA_GRPC_INSECURE=1
+"""
+
+import io
+import json
+import time
+import wave
+import zlib
+import random
+import argparse
+import threading
+from concurrent import futures
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import grpc
+
+import nest_pb2
+import nest_pb2_grpc
+from segmenter import VoiceSegmenter, SAMPLE_RATE
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+# Deterministic vocabulary for fake transcripts (clinic small talk)
+VOCABULARY = (
+    "안녕하세요 허리가 아파서 왔어요 언제부터 아프셨어요 침 맞고 가세요 추나 치료 약침 "
+    "어깨가 결려요 다음 주에 오세요 많이 좋아졌네요 무리하지 마세요 한약 드시고 계세요 "
+    "찜질 해주세요 목이 뻐근해요 잠을 잘 못 자요 스트레칭 하세요"
+).split()
+WORDS_PER_SECOND = 2.5
+SILENCE_RMS = 100  # Uploads quieter than this come back empty
+
+
+class MockBehaviour:
+    """Shared latency/error/throttle settings and counters for both protocols"""
+    def __init__(self, latency=0.2, jitter=0.05, rtf=0.0, error_rate=0.0, max_concurrent=0, rate_limit=0.0,
+                 secret=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rtf = rtf                      # Extra seconds per audio second
+        self.error_rate = error_rate
+        self.max_concurrent = max_concurrent  # 0 = unlimited
+        self.rate_limit = rate_limit          # Requests per second, 0 = unlimited
+        self.secret = secret
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.tokens = rate_limit
+        self.refilled = time.monotonic()
+        self.stats = {'requests': 0, 'ok': 0, 'errors': 0, 'throttled': 0, 'unauthorized': 0, 'audio_s': 0.0}
+
+    def admit(self, key):
+        """None if the request may proceed, else 'unauthorized', 'throttled' or 'error'"""
+        with self.lock:
+            self.stats['requests'] += 1
+            if self.secret and key != self.secret:
+                self.stats['unauthorized'] += 1
+                return 'unauthorized'
+            if self.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.rate_limit, self.tokens + (now - self.refilled) * self.rate_limit)
+                self.refilled = now
+                if self.tokens < 1:
+                    self.stats['throttled'] += 1
+                    return 'throttled'
+                self.tokens -= 1
+            if self.max_concurrent and self.active >= self.max_concurrent:
+                self.stats['throttled'] += 1
+                return 'throttled'
+            if self.random.random() < self.error_rate:
+                self.stats['errors'] += 1
+                return 'error'
+            self.active += 1
+            return None
+
+    def release(self, audio_seconds, ok=True):
+        with self.lock:
+            self.active -= 1
+            if ok: self.stats['ok'] += 1
+            self.stats['audio_s'] += audio_seconds
+
+    def delay(self, audio_seconds):
+        with self.lock: jitter = self.random.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, self.latency + jitter + self.rtf * audio_seconds))
+
+
+def fake_text(pcm):
+    """Deterministic words for this audio: same bytes, same transcript"""
+    arr = np.frombuffer(pcm, dtype=np.int16)
+    if not len(arr) or np.sqrt(np.mean(arr.astype(np.float32) ** 2)) < SILENCE_RMS: return ''
+    rng = random.Random(zlib.crc32(pcm))
+    count = max(1, int(len(arr) / SAMPLE_RATE * WORDS_PER_SECOND))
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(count))
+
+
+def decode_media(data):
+    """PCM bytes from an uploaded WAV/FLAC (or raw PCM)"""
+    if data[:4] == b'RIFF':
+        with wave.open(io.BytesIO(data), 'rb') as w:
+            return w.readframes(w.getnframes())
+    if data[:4] == b'fLaC' and soundfile is not None:
+        arr, _ = soundfile.read(io.BytesIO(data), dtype='int16')
+        return arr.tobytes()
+    return data
+
+
+def upload_response(pcm):
+    text = fake_text(pcm)
+    duration_ms = len(pcm) * 1000 // (2 * SAMPLE_RATE)
+    segments = [{'start': 0, 'end': duration_ms, 'text': text, 'confidence': 0.9}] if text else []
+    return {'result': 'COMPLETED', 'message': 'Succeeded', 'text': text, 'segments': segments}
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    behaviour = None
+
+    def _reply(self, status, body=None):
+        payload = json.dumps(body or {}, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self._reply(200, self.behaviour.stats if self.path.endswith('/stats') else {'status': 'ok'})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.rstrip('/').endswith('/recognizer/upload'):
+            self._reply(404, {'message': 'Not Found'})
+            return
+        verdict = self.behaviour.admit(self.headers.get('X-CLOVASPEECH-API-KEY'))
+        if verdict == 'unauthorized':
+            self._reply(401, {'result': 'FAILED', 'message': 'Unauthorized'})
+            return
+        if verdict == 'throttled':
+            self._reply(429, {'result': 'FAILED', 'message': 'Too Many Requests'})
+            return
+        if verdict == 'error':
+            self._reply(500, {'result': 'FAILED', 'message': 'Internal Server Error (mock)'})
+            return
+
+        pcm = b''
+        try:
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+            for part in message.iter_parts():
+                if part.get_param('name', header='content-disposition') == 'media':
+                    pcm = decode_media(part.get_payload(decode=True))
+        except Exception as e:
+            self.behaviour.release(0, ok=False)
+            self._reply(400, {'result': 'FAILED', 'message': f'Bad multipart body: {e}'})
+            return
+        seconds = len(pcm) / (2 * SAMPLE_RATE)
+        try:
+            self.behaviour.delay(seconds)
+            self._reply(200, upload_response(pcm))
+        finally:
+            self.behaviour.release(seconds)
+
+    def log_message(self, *args): pass
+
+
+class MockNestService(nest_pb2_grpc.NestServiceServicer):
+    """Streams one final result per VAD segment, with session-relative timestamps"""
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+
+    def recognize(self, request_iterator, context):
+        metadata = dict(context.invocation_metadata())
+        verdict = self.behaviour.admit(metadata.get('authorization', '').replace('Bearer ', '') or None)
+        if verdict == 'unauthorized': context.abort(grpc.StatusCode.UNAUTHENTICATED, 'Unauthorized')
+        if verdict == 'throttled': context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, 'Too Many Requests')
+        if verdict == 'error': context.abort(grpc.StatusCode.UNAVAILABLE, 'Mock stream failure')
+
+        segmenter = VoiceSegmenter(SILENCE_RMS * 3, 0.6, 15.0)
+        seconds = 0.0
+        try:
+            for request in request_iterator:
+                if request.HasField('config') or not request.chunk: continue
+                seconds += len(request.chunk) / (2 * SAMPLE_RATE)
+                for segment in segmenter.feed(request.chunk):
+                    yield self._result(segment)
+            for segment in segmenter.flush():
+                yield self._result(segment)
+        finally:
+            self.behaviour.release(seconds)
+
+    def _result(self, segment):
+        self.behaviour.delay(segment.duration)
+        text = fake_text(bytes(segment.audio))
+        body = {
+            'text': text, 'epFlag': True,
+            'startTimestamp': segment.start_sample * 1000 // SAMPLE_RATE,
+            'endTimestamp': segment.end_sample * 1000 // SAMPLE_RATE,
+        }
+        # 'text' at the top level as well, for the PyAudio bridge's parser
+        return nest_pb2.NestResponse(contents=json.dumps({'transcription': body, 'text': text}, ensure_ascii=False))
+
+
+def serve(behaviour, http_port=8089, grpc_port=50061, host='127.0.0.1'):
+    """Start both servers in the background; returns (http_server, grpc_server)"""
+    handler = type('Handler', (UploadHandler,), {'behaviour': behaviour})
+    http_server = ThreadingHTTPServer((host, http_port), handler)
+    threading.Thread(target=http_server.serve_forever, daemon=True, name="mock-clova-http").start()
+
+    grpc_server = grpc.server(futures.ThreadPoolExecutor(max_workers=32))
+    nest_pb2_grpc.add_NestServiceServicer_to_server(MockNestService(behaviour), grpc_server)
+    grpc_port = grpc_server.add_insecure_port(f"{host}:{grpc_port}")
+    grpc_server.start()
+    return http_server, grpc_server, http_server.server_address[1], grpc_port
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the Clova Speech gateway")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--http-port', type=int, default=8089)
+    parser.add_argument('--grpc-port', type=int, default=50061)
+    parser.add_argument('--latency', type=float, default=0.2, help="base response delay (s)")
+    parser.add_argument('--jitter', type=float, default=0.05, help="uniform +/- jitter (s)")
+    parser.add_argument('--rtf', type=float, default=0.0, help="extra delay per second of audio")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests failing with 500/UNAVAILABLE")
+    parser.add_argument('--max-concurrent', type=int, default=0, help="429/RESOURCE_EXHAUSTED above this (0 = off)")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="requests per second before 429 (0 = off)")
+    parser.add_argument('--secret', help="require this API key (default: accept any)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    behaviour = MockBehaviour(args.latency, args.jitter, args.rtf, args.error_rate, args.max_concurrent,
+                              args.rate_limit, args.secret, args.seed)
+    http_server, grpc_server, http_port, grpc_port = serve(behaviour, args.http_port, args.grpc_port, args.host)
+    print("🧪 Mock Clova Speech running")
+    print(f"   CLOVA_UPLOAD_URL=http://{args.host}:{http_port}")
+    print(f"   CLOVA_GRPC_TARGET={args.host}:{grpc_port} CLOVA_GRPC_INSECURE=1")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"📊 {behaviour.stats}")
+    except KeyboardInterrupt:
+        http_server.shutdown()
+        grpc_server.stop(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Audio Pipeline Engine
+One worker thread per session runs a graph of stages over every message a
+source produces:
+
+  source -> [taps] -> split (DSP) -> route -> fan-out per channel -> segment (VAD) -> recognizer
+  (WebSocket queue, PyAudio, WAV file)                                            (upload or gRPC)
+
+Stages receive the Frame of the current message and return it, or None to
+end that branch. Channel audio moves between stages as views into the
+splitter's reused buffers, never copied; a stage that keeps audio past its
+call (segmenter, gRPC queue) copies what it keeps. Idle ticks (source quiet)
+and the final flush travel the same graph as control frames, so a segment
+stage can close an utterance wherever it sits. Every stage call is timed
+into pipeline_stage_seconds{pipeline, stage[, channel]}.
+
+Recognition results leave the graph asynchronously (upload workers, gRPC
+threads) and go through the shared post-processing: reorder_buffer.py,
+stitcher.py, correction_engine.py and the relay's broadcast.
+"""
+
+import queue
+import threading
+import time
+import wave
+
+from channel_dsp import ChannelSplitter
+import metrics
+
+SAMPLE_RATE = 16000
+STAGE_SECONDS = metrics.REGISTRY.histogram('pipeline_stage_seconds', 'Time per pipeline stage call, per message',
+                                           metrics.STAGE_BUCKETS)
+
+
+class Frame:
+    """The message being processed; branches see their own channel in .audio"""
+    __slots__ = ('pcm', 'audio', 'channel', 'channels', 'rms', 'start_sample', 'samples', 'control')
+
+    def __init__(self, pcm=None, start_sample=0, control=None):
+        self.pcm = pcm                    # Raw Int16 message as received (interleaved if multi-channel)
+        self.audio = pcm                  # Mono audio for the current branch (bytes or a buffer view)
+        self.channel = 0
+        self.channels = None              # Per-channel views once split
+        self.rms = None                   # Per-channel RMS once split
+        self.start_sample = start_sample  # Session sample clock at the first sample of this message
+        self.samples = 0                  # Samples per channel in this message
+        self.control = control            # None for audio, 'idle' or 'flush'
+
+
+class Stage:
+    """Base stage: process() audio frames; on_idle()/on_flush() see control frames"""
+    name = 'stage'
+
+    def process(self, frame):
+        return frame
+
+    def on_idle(self, frame):
+        return frame
+
+    def on_flush(self, frame):
+        return frame
+
+    def bind(self, pipeline, **labels):
+        self.timer = STAGE_SECONDS.child(pipeline=pipeline, stage=self.name, **labels)
+
+    def run(self, frame):
+        if frame.control == 'idle': return self.on_idle(frame)
+        if frame.control == 'flush': return self.on_flush(frame)
+        start = time.perf_counter()
+        try: return self.process(frame)
+        finally: self.timer.observe(time.perf_counter() - start)
+
+
+class QueueSource:
+    """Messages put by another thread, e.g. a WebSocket handler"""
+    def __init__(self, audio_queue=None, channels=1):
+        self.queue = audio_queue if audio_queue is not None else queue.Queue()
+        self.channels = channels
+        self.done = False
+
+    def start(self): pass
+    def stop(self): pass
+
+    def put(self, pcm):
+        self.queue.put(pcm)
+
+    def read(self, timeout):
+        try: return self.queue.get(timeout=timeout)
+        except queue.Empty: return None
+
+    def pending(self):
+        return not self.queue.empty()
+
+    def clear(self):
+        while not self.queue.empty(): self.queue.get()
+
+
+class PyAudioSource(QueueSource):
+    """Microphone / audio interface; the PortAudio callback only queues the buffer"""
+    def __init__(self, channels, frames_per_buffer=1024, device=None, sample_rate=SAMPLE_RATE):
+        super().__init__(channels=channels)
+        self.frames_per_buffer = frames_per_buffer
+        self.device = device
+        self.sample_rate = sample_rate
+        self.audio = None
+        self.stream = None
+
+    def start(self):
+        import pyaudio  # Only the microphone bridges need PortAudio
+        self.audio = self.audio or pyaudio.PyAudio()
+
+        def callback(in_data, frame_count, time_info, status):
+            if in_data:
+                metrics.record_audio(len(in_data), channels=self.channels)
+                self.queue.put(in_data)
+            return (None, pyaudio.paContinue)
+
+        options = dict(format=pyaudio.paInt16, channels=self.channels, rate=self.sample_rate, input=True,
+                       frames_per_buffer=self.frames_per_buffer, stream_callback=callback)
+        try:
+            self.stream = self.audio.open(input_device_index=self.device, **options)
+            print(f"✅ Opened audio device {'default' if self.device is None else f'index {self.device}'}")
+        except Exception as e:
+            if self.device is None: raise
+            print(f"❌ Failed to open device {self.device}, trying default: {e}")
+            self.stream = self.audio.open(**options)
+            print("✅ Opened default audio device")
+        self.stream.start_stream()
+
+    def stop(self):
+        if self.stream:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+    def terminate(self):
+        if self.audio: self.audio.terminate()
+        self.audio = None
+
+
+class FileSource:
+    """16-bit WAV file in message-sized chunks; speed 1 = real time, 0 = as fast as possible"""
+    def __init__(self, path, frames_per_message=4096, speed=0.0):
+        self.path = path
+        self.frames_per_message = frames_per_message
+        self.speed = speed
+        self.wav = None
+        self.channels = 1
+        self.done = False
+        self.started_at = None
+        self.sent = 0
+
+    def start(self):
+        self.wav = wave.open(self.path, 'rb')
+        self.channels = self.wav.getnchannels()
+        self.started_at = time.monotonic()
+
+    def stop(self):
+        if self.wav: self.wav.close()
+        self.wav = None
+        self.done = True
+
+    def read(self, timeout):
+        if self.done: return None
+        pcm = self.wav.readframes(self.frames_per_message)
+        if not pcm:
+            self.stop()
+            return None
+        self.sent += len(pcm) // (2 * self.channels)
+        if self.speed:
+            wait = self.started_at + self.sent / SAMPLE_RATE / self.speed - time.monotonic()
+            if wait > 0: time.sleep(wait)
+        return pcm
+
+    def pending(self):
+        return False
+
+
+class TapStage(Stage):
+    """Calls fn(frame) and passes the frame on (recorder, level meter, logging)"""
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+
+    def process(self, frame):
+        self.fn(frame)
+        return frame
+
+
+class SplitStage(Stage):
+    """DSP: gain, clip, deinterleave and RMS (channel_dsp.ChannelSplitter)"""
+    name = 'split'
+
+    def __init__(self, channels, gain=1.0, frame_len=SAMPLE_RATE // 50):
+        self.dsp = ChannelSplitter(channels, gain, frame_len=frame_len)
+
+    def process(self, frame):
+        if not self.dsp.process(frame.pcm): return None
+        frame.channels = [self.dsp.channel(c) for c in range(self.dsp.channels)]
+        frame.rms = self.dsp.rms
+        return frame
+
+
+class RouteStage(Stage):
+    """Winner-takes-all between channels: per 20 ms frame (FrameRouter) or per message"""
+    name = 'route'
+
+    def __init__(self, split, router=None, vad_threshold=500, dominance_ratio=1.05):
+        self.dsp = split.dsp
+        self.router = router
+        self.vad_threshold = vad_threshold
+        self.dominance_ratio = dominance_ratio
+
+    def process(self, frame):
+        if self.router:
+            self.router.route(self.dsp)  # Losing frames zeroed in place; the views already see it
+            return frame
+        # Per message: all quiet -> nobody (Noise Gate); otherwise every channel within
+        # dominance_ratio of the loudest (one winner, or several at similar volume)
+        loudest = frame.rms.max()
+        for c in range(len(frame.channels)):
+            if loudest < self.vad_threshold or frame.rms[c] * self.dominance_ratio < loudest:
+                frame.channels[c] = self.dsp.silence()
+        return frame
+
+
+class GateStage(Stage):
+    """Passes a branch's message on only while its channel RMS is at or above the threshold"""
+    name = 'gate'
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+    def process(self, frame):
+        return frame if frame.rms[frame.channel] >= self.threshold else None
+
+
+class Fanout(Stage):
+    """Runs one branch of stages per channel; several branches may read the same channel"""
+    name = 'fanout'
+
+    def __init__(self, branches):
+        self.branches = branches  # [(label, channel index, [stages])]
+
+    def bind(self, pipeline, **labels):
+        for label, _, stages in self.branches:
+            for stage in stages: stage.bind(pipeline, channel=label)
+
+    def run(self, frame):
+        for _, channel, stages in self.branches:
+            frame.channel = channel
+            frame.audio = frame.channels[channel] if frame.channels else frame.pcm
+            for stage in stages:
+                if stage.run(frame) is None: break
+        return frame
+
+
+class SegmentStage(Stage):
+    """VAD + segmentation on the sample clock (segmenter.VoiceSegmenter); closed segments go to on_segment"""
+    name = 'segment'
+
+    def __init__(self, segmenter, on_segment, idle_flush=1.0):
+        self.segmenter = segmenter
+        self.on_segment = on_segment
+        self.idle_flush = idle_flush
+        self.last_input = time.time()
+
+    def process(self, frame):
+        self.last_input = time.time()
+        for segment in self.segmenter.feed(frame.audio):
+            self.on_segment(segment)
+        return frame
+
+    def on_idle(self, frame):
+        # Client stopped sending mid-utterance (tab hidden, network stall): close the open segment
+        if self.segmenter.in_segment and time.time() - self.last_input > self.idle_flush: self.on_flush(frame)
+        return frame
+
+    def on_flush(self, frame):
+        for segment in self.segmenter.flush():
+            self.on_segment(segment)
+        return frame
+
+
+class StreamStage(Stage):
+    """gRPC recognizer (grpc_stream.StreamingRecognizer): Clova end-points the continuous audio"""
+    name = 'stream'
+
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+
+    def process(self, frame):
+        # The recognizer sends from its own thread: copy views of reused buffers (bytes pass as-is)
+        self.recognizer.feed(bytes(frame.audio))
+        return frame
+
+
+class Pipeline:
+    """source -> stages on one worker thread; stop() drains what the source already holds, then flushes"""
+    def __init__(self, name, source, stages, poll=0.1):
+        self.name = name
+        self.source = source
+        self.stages = stages
+        self.poll = poll
+        self.running = False
+        self.thread = None
+        self.sample_pos = 0  # Samples per channel consumed since the pipeline started
+        for stage in stages: stage.bind(name)
+
+    def describe(self):
+        parts = []
+        for stage in self.stages:
+            if isinstance(stage, Fanout):
+                parts.append('{' + ' | '.join(f"{label}: " + ' -> '.join(s.name for s in stages)
+                                              for label, _, stages in stage.branches) + '}')
+            else: parts.append(stage.name)
+        return ' -> '.join(parts)
+
+    def start(self):
+        print(f"🎧 [{self.name}] {self.describe()}")
+        self.running = True
+        self.source.start()
+        self.thread = threading.Thread(target=self.run, name=f"pipeline-{self.name}", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=1.0):
+        self.running = False
+        self.source.stop()
+        if self.thread and self.thread is not threading.current_thread(): self.thread.join(timeout=timeout)
+
+    def run(self):
+        """Worker loop; also callable directly (e.g. a FileSource run to the end)"""
+        self.running = True
+        while (self.running and not self.source.done) or self.source.pending():
+            pcm = self.source.read(self.poll)
+            if pcm is None:
+                self._run(Frame(control='idle'))
+                continue
+            frame = Frame(pcm, self.sample_pos)
+            frame.samples = len(pcm) // (2 * self.source.channels)
+            self.sample_pos += frame.samples
+            self._run(frame)
+        self._run(Frame(control='flush'))
+        self.running = False
+
+    def _run(self, frame):
+        for stage in self.stages:
+            try:
+                frame = stage.run(frame)
+            except Exception as e:
+                print(f"⚠️ [{self.name}] {stage.name} error: {e}")
+                return
+            if frame is None: return
+
+    def stats(self):
+        """Per-stage timing from the shared histogram (this pipeline only)"""
+        return {key: value for key, value in STAGE_SECONDS.snapshot().items() if f'pipeline="{self.name}"' in key}
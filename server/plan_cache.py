@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Treatment Plan Cache
+Content-addressed cache for generated treatment plans, keyed on the
+normalized transcript, patient name, provider and prompt version.
+LRU-bounded with a TTL, and persisted to a JSON file next to the server.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+CACHE_FILE = os.path.join(os.path.dirname(__file__), 'plan_cache.json')
+MAX_ENTRIES = int(os.getenv('PLAN_CACHE_SIZE', 256))
+TTL = float(os.getenv('PLAN_CACHE_TTL', 7 * 24 * 3600))  # Seconds
+
+
+def normalize_transcript(text):
+    # Same consultation re-sent with different spacing/line breaks/Unicode form hits the same entry
+    return ' '.join(unicodedata.normalize('NFC', text or '').split())
+
+
+def plan_key(transcript, patient_name, provider, prompt_version):
+    raw = json.dumps([prompt_version, provider, (patient_name or '').strip(), normalize_transcript(transcript)],
+                     ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class PlanCache:
+    """key -> plan text, with size/TTL eviction and hit/miss counters"""
+    def __init__(self, path=CACHE_FILE, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # One writer of the .tmp file at a time (put() runs on worker threads)
+        self.entries = OrderedDict()  # key -> (created, plan), oldest use first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load()
+
+    def load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                now = time.time()
+                for key, created, plan in saved.get('entries', []):
+                    if now - created < self.ttl: self.entries[key] = (created, plan)
+                while len(self.entries) > self.max_entries: self.entries.popitem(last=False)
+                print(f"🗃️ Loaded {len(self.entries)} cached treatment plans")
+        except Exception as e:
+            print(f"⚠️ Failed to load plan cache: {e}")
+
+    def save(self):
+        with self.save_lock:
+            # Snapshot under the write lock too, so the last file written holds the newest entries
+            with self.lock:
+                entries = [[key, created, plan] for key, (created, plan) in self.entries.items()]
+            try:
+                tmp = self.path + '.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump({'entries': entries}, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except Exception as e:
+                print(f"⚠️ Failed to save plan cache: {e}")
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry[0] >= self.ttl:
+                del self.entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, plan):
+        """Store and persist (blocking file write; call off the event loop)"""
+        with self.lock:
+            self.entries[key] = (time.time(), plan)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        self.save()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+            }
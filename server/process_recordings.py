@@ -4,8 +4,10 @@ import time
 import shutil
 import requests
 import subprocess
+import wave
 import imageio_ffmpeg
 from dotenv import load_dotenv
+from resilience import UploadSpool, breaker_for, post_with_retry, RETRYABLE_STATUS, TRANSIENT_ERRORS, SPOOL_DIR
 
 load_dotenv()
 
@@ -13,7 +15,9 @@ load_dotenv()
 RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), 'recordings')
 TRANSCRIPTS_DIR = os.path.join(os.path.dirname(__file__), 'transcripts')
 SECRET_KEY = os.getenv('CLOVA_SPEECH_SECRET')
-INVOKE_URL = os.getenv('CLOVA_SPEECH_INVOKE_URL')
+INVOKE_URL = os.getenv('CLOVA_UPLOAD_URL') or os.getenv('CLOVA_SPEECH_INVOKE_URL')  # CLOVA_UPLOAD_URL: e.g. mock_clova.py
+
+CHUNK_ATTEMPTS = 4  # Tries per chunk (jittered backoff) before it is spooled for the next run
 
 if not SECRET_KEY:
     print("❌ Error: CLOVA_SPEECH_SECRET not found in .env")
@@ -22,6 +26,15 @@ if not SECRET_KEY:
 def get_ffmpeg_exe():
     return imageio_ffmpeg.get_ffmpeg_exe()
 
+def is_transcribable_wav(path):
+    """True for 16kHz mono 16-bit PCM WAV (e.g. relay session recordings), which needs no conversion"""
+    if not path.lower().endswith('.wav'): return False
+    try:
+        with wave.open(path, 'rb') as w:
+            return w.getframerate() == 16000 and w.getnchannels() == 1 and w.getsampwidth() == 2
+    except Exception:
+        return False
+
 def convert_to_wav(input_path):
     """Convert audio file to WAV format (16kHz, mono) using ffmpeg directly"""
     try:
@@ -95,40 +108,97 @@ def load_boostings():
     return boostings
 
 BOOSTINGS = load_boostings()
+BREAKER = breaker_for(INVOKE_URL)
+# Chunks that failed during an outage; drained at the start and end of each run
+SPOOL = UploadSpool(os.path.join(SPOOL_DIR, 'batch'), name="batch-spool")
 
-def transcribe_chunk(file_path):
-    """Transcribe a single chunk"""
+def transcribe_media(media, name):
+    """Transcribe WAV bytes. Returns (result, retry_later); result is None on failure"""
     headers = {'X-CLOVASPEECH-API-KEY': SECRET_KEY}
     
     try:
-        with open(file_path, 'rb') as f:
-            files = {
-                'media': f,
-                'params': (None, json.dumps({
-                    'language': 'ko-KR',
-                    'completion': 'sync',
-                    'wordAlignment': False,
-                    'fullText': True,
-                    'boostings': BOOSTINGS
-                }), 'application/json')
-            }
-            
-            response = requests.post(f"{INVOKE_URL}/recognizer/upload", headers=headers, files=files, timeout=30)
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(f"❌ API Error ({os.path.basename(file_path)}): {response.text[:100]}...")
-                return None
+        files = {
+            'media': (name, media, 'audio/wav'),
+            'params': (None, json.dumps({
+                'language': 'ko-KR',
+                'completion': 'sync',
+                'wordAlignment': False,
+                'fullText': True,
+                'boostings': BOOSTINGS
+            }), 'application/json')
+        }
+        
+        response = post_with_retry(requests, f"{INVOKE_URL}/recognizer/upload", BREAKER, CHUNK_ATTEMPTS,
+                                   base_delay=1.0, max_delay=30.0, headers=headers, files=files, timeout=30)
+        
+        if response.status_code == 200:
+            return response.json(), False
+        else:
+            print(f"❌ API Error ({name}): {response.text[:100]}...")
+            return None, response.status_code in RETRYABLE_STATUS
     except Exception as e:
-        print(f"❌ Request failed ({os.path.basename(file_path)}): {e}")
-        return None
+        print(f"❌ Request failed ({name}): {e}")
+        return None, isinstance(e, TRANSIENT_ERRORS)
+
+def transcribe_chunk(file_path):
+    """Transcribe a single chunk"""
+    with open(file_path, 'rb') as f:
+        return transcribe_media(f.read(), os.path.basename(file_path))
+
+def assemble(result):
+    """Rebuild text and offset segments from the per-chunk results, in chunk order"""
+    texts, segments = [], []
+    for chunk in sorted(result['chunks'], key=lambda c: c['index']):
+        if chunk.get('text'): texts.append(chunk['text'])
+        for seg in chunk.get('segments', []):
+            new_seg = seg.copy()
+            new_seg['start'] += chunk['offset_ms']
+            new_seg['end'] += chunk['offset_ms']
+            segments.append(new_seg)
+    result['text'] = " ".join(texts)
+    result['segments'] = segments
+    return result
+
+def transcript_paths(filename):
+    base = os.path.join(TRANSCRIPTS_DIR, os.path.splitext(filename)[0])
+    return base + ".json", base + ".txt"
+
+def save_transcript(filename, result):
+    output_json_path, output_txt_path = transcript_paths(filename)
+    with open(output_json_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    with open(output_txt_path, 'w', encoding='utf-8') as f:
+        f.write(result.get('text', ''))
+    return output_txt_path
+
+def drain_spooled(media, meta):
+    """Re-send one spooled chunk and patch it into its transcript; True once it needs no further attempts"""
+    result, retry_later = transcribe_media(media, f"{meta['source']}#{meta['index']}")
+    if result is None: return not retry_later
+    output_json_path, _ = transcript_paths(meta['source'])
+    try:
+        with open(output_json_path, 'r', encoding='utf-8') as f:
+            transcript = json.load(f)
+    except (OSError, ValueError):
+        print(f"⚠️ No transcript for {meta['source']}; dropping recovered chunk {meta['index']}")
+        return True
+    transcript['chunks'] = [c for c in transcript.get('chunks', []) if c['index'] != meta['index']] + [
+        {'index': meta['index'], 'offset_ms': meta['offset_ms'], 'text': result.get('text', ''),
+         'segments': result.get('segments', [])}]
+    transcript['pending_chunks'] = [i for i in transcript.get('pending_chunks', []) if i != meta['index']]
+    save_transcript(meta['source'], assemble(transcript))
+    print(f"📦 Recovered chunk {meta['index'] + 1} of {meta['source']} ({len(transcript['pending_chunks'])} still pending)")
+    return True
 
 def process_file(file_path):
     print(f"\n🎬 Processing {os.path.basename(file_path)}...")
     
-    # 1. Convert to WAV
-    wav_path = convert_to_wav(file_path)
+    # 1. Convert to WAV (relay recordings are already 16kHz mono)
+    if is_transcribable_wav(file_path):
+        print(f"⏩ {os.path.basename(file_path)} is already 16kHz mono WAV, skipping conversion")
+        wav_path = file_path
+    else:
+        wav_path = convert_to_wav(file_path)
     if not wav_path: return None
     
     # 2. Split into chunks
@@ -136,28 +206,24 @@ def process_file(file_path):
     chunks, chunk_dir = split_audio(wav_path, segment_time=segment_time)
     if not chunks: return None
     
-    full_text = ""
-    all_segments = []
+    chunk_results = []
+    pending = []
     print(f"🚀 Transcribing {len(chunks)} chunks...")
     
     for i, chunk_path in enumerate(chunks):
         print(f"  - Chunk {i+1}/{len(chunks)}...", end='\r')
-        result = transcribe_chunk(chunk_path)
+        time_offset = i * segment_time * 1000 # Convert to ms
+        result, retry_later = transcribe_chunk(chunk_path)
         if result:
-            # Append text
-            if result.get('text'):
-                full_text += result.get('text') + " "
-            
-            # Append segments with offset
-            if result.get('segments'):
-                time_offset = i * segment_time * 1000 # Convert to ms
-                for seg in result.get('segments'):
-                    new_seg = seg.copy()
-                    new_seg['start'] += time_offset
-                    new_seg['end'] += time_offset
-                    all_segments.append(new_seg)
+            chunk_results.append({'index': i, 'offset_ms': time_offset, 'text': result.get('text', ''),
+                                  'segments': result.get('segments') or []})
+        elif retry_later:
+            # Keep the chunk with its position so the transcript can be completed later
+            with open(chunk_path, 'rb') as f:
+                meta = {'source': os.path.basename(file_path), 'index': i, 'chunks': len(chunks), 'offset_ms': time_offset}
+                if SPOOL.put(f.read(), meta): pending.append(i)
                     
-        time.sleep(0.5) # Rate limit prevention
+        if BREAKER.stats()['state'] != 'open': time.sleep(0.5) # Rate limit prevention
     
     print(f"\n✅ Transcription complete for {os.path.basename(file_path)}")
     
@@ -167,7 +233,8 @@ def process_file(file_path):
     if wav_path != file_path and os.path.exists(wav_path): # Don't delete original if it was wav
         os.remove(wav_path)
         
-    return {"text": full_text.strip(), "segments": all_segments}
+    if pending: print(f"📦 {len(pending)} chunks spooled until the API recovers")
+    return assemble({"chunks": chunk_results, "pending_chunks": pending})
 
 def main():
     if not os.path.exists(TRANSCRIPTS_DIR):
@@ -180,11 +247,12 @@ def main():
         return
 
     print(f"Found {len(files)} files to process.")
+    # Chunks left over from an earlier outage first
+    SPOOL.drain_once(drain_spooled)
 
     for filename in files:
         file_path = os.path.join(RECORDINGS_DIR, filename)
-        output_json_path = os.path.join(TRANSCRIPTS_DIR, f"{os.path.splitext(filename)[0]}.json")
-        output_txt_path = os.path.join(TRANSCRIPTS_DIR, f"{os.path.splitext(filename)[0]}.txt")
+        output_json_path, _ = transcript_paths(filename)
 
         if os.path.exists(output_json_path):
             print(f"⏭️ Skipping {filename} (already processed)")
@@ -192,18 +260,14 @@ def main():
 
         result = process_file(file_path)
         
-        if result and result.get('text'):
-            # Save JSON
-            with open(output_json_path, 'w', encoding='utf-8') as f:
-                json.dump(result, f, ensure_ascii=False, indent=2)
-            
-            # Save TXT
-            with open(output_txt_path, 'w', encoding='utf-8') as f:
-                f.write(result.get('text', ''))
-            
+        if result and (result.get('text') or result.get('pending_chunks')):
+            output_txt_path = save_transcript(filename, result)
             print(f"💾 Saved transcript to {output_txt_path}")
         else:
             print(f"⚠️ Failed to transcribe {filename}")
 
+    if SPOOL.items() and not SPOOL.drain_once(drain_spooled):
+        print(f"📦 {len(SPOOL.items())} chunks still spooled; run again once the API recovers")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Relay Upload Spool
+The relays' side of resilience.UploadSpool: segments whose upload failed
+transiently are kept on disk with their log, seq and sample span, and a
+drainer thread re-sends them once the endpoint recovers. A recovered line
+is appended to its transcript log and, while its recording is still live,
+handed to that recording's OrderedDelivery under its original seq.
+"""
+
+import os
+import time
+import requests
+
+from resilience import UploadSpool, breaker_for, post_with_retry, RETRYABLE_STATUS, SPOOL_DIR
+from timeline import span_fields
+import metrics
+
+SAMPLE_RATE = 16000
+
+
+class RelaySpool:
+    """Breaker, spool directory and drainer for one relay's /recognizer/upload endpoint"""
+    def __init__(self, name, invoke_url, secret_key, encoder, transcript_log, correct=None, delivery_for=None):
+        self.url = f"{invoke_url}/recognizer/upload"
+        self.secret_key = secret_key
+        self.encoder = encoder
+        self.transcript_log = transcript_log
+        self.correct = correct or (lambda text: text)     # raw -> displayed text
+        self.delivery_for = delivery_for or (lambda meta: None)  # meta -> live OrderedDelivery, if any
+        # Retries and breaker per endpoint; segments that still fail wait in spool/<name> until it recovers
+        self.breaker = breaker_for(invoke_url)
+        self.spool = UploadSpool(os.path.join(SPOOL_DIR, name), name="clova-spool")
+        self.http = None  # Drainer thread only
+        metrics.REGISTRY.gauge('clova_spool_pending', 'Failed segments waiting in the on-disk spool',
+                               lambda: self.spool.stats()['pending'])
+        metrics.REGISTRY.gauge('clova_circuit_open', '1 while the upload endpoint breaker is open',
+                               lambda: int(self.breaker.stats()['state'] != 'closed'))
+
+    def put(self, audio, meta):
+        """Keep the audio on disk; meta needs log, seq, speaker, start_sample, end_sample and params"""
+        self.spool.put(bytes(audio), meta)
+        print(f"📦 [{meta.get('station', meta['speaker'])}] #{meta['seq']} Spooled for retry")
+
+    def start(self):
+        self.spool.start_drain(self.send)
+
+    def send(self, audio, meta):
+        """Spool drainer: re-send one stored segment; True once it needs no further attempts"""
+        if self.http is None: self.http = requests.Session()
+        label = meta.get('station', meta['speaker'])
+        media, filename, mime = self.encoder.encode(audio)
+        files = {'media': (filename, media, mime), 'params': (None, meta['params'], 'application/json')}
+        outcome, sent_at = 'exception', time.perf_counter()
+        try:
+            res = post_with_retry(self.http, self.url, self.breaker, 1,
+                                  headers={'X-CLOVASPEECH-API-KEY': self.secret_key}, files=files, timeout=10)
+            outcome = 'http_error'
+            if res.status_code in RETRYABLE_STATUS: return False
+            if res.status_code != 200:
+                print(f"❌ [{label}] #{meta['seq']} Spooled segment rejected {res.status_code}: {res.text}")
+                return True
+            raw = res.json().get('text', '')
+            outcome = 'ok' if raw else 'empty'
+        finally:
+            metrics.record_upload(len(audio) / (2 * SAMPLE_RATE), time.perf_counter() - sent_at, outcome, mode='spool')
+        if not raw: return True
+
+        text = self.correct(raw)
+        print(f"📦 [{label}] #{meta['seq']} Recovered: {text}")
+        # Original seq and sample span, so the log can be put back in order
+        seam = {k: meta[k] for k in ('continues', 'overlap') if k in meta}
+        self.transcript_log.append(meta['log'], {
+            'seq': meta['seq'], 'speaker': meta['speaker'], 'start_sample': meta['start_sample'],
+            'end_sample': meta['end_sample'], 'raw': raw, 'text': text, 'recovered': True, **seam
+        })
+        delivery = self.delivery_for(meta)
+        if delivery:
+            delivery.submit_threadsafe(meta['seq'], {
+                'text': text, 'speaker': meta['speaker'], 'seq': meta['seq'], 'recovered': True,
+                **span_fields(meta['start_sample'], meta['end_sample']), **seam
+            })
+        return True
+
+    def stats(self):
+        return {'spool': self.spool.stats(), 'circuit': self.breaker.stats()}
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Transcript Reorder Stage
+Segments are uploaded in parallel, so a short segment can finish before a
+longer one that started earlier. Results are tagged with a session-scoped
+sequence number and released strictly in order, except that a missing
+sequence number is skipped once a later line has waited max_hold seconds.
+"""
+
+import asyncio
+import time
+
+
+class ReorderBuffer:
+    """Holds out-of-order results until their predecessors arrive (event-loop only)"""
+    def __init__(self, max_hold=3.0, first_seq=0):
+        self.max_hold = max_hold
+        self.next_seq = first_seq
+        self.held = {}  # seq -> (payload, arrived_at)
+        self.skipped = 0
+        self.late = 0
+
+    def push(self, seq, payload, now=None):
+        """Add a result (payload None = segment produced nothing). Returns payloads ready to send."""
+        now = time.monotonic() if now is None else now
+        if seq < self.next_seq:
+            # Its slot was skipped already; deliver late rather than lose it
+            self.late += 1
+            return [payload] if payload is not None else []
+        self.held[seq] = (payload, now)
+        return self._release()
+
+    def expire(self, now=None):
+        """Skip missing sequence numbers once the oldest waiting line exceeds max_hold"""
+        now = time.monotonic() if now is None else now
+        ready = []
+        while self.held and self.next_seq not in self.held:
+            oldest = min(arrived for _, arrived in self.held.values())
+            if now - oldest < self.max_hold: break
+            first = min(self.held)
+            self.skipped += first - self.next_seq
+            self.next_seq = first
+            ready.extend(self._release())
+        return ready
+
+    def next_deadline(self, now=None):
+        """Seconds until expire() would release something, or None if nothing is blocked"""
+        if not self.held: return None
+        now = time.monotonic() if now is None else now
+        oldest = min(arrived for _, arrived in self.held.values())
+        return max(0.0, self.max_hold - (now - oldest))
+
+    def _release(self):
+        ready = []
+        while self.next_seq in self.held:
+            payload, _ = self.held.pop(self.next_seq)
+            self.next_seq += 1
+            if payload is not None: ready.append(payload)
+        return ready
+
+
+class OrderedDelivery:
+    """Event-loop side of the reorder stage: emits released transcripts one after another"""
+    def __init__(self, loop, emit, max_hold=3.0):
+        self.loop = loop
+        self.emit = emit          # async callable(payload)
+        self.buffer = ReorderBuffer(max_hold)
+        self.timer = None
+        self.tail = None          # Last emit task; each emit awaits the previous one
+
+    def submit_threadsafe(self, seq, payload):
+        """Called from upload workers"""
+        self.loop.call_soon_threadsafe(self._push, seq, payload)
+
+    def send_unordered_threadsafe(self, emit, payload):
+        """Emit outside seq order (e.g. partial results), still serialized with ordered lines"""
+        self.loop.call_soon_threadsafe(self._chain, emit, payload)
+
+    def _push(self, seq, payload):
+        self._emit_all(self.buffer.push(seq, payload))
+        self._arm()
+
+    def _expire(self):
+        self.timer = None
+        self._emit_all(self.buffer.expire())
+        self._arm()
+
+    def _arm(self):
+        delay = self.buffer.next_deadline()
+        if delay is None:
+            if self.timer: self.timer.cancel()
+            self.timer = None
+        elif self.timer is None:
+            self.timer = self.loop.call_later(delay, self._expire)
+
+    def _emit_all(self, payloads):
+        for payload in payloads:
+            self._chain(self.emit, payload)
+
+    def _chain(self, emit, payload):
+        self.tail = self.loop.create_task(self._emit_after(self.tail, emit, payload))
+
+    async def _emit_after(self, previous, emit, payload):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        await emit(payload)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Upload Resilience
+Retries with full-jitter exponential backoff, a circuit breaker per
+endpoint, and a bounded on-disk spool that keeps audio which could not be
+recognized during an outage and re-sends it once the endpoint recovers.
+Spooled items carry their ordering metadata (log, seq, sample offsets or
+chunk index) so transcripts can be reassembled afterwards. An item whose
+re-send keeps failing for a reason other than the endpoint being down
+(unparseable response, broken metadata) is moved to failed/ after
+SPOOL_MAX_ATTEMPTS tries so the items behind it keep draining.
+"""
+
+import os
+import json
+import time
+import random
+import threading
+import requests
+
+SPOOL_DIR = os.getenv('CLOVA_SPOOL_DIR', os.path.join(os.path.dirname(__file__), 'spool'))
+SPOOL_MAX_BYTES = int(os.getenv('CLOVA_SPOOL_MAX_MB', 512)) * 1024 * 1024
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+FAILURE_THRESHOLD = 5   # Consecutive failures that open a breaker
+RESET_TIMEOUT = 15.0    # Seconds a breaker stays open before one trial request
+DRAIN_INTERVAL = 2.0    # Seconds between spool drain attempts while the endpoint is down
+SPOOL_MAX_ATTEMPTS = int(os.getenv('CLOVA_SPOOL_MAX_ATTEMPTS', 5))  # Non-network failures before an item is set aside
+
+
+class CircuitOpenError(Exception):
+    """The endpoint's breaker is open; the request was not sent"""
+
+
+# Failures worth retrying and spooling: the endpoint may recover. Not a bad URL or header
+# (MissingSchema, InvalidURL, InvalidHeader) or a 4xx for a bad request, which never will
+NETWORK_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+TRANSIENT_ERRORS = NETWORK_ERRORS + (CircuitOpenError,)
+
+
+def backoff(attempt, base=0.25, cap=4.0):
+    """Full jitter: uniform in [0, min(cap, base * 2^attempt)]"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half-open trial after reset_timeout"""
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.opens = 0
+
+    def allow(self):
+        with self.lock:
+            if self.state == 'closed': return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self.trial_in_flight = False
+            if self.state == 'half_open' and not self.trial_in_flight:
+                self.trial_in_flight = True  # Exactly one probe request
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            if self.state != 'closed': print(f"🟢 Circuit {self.name} closed")
+            self.state = 'closed'
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                if self.state == 'closed': print(f"🔴 Circuit {self.name} open after {self.failures} failures")
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+                self.opens += 1
+
+    def stats(self):
+        with self.lock:
+            return {'state': self.state, 'consecutive_failures': self.failures, 'opens': self.opens}
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(endpoint):
+    """One shared breaker per endpoint URL"""
+    with _breakers_lock:
+        if endpoint not in _breakers: _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+
+def post_with_retry(http, url, breaker=None, attempts=3, base_delay=0.25, max_delay=4.0, **kwargs):
+    """POST with backoff on timeouts, connection errors and retryable statuses (Retry-After honored).
+    Returns the final response, which may be non-200; raises the last network error or CircuitOpenError.
+    Request bodies must be re-sendable (bytes, not open files)."""
+    for attempt in range(attempts):
+        if breaker and not breaker.allow(): raise CircuitOpenError(breaker.name)
+        last = attempt == attempts - 1
+        try:
+            res = http.post(url, **kwargs)
+        except NETWORK_ERRORS:
+            if breaker: breaker.failure()
+            if last: raise
+            time.sleep(backoff(attempt, base_delay, max_delay))
+            continue
+        if res.status_code not in RETRYABLE_STATUS:
+            if breaker: breaker.success()  # The endpoint answered; 4xx is the request's fault
+            return res
+        if breaker: breaker.failure()
+        if last: return res
+        delay = backoff(attempt, base_delay, max_delay)
+        try: delay = max(delay, min(max_delay, float(res.headers.get('Retry-After', 0))))
+        except ValueError: pass
+        time.sleep(delay)
+
+
+class UploadSpool:
+    """Bounded directory of <id>.bin payloads with <id>.json metadata, drained oldest first"""
+    def __init__(self, directory=SPOOL_DIR, max_bytes=SPOOL_MAX_BYTES, name="spool", max_attempts=SPOOL_MAX_ATTEMPTS):
+        self.directory = directory
+        self.failed_dir = os.path.join(directory, 'failed')
+        self.max_bytes = max_bytes
+        self.max_attempts = max_attempts
+        self.name = name
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.spooled = 0
+        self.drained = 0
+        self.rejected = 0
+        self.failed = 0
+        self.thread = None
+        self.running = False
+        os.makedirs(directory, exist_ok=True)
+        self.bytes = sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory) if f.endswith('.bin'))
+        if self.items(): print(f"📦 {self.name}: {len(self.items())} spooled uploads waiting")
+
+    def put(self, payload, meta):
+        """Persist one failed upload; False (and counted) if the spool is full"""
+        with self.lock:
+            if self.bytes + len(payload) > self.max_bytes:
+                self.rejected += 1
+                print(f"⚠️ {self.name} full ({self.bytes / 1e6:.0f} MB), dropping {meta}")
+                return False
+            self.counter += 1
+            item_id = f"{time.time_ns():020d}-{self.counter:06d}"
+            self.bytes += len(payload)
+        path = os.path.join(self.directory, item_id)
+        with open(path + '.bin', 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        # Metadata last: an item without .json is incomplete and ignored
+        self.write_meta(item_id, {**meta, 'spooled_at': time.time()})
+        with self.lock: self.spooled += 1
+        return True
+
+    def write_meta(self, item_id, meta):
+        path = os.path.join(self.directory, item_id)
+        with open(path + '.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(path + '.json.tmp', path + '.json')
+
+    def items(self):
+        """[(item_id, meta)] oldest first"""
+        out = []
+        for name in sorted(f for f in os.listdir(self.directory) if f.endswith('.json')):
+            try:
+                with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                    out.append((name[:-5], json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return out
+
+    def load(self, item_id):
+        with open(os.path.join(self.directory, item_id + '.bin'), 'rb') as f:
+            return f.read()
+
+    def remove(self, item_id):
+        path = os.path.join(self.directory, item_id)
+        try:
+            size = os.path.getsize(path + '.bin')
+            os.remove(path + '.json')
+            os.remove(path + '.bin')
+        except OSError:
+            return
+        with self.lock:
+            self.bytes -= size
+            self.drained += 1
+
+    def set_aside(self, item_id, meta):
+        """Move an item that keeps failing to failed/ (kept for inspection, out of the queue)"""
+        path = os.path.join(self.directory, item_id)
+        os.makedirs(self.failed_dir, exist_ok=True)
+        try:
+            size = os.path.getsize(path + '.bin')
+            os.replace(path + '.bin', os.path.join(self.failed_dir, item_id + '.bin'))
+        except OSError:
+            size = 0
+        self.write_meta(item_id, meta)
+        os.replace(path + '.json', os.path.join(self.failed_dir, item_id + '.json'))
+        with self.lock:
+            self.bytes -= size
+            self.failed += 1
+
+    def drain_once(self, send):
+        """send(payload, meta) -> True when handled (stop keeping it), False to keep and retry later"""
+        for item_id, meta in self.items():
+            try:
+                handled = send(self.load(item_id), meta)
+            except CircuitOpenError:
+                return False
+            except NETWORK_ERRORS as e:
+                print(f"⚠️ {self.name} drain failed: {e}")
+                return False
+            except Exception as e:
+                # Not the endpoint being down: this item itself may never succeed
+                attempts = meta.get('attempts', 0) + 1
+                meta = {**meta, 'attempts': attempts, 'error': str(e)}
+                print(f"⚠️ {self.name} drain failed ({attempts}/{self.max_attempts}) for {item_id}: {e}")
+                if attempts < self.max_attempts:
+                    self.write_meta(item_id, meta)
+                    return False
+                print(f"🗑️ {self.name}: {item_id} moved to failed/")
+                self.set_aside(item_id, meta)
+                continue
+            if not handled: return False
+            self.remove(item_id)
+        return True
+
+    def start_drain(self, send, interval=DRAIN_INTERVAL):
+        """Background thread re-sending spooled items in order"""
+        if self.thread: return
+        self.running = True
+        def run():
+            while self.running:
+                if self.items() and self.drain_once(send):
+                    print(f"📦 {self.name} drained")
+                time.sleep(interval)
+        self.thread = threading.Thread(target=run, daemon=True, name=f"{self.name}-drain")
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        with self.lock:
+            return {'bytes': self.bytes, 'spooled': self.spooled, 'drained': self.drained, 'rejected': self.rejected,
+                    'failed': self.failed,
+                    'pending': len([f for f in os.listdir(self.directory) if f.endswith('.json')])}
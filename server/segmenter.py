@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Voice Segmenter
+Frame-level energy VAD that opens and closes segments on the audio's own
+sample clock, so silence is measured in samples rather than by message
+arrival time (the browser streams PCM continuously, silence included).
+An optional AdaptiveTiming receives every pause and utterance length and
+supplies the silence timeout and max duration in return.
+
+Forced cuts (max duration) can land at the quietest frame of the last
+cut_search_ms and repeat overlap_ms of audio at the start of the next
+segment, so a word split by the cut is heard whole at least once; the
+repeated words are removed from the text by stitcher.py.
+
+A preallocated ring of the last preroll_ms of idle audio is prepended when
+a segment opens, so the onset before the first voiced frame is kept.
+"""
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_MS = 20
+
+
+class Segment:
+    """One closed utterance: PCM bytes plus its position on the session sample clock"""
+    def __init__(self, audio, start_sample, speech_samples, reason, sample_rate=SAMPLE_RATE, overlap_samples=0):
+        self.audio = audio
+        self.start_sample = start_sample
+        self.end_sample = start_sample + len(audio) // 2
+        self.speech_samples = speech_samples
+        self.reason = reason  # 'silence', 'force' or 'flush'
+        self.sample_rate = sample_rate
+        self.overlap_samples = overlap_samples  # Leading audio repeated from the previous (force-cut) segment
+
+    @property
+    def overlap(self):
+        return self.overlap_samples / self.sample_rate
+
+    @property
+    def start(self):
+        return self.start_sample / self.sample_rate
+
+    @property
+    def end(self):
+        return self.end_sample / self.sample_rate
+
+    @property
+    def duration(self):
+        return (self.end_sample - self.start_sample) / self.sample_rate
+
+
+class VoiceSegmenter:
+    """Cuts a continuous mono Int16 stream into speech segments"""
+    def __init__(self, threshold, silence_timeout, max_duration, sample_rate=SAMPLE_RATE,
+                 frame_ms=FRAME_MS, min_speech_ms=100, hangover_ms=300, timing=None, overlap_ms=0, cut_search_ms=0,
+                 preroll_ms=0):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.frame_len = sample_rate * frame_ms // 1000
+        self.silence_samples = int(silence_timeout * sample_rate)
+        self.max_samples = int(max_duration * sample_rate)
+        self.min_speech_samples = sample_rate * min_speech_ms // 1000
+        self.hangover_samples = sample_rate * hangover_ms // 1000
+        self.overlap_frames = overlap_ms // frame_ms
+        self.cut_search_frames = cut_search_ms // frame_ms
+        # Pre-roll ring: written in place frame by frame, never reallocated
+        self.preroll_frames = preroll_ms // frame_ms
+        self.ring = np.zeros(self.preroll_frames * self.frame_len, dtype=np.int16)
+        self.ring_rms = np.zeros(self.preroll_frames, dtype=np.float32)
+        self.ring_pos = 0   # Next frame slot
+        self.ring_fill = 0  # Idle frames held (only audio after the last segment)
+
+        self.sample_pos = 0          # Samples consumed since the session started
+        self.remainder = b''         # Partial frame carried to the next feed
+        self.buffer = bytearray()
+        self.in_segment = False
+        self.seg_start = 0
+        self.silence_run = 0
+        self.speech_samples = 0
+        self.last_rms = 0.0
+        self.frame_rms = []          # Per buffered frame, for choosing a forced cut point
+        self.overlap_samples = 0     # Head of the open segment repeated from the previous one
+
+        self.timing = timing
+        self.gap_run = None          # Unvoiced samples since the last voiced frame (None before any speech)
+        self.utterance_start = None  # Survives forced cuts, so utterance lengths are not capped at max duration
+        if timing: self._apply_timing()
+
+    def _apply_timing(self):
+        self.silence_samples = int(self.timing.silence_timeout * self.sample_rate)
+        self.max_samples = int(self.timing.max_duration * self.sample_rate)
+
+    def feed(self, pcm):
+        """Consume PCM bytes and return any segments that closed"""
+        data = self.remainder + pcm if self.remainder else pcm
+        frame_bytes = self.frame_len * 2
+        n_frames = len(data) // frame_bytes
+        used = n_frames * frame_bytes
+        self.remainder = bytes(data[used:])
+        if not n_frames: return []
+
+        frames = np.frombuffer(data, dtype=np.int16, count=used // 2).reshape(n_frames, self.frame_len)
+        f = frames.astype(np.float32)
+        rms = np.sqrt(np.einsum('ij,ij->i', f, f) / self.frame_len)
+        voiced = rms >= self.threshold
+        self.last_rms = float(rms[-1])
+
+        closed = []
+        mv = memoryview(data)
+        for i in range(n_frames):
+            frame = mv[i * frame_bytes:(i + 1) * frame_bytes]
+            if self.timing:
+                if not voiced[i]:
+                    if self.gap_run is not None: self.gap_run += self.frame_len
+                else:
+                    if self.gap_run: self._observe_pause()
+                    self.gap_run = 0
+            if not self.in_segment:
+                if voiced[i]:
+                    self.in_segment = True
+                    self.seg_start = self.sample_pos
+                    self.silence_run = 0
+                    self.speech_samples = 0
+                    if self.ring_fill: self._prepend_preroll()
+                    if self.utterance_start is None: self.utterance_start = self.seg_start
+                else:
+                    if self.preroll_frames: self._remember(frames[i], rms[i])
+                    self.sample_pos += self.frame_len
+                    continue
+
+            self.buffer.extend(frame)
+            self.frame_rms.append(rms[i])
+            self.sample_pos += self.frame_len
+            if voiced[i]:
+                self.silence_run = 0
+                self.speech_samples += self.frame_len
+            else:
+                self.silence_run += self.frame_len
+
+            if self.silence_run >= self.silence_samples:
+                seg = self._close('silence')
+                if seg: closed.append(seg)
+            elif len(self.buffer) // 2 >= self.max_samples:
+                seg = self._force_cut()
+                if seg: closed.append(seg)
+        return closed
+
+    def flush(self):
+        """Close any open segment (stop, or the client stopped sending)"""
+        if not self.in_segment: return []
+        seg = self._close('flush')
+        return [seg] if seg else []
+
+    def horizon(self):
+        """Earliest sample a segment that has not closed yet can start at (pre-roll included)"""
+        if self.in_segment: return self.seg_start
+        return self.sample_pos - self.preroll_frames * self.frame_len
+
+    def _remember(self, frame, rms):
+        slot = self.ring_pos * self.frame_len
+        self.ring[slot:slot + self.frame_len] = frame
+        self.ring_rms[self.ring_pos] = rms
+        self.ring_pos = (self.ring_pos + 1) % self.preroll_frames
+        if self.ring_fill < self.preroll_frames: self.ring_fill += 1
+
+    def _prepend_preroll(self):
+        """Open the segment with the held idle frames, oldest first"""
+        n, size = self.ring_fill, self.preroll_frames
+        first = (self.ring_pos - n) % size
+        for lo, hi in ((first, min(first + n, size)), (0, max(0, first + n - size))):
+            if hi > lo:
+                self.buffer += memoryview(self.ring[lo * self.frame_len:hi * self.frame_len])
+                self.frame_rms.extend(self.ring_rms[lo:hi].tolist())
+        self.seg_start -= n * self.frame_len
+        self.ring_fill = 0
+
+    def _observe_pause(self):
+        self.timing.pause(self.gap_run / self.sample_rate)
+        self._apply_timing()
+
+    def _force_cut(self):
+        """Cut after the quietest recent frame; the next segment restarts overlap_frames before the cut"""
+        n = len(self.frame_rms)
+        search = min(self.cut_search_frames, n - 1)
+        cut = n - search + int(np.argmin(self.frame_rms[n - search:])) + 1 if search > 0 else n
+        resume = max(cut - self.overlap_frames, cut // 2)  # Always make progress
+        frame_bytes = self.frame_len * 2
+        tail, tail_rms = self.buffer[resume * frame_bytes:], self.frame_rms[resume:]
+        start = self.seg_start
+
+        self.buffer = self.buffer[:cut * frame_bytes]
+        self.speech_samples = self.frame_len * sum(1 for r in self.frame_rms[:cut] if r >= self.threshold)
+        seg = self._close('force')
+        if tail:
+            # The utterance goes on: the rest of the buffer opens the next segment
+            self.in_segment = True
+            self.buffer = bytearray(tail)
+            self.frame_rms = list(tail_rms)
+            self.seg_start = start + resume * self.frame_len
+            self.overlap_samples = (cut - resume) * self.frame_len
+            self.speech_samples = self.frame_len * sum(1 for r in tail_rms if r >= self.threshold)
+            for r in reversed(tail_rms):
+                if r >= self.threshold: break
+                self.silence_run += self.frame_len
+        return seg
+
+    def _close(self, reason):
+        audio = self.buffer
+        if reason != 'force':
+            # Keep a short tail after the last voiced frame, drop the rest of the silence
+            trailing = max(0, self.silence_run - self.hangover_samples)
+            if trailing: audio = audio[:len(audio) - trailing * 2]
+
+        speech = self.speech_samples
+        start = self.seg_start
+        overlap = self.overlap_samples
+        self.buffer = bytearray()
+        self.frame_rms = []
+        self.in_segment = False
+        self.silence_run = 0
+        self.speech_samples = 0
+        self.overlap_samples = 0
+
+        if reason != 'force' and self.utterance_start is not None:
+            if self.timing and (speech >= self.min_speech_samples or self.utterance_start < start):
+                self.timing.utterance((start + len(audio) // 2 - self.utterance_start) / self.sample_rate)
+                self._apply_timing()
+            self.utterance_start = None
+
+        # Never upload pure silence / clicks
+        if speech < self.min_speech_samples: return None
+        return Segment(bytes(audio), start, speech, reason, self.sample_rate, overlap)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Session Recorder
+Archives live relay audio into server/recordings as 16 kHz mono 16-bit WAV
+(one file per channel), the layout process_recordings.py reads directly.
+Writes happen on a background thread into a preallocated file that grows
+in large steps; the WAV header is patched periodically so a crash leaves
+a playable .part file, and the file is renamed to .wav when closed.
+"""
+
+import os
+import re
+import time
+import queue
+import threading
+import numpy as np
+
+from audio_codec import create_wav_header, SAMPLE_RATE
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(__file__), 'recordings')
+RECORD_AUDIO = os.getenv('CLOVA_RECORD_AUDIO', '0') == '1'  # Default for 'start' without a 'record' flag
+PREALLOCATE_SECONDS = 600   # Initial allocation (about 19 MB per channel)
+GROW_SECONDS = 600          # Allocation step once that is used up
+HEADER_INTERVAL = 5.0       # Seconds of audio between header patches
+HEADER_SIZE = 44
+
+
+def recording_name(session_id):
+    safe = re.sub(r'[^\w.-]+', '_', str(session_id)) or 'session'
+    return f"session_{safe}_{time.strftime('%Y%m%d-%H%M%S')}"
+
+
+class WavFile:
+    """Mono 16-bit WAV written through a preallocated, growable file"""
+    def __init__(self, path, sample_rate=SAMPLE_RATE):
+        self.path = path
+        self.part_path = path + '.part'
+        self.sample_rate = sample_rate
+        self.bytes_per_second = sample_rate * 2
+        self.f = open(self.part_path, 'w+b')
+        self.data_bytes = 0
+        self.allocated = 0
+        self.header_at = 0
+        self.f.write(create_wav_header(0, sample_rate))
+        self._reserve(PREALLOCATE_SECONDS * self.bytes_per_second)
+
+    def _reserve(self, nbytes):
+        size = HEADER_SIZE + self.allocated + nbytes
+        try:
+            os.posix_fallocate(self.f.fileno(), 0, size)
+        except (AttributeError, OSError):
+            self.f.truncate(size)  # Sparse file where fallocate is unavailable
+        self.allocated += nbytes
+
+    def write(self, pcm):
+        if self.data_bytes + len(pcm) > self.allocated:
+            self._reserve(max(GROW_SECONDS * self.bytes_per_second, len(pcm)))
+        self.f.seek(HEADER_SIZE + self.data_bytes)
+        self.f.write(pcm)
+        self.data_bytes += len(pcm)
+        if self.data_bytes - self.header_at >= HEADER_INTERVAL * self.bytes_per_second:
+            self._patch_header()
+
+    def _patch_header(self):
+        self.f.seek(0)
+        self.f.write(create_wav_header(self.data_bytes, self.sample_rate))
+        self.f.flush()
+        self.header_at = self.data_bytes
+
+    def close(self):
+        """Drop the unused allocation, finalize the header and publish as .wav"""
+        self.f.truncate(HEADER_SIZE + self.data_bytes)
+        self._patch_header()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        if self.data_bytes:
+            os.replace(self.part_path, self.path)
+        else:
+            os.remove(self.part_path)
+        return self.data_bytes / self.bytes_per_second
+
+
+class SessionRecorder:
+    """Queues raw (interleaved) PCM from the relay worker; a thread splits channels and writes"""
+    def __init__(self, name, labels=None, directory=RECORDINGS_DIR):
+        self.name = name
+        self.labels = list(labels) if labels else [None]
+        self.directory = directory
+        self.queue = queue.Queue()
+        self.files = []
+        self.thread = None
+
+    def path(self, label):
+        suffix = f"_{label}" if label else ''
+        return os.path.join(self.directory, f"{self.name}{suffix}.wav")
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.files = [WavFile(self.path(label)) for label in self.labels]
+        self.thread = threading.Thread(target=self._run, daemon=True, name=f"recorder-{self.name}")
+        self.thread.start()
+        print(f"⏺️ Recording audio to {', '.join(os.path.basename(f.path) for f in self.files)}")
+
+    def write(self, chunk):
+        """Non-blocking; chunk is Int16 PCM interleaved across the recorder's channels"""
+        self.queue.put(chunk)
+
+    def close(self):
+        """Blocking: flush queued audio and finalize the files"""
+        if not self.thread: return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        channels = len(self.files)
+        pending = b''  # Odd byte/sample carried to the next chunk
+        while True:
+            chunk = self.queue.get()
+            if chunk is None: break
+            try:
+                data = pending + chunk
+                usable = len(data) - len(data) % (2 * channels)
+                pending = data[usable:]
+                if channels == 1:
+                    self.files[0].write(data[:usable])
+                    continue
+                arr = np.frombuffer(data, dtype=np.int16, count=usable // 2)
+                for c, wav in enumerate(self.files):
+                    wav.write(arr[c::channels].tobytes())
+            except Exception as e:
+                print(f"⚠️ Recorder write failed ({self.name}): {e}")
+        for wav in self.files:
+            try:
+                seconds = wav.close()
+                if seconds: print(f"💾 Saved {os.path.basename(wav.path)} ({seconds:.1f}s)")
+            except Exception as e:
+                print(f"⚠️ Recorder close failed ({wav.path}): {e}")
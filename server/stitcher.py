@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Seam Stitcher
+A segment that continues a forced cut starts with audio repeated from the
+end of the previous one (VoiceSegmenter overlap), so its transcript repeats
+the last words of the previous line. The stitcher finds the run of words
+shared by the previous line's tail and the new line's head and drops it
+from the new line. It runs in delivery (seq) order, per speaker.
+
+When the previous line ends with a cut-off piece of a word the new line
+has whole ('아프' / '아프셨죠'), the new line keeps the whole word and the
+piece is the part to drop: live lines carry 'trim_prev' (words to remove
+from the end of the line they continue), apply_all() removes them.
+"""
+
+import re
+from difflib import SequenceMatcher
+
+WORDS_PER_SECOND = 4.0  # Upper estimate for Korean conversational speech
+_PUNCT = re.compile(r'[^\w]+')
+
+
+def _norm(word):
+    return _PUNCT.sub('', word).lower()
+
+
+def _same(a, b):
+    """Equal, or one is a cut-off piece of the other (a word split at the seam)"""
+    if a == b: return True
+    if not a or not b: return False
+    short, long = (a, b) if len(a) <= len(b) else (b, a)
+    return len(short) >= 2 and (long.startswith(short) or long.endswith(short))
+
+
+def seam_words(prev_text, text, overlap_seconds):
+    """(leading words of text that repeat the end of prev_text, trailing words of prev_text to drop instead)"""
+    window = int(overlap_seconds * WORDS_PER_SECOND) + 2
+    prev = [_norm(w) for w in prev_text.split()[-window:]]
+    head = [_norm(w) for w in text.split()[:window]]
+    if not prev or not head: return 0, 0
+
+    # Exact suffix/prefix run, allowing a cut-off word at either end of the seam
+    for k in range(min(len(prev), len(head)), 0, -1):
+        a, b = prev[-k:], head[:k]
+        if a[1:-1] == b[1:-1] and _same(a[0], b[0]) and _same(a[-1], b[-1]):
+            if a[-1] != b[-1] and b[-1].startswith(a[-1]): return k - 1, 1  # prev ends mid-word: keep the whole one
+            return k, 0
+
+    # Otherwise the longest shared run that ends near the end of prev and starts near the head
+    best = 0
+    for block in SequenceMatcher(None, prev, head, autojunk=False).get_matching_blocks():
+        if block.size and block.a + block.size >= len(prev) - 1 and block.b <= 1:
+            best = max(best, block.b + block.size)
+    return best, 0
+
+
+def stitch(prev_text, text, overlap_seconds):
+    """(text without the repeated head, words dropped, words to drop from the end of prev_text)"""
+    n, cut = seam_words(prev_text, text, overlap_seconds)
+    return (' '.join(text.split()[n:]) if n else text), n, cut
+
+
+class SeamStitcher:
+    """Applies stitch() to payloads or log records that carry 'continues' (previous seq) and 'overlap' (s)"""
+    def __init__(self):
+        self.last = {}  # speaker -> (seq, unstitched text)
+        self.dropped = 0
+
+    def apply(self, item):
+        """Returns the item (a copy if trimmed), or None when nothing new is left"""
+        text = item.get('text') or ''
+        speaker = item.get('speaker')
+        prev = self.last.get(speaker)
+        self.last[speaker] = (item.get('seq'), text)
+        if item.get('continues') is None or not prev or prev[0] != item['continues'] or not text:
+            return item
+        stitched, n, cut = stitch(prev[1], text, item.get('overlap', 0))
+        if not n and not cut: return item
+        self.dropped += n
+        if not stitched: return None
+        item = {**item, 'text': stitched}
+        if n: item['stitched'] = n
+        if cut: item['trim_prev'] = cut
+        return item
+
+    def apply_all(self, items):
+        """Stitch a seq-ordered list (e.g. transcript log records), trimming cut-off words from earlier lines"""
+        out, last = [], {}  # speaker -> index in out of the speaker's latest line
+        for item in items:
+            line = self.apply(item)
+            if line is None: continue
+            speaker = line.get('speaker')
+            i = last.get(speaker)
+            if line.get('trim_prev') and i is not None and out[i].get('seq') == line.get('continues'):
+                words = (out[i].get('text') or '').split()
+                out[i] = {**out[i], 'text': ' '.join(words[:-line['trim_prev']])}
+            last[speaker] = len(out)
+            out.append(line)
+        return [line for line in out if line.get('text')]
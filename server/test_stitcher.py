@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Seam stitcher checks (python -m pytest test_stitcher.py)
+"""
+
+from stitcher import stitch, SeamStitcher
+
+
+def test_repeated_words_dropped():
+    assert stitch('오늘 허리가 많이 아프셨죠', '많이 아프셨죠 침을 맞고 가세요', 0.8) == ('침을 맞고 가세요', 2, 0)
+
+
+def test_cut_off_word_keeps_whole_word():
+    # The previous line ends mid-word: the new line keeps '아프셨죠', the fragment goes from the previous line
+    assert stitch('오늘 허리가 많이 아프', '아프셨죠 침을 맞고 가세요', 0.8) == ('아프셨죠 침을 맞고 가세요', 0, 1)
+    assert stitch('오늘 허리가 많이 아프', '많이 아프셨죠 침을 맞고 가세요', 0.8) == ('아프셨죠 침을 맞고 가세요', 1, 1)
+
+
+def test_apply_all_trims_previous_line():
+    records = [
+        {'seq': 0, 'speaker': 'Left', 'text': '오늘 허리가 많이 아프'},
+        {'seq': 1, 'speaker': 'Left', 'text': '아프셨죠 침을 맞고 가세요', 'continues': 0, 'overlap': 0.8},
+    ]
+    lines = SeamStitcher().apply_all(records)
+    assert [line['text'] for line in lines] == ['오늘 허리가 많이', '아프셨죠 침을 맞고 가세요']
+    assert lines[1]['trim_prev'] == 1
+
+
+def test_unrelated_line_untouched():
+    assert stitch('오늘 허리가 많이 아프셨죠', '침을 맞고 가세요', 0.8) == ('침을 맞고 가세요', 0, 0)
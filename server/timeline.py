@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Conversation Timeline
+Every channel's segments are cut on the same session sample clock (all
+channels see every message), so their start samples order the
+conversation across speakers. Lines are delivered in upload-completion
+order instead, so the merger holds each final line until no channel can
+still produce one that starts earlier:
+
+- a channel's horizon is the start of its oldest segment still being
+  recognized, or else the earliest start its segmenter can still produce
+  (open segment start, or the current position less the pre-roll);
+- a line is released once its start is at or before every channel's
+  horizon, or after max_hold seconds at the latest (then marked 'late' if a
+  later-starting line already went out).
+
+merge_records() gives the same order for logged lines, for plan generation.
+"""
+
+import os
+import heapq
+import asyncio
+import itertools
+import threading
+import time
+from stitcher import SeamStitcher
+
+TIMELINE_MAX_HOLD = float(os.getenv('CLOVA_TIMELINE_MAX_HOLD', 4.0))  # Upper bound on added latency, seconds
+TICK = 0.1  # Seconds between horizon checks while lines are held
+SAMPLE_RATE = 16000
+
+
+class TimelineMerger:
+    """Releases final lines of several channels in start-sample order (push/release on the event loop)"""
+    def __init__(self, loop, emit, horizons, max_hold=TIMELINE_MAX_HOLD):
+        self.loop = loop
+        self.emit = emit            # async callable(payload)
+        self.horizons = horizons    # label -> fn() giving the earliest start not yet sent for recognition
+        self.max_hold = max_hold
+        self.lock = threading.Lock()
+        self.pending = {label: {} for label in horizons}  # label -> {seq: start_sample} being recognized
+        self.held = []              # Heap of (start_sample, seq, order, arrived, payload)
+        self.order = itertools.count()
+        self.last_start = None
+        self.timer = None
+        self.tail = None
+        self.released = 0
+        self.late = 0
+
+    def expect(self, label, seq, start_sample):
+        """A segment went out for recognition (any thread)"""
+        with self.lock: self.pending.setdefault(label, {})[seq] = start_sample
+
+    def settle(self, label, seq):
+        """That segment will not produce a line (empty, failed, spooled) or its line arrived (any thread)"""
+        with self.lock: self.pending.get(label, {}).pop(seq, None)
+
+    def horizon(self):
+        bound = None
+        with self.lock: waiting = [min(p.values()) for p in self.pending.values() if p]
+        for fn in self.horizons.values():
+            h = fn()
+            if h is not None: waiting.append(h)
+        for h in waiting:
+            bound = h if bound is None else min(bound, h)
+        return bound
+
+    def push(self, payload):
+        """A final (stitched) line, in any order across channels"""
+        self.settle(payload.get('speaker'), payload.get('seq'))
+        start = payload.get('start_sample')
+        if start is None:
+            self._release_line(payload)  # No timing: nothing to order by
+            return
+        heapq.heappush(self.held, (start, payload.get('seq', 0), next(self.order), time.monotonic(), payload))
+        self.release()
+
+    def release(self):
+        bound, now = self.horizon(), time.monotonic()
+        while self.held:
+            start, _, _, arrived, payload = self.held[0]
+            if (bound is None or start > bound) and now - arrived < self.max_hold: break
+            heapq.heappop(self.held)
+            self._release_line(payload)
+        if self.held and self.timer is None:
+            self.timer = self.loop.call_later(TICK, self._tick)
+
+    def _tick(self):
+        # Horizons move with the audio even when no line arrives
+        self.timer = None
+        self.release()
+
+    def _release_line(self, payload):
+        start = payload.get('start_sample')
+        if start is not None and self.last_start is not None and start < self.last_start:
+            payload = {**payload, 'late': True}
+            self.late += 1
+        elif start is not None:
+            self.last_start = start
+        self.released += 1
+        self.tail = self.loop.create_task(self._emit_after(self.tail, payload))
+
+    async def _emit_after(self, previous, payload):
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        await self.emit(payload)
+
+    def stats(self):
+        with self.lock: pending = sum(len(p) for p in self.pending.values())
+        return {'held': len(self.held), 'recognizing': pending, 'released': self.released, 'late': self.late,
+                'max_hold': self.max_hold}
+
+
+def span_fields(start_sample, end_sample, sample_rate=SAMPLE_RATE):
+    """Payload timing on the session clock: exact samples plus rounded seconds (unknown ends left out)"""
+    fields = {}
+    if start_sample is not None: fields.update(start=round(start_sample / sample_rate, 3), start_sample=start_sample)
+    if end_sample is not None: fields.update(end=round(end_sample / sample_rate, 3), end_sample=end_sample)
+    return fields
+
+
+def merge_records(records):
+    """Transcript log records of one recording as one conversation: stitched per speaker, ordered by start"""
+    records = sorted(records, key=lambda r: r.get('seq', 0))  # Recovered lines are appended late
+    lines = SeamStitcher().apply_all(records)
+    return sorted(lines, key=lambda r: (r['start_sample'] if r.get('start_sample') is not None else float('inf'),
+                                        r.get('seq', 0)))
+
+
+def format_conversation(lines, sample_rate=SAMPLE_RATE):
+    """'[mm:ss.s] Speaker: text' per line, the transcript text the plan prompt expects"""
+    out = []
+    for line in lines:
+        start = line.get('start_sample')
+        stamp = f"[{int(start / sample_rate // 60):02d}:{start / sample_rate % 60:04.1f}] " if start is not None else ''
+        out.append(f"{stamp}{line.get('speaker', '')}: {line.get('text', '')}")
+    return '\n'.join(out)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Session Transcript Log
+Append-only JSONL record of every final transcript line, one log per
+session. A single background thread writes all sessions' logs and fsyncs
+once per batch, so relay workers only enqueue. Files are rotated by size,
+and a torn last line left by a crash is trimmed when the log is reopened.
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import threading
+
+LOG_DIR = os.getenv('TRANSCRIPT_LOG_DIR', os.path.join(os.path.dirname(__file__), 'session_logs'))
+FSYNC_INTERVAL = 0.2          # Max seconds a record waits before it is on disk
+MAX_BYTES = 16 * 1024 * 1024  # Rotate the active file beyond this size
+KEEP_ROTATED = 20             # Rotated files kept per session
+IDLE_CLOSE = 60.0             # Close file handles unused for this long
+TAIL_BLOCK = 64 * 1024
+SAFE_NAME = re.compile(r'^[\w.-]+$')  # What log_name() produces: no path separators
+
+
+def _safe_id(session_id):
+    return re.sub(r'[^\w.-]+', '_', str(session_id)) or 'session'
+
+
+def log_name(session_id):
+    """File-safe log name: session id plus start time"""
+    return f"{_safe_id(session_id)}-{time.strftime('%Y%m%d-%H%M%S')}"
+
+
+def read_tail(path, n):
+    """Last n JSON records of one file, reading backwards in blocks"""
+    if n <= 0 or not os.path.exists(path): return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b''
+        while pos > 0 and data.count(b'\n') <= n:
+            step = min(TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.split(b'\n')
+    if pos > 0: lines = lines[1:]  # First line may be partial
+    records = []
+    for line in lines[::-1]:
+        if len(records) == n: break
+        try:
+            if line: records.append(json.loads(line))
+        except ValueError: pass  # Torn line from a crash
+    return records[::-1]
+
+
+class TranscriptLog:
+    """Shared background writer for per-session JSONL transcript logs"""
+    def __init__(self, directory=LOG_DIR, fsync_interval=FSYNC_INTERVAL, max_bytes=MAX_BYTES, keep=KEEP_ROTATED):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.queue = queue.Queue()
+        self.files = {}  # name -> [file, size, last_used]
+        self.thread = None
+        self.written = 0
+        self.syncs = 0
+
+    def start(self):
+        if self.thread: return
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, daemon=True, name="transcript-log")
+        self.thread.start()
+
+    def stop(self):
+        if not self.thread: return
+        self.queue.put(None)
+        self.thread.join(5)
+        self.thread = None
+
+    def append(self, name, record):
+        """Non-blocking; safe from any thread"""
+        self.queue.put((name, {'ts': round(time.time(), 3), **record}))
+
+    def path(self, name, index=None):
+        if not SAFE_NAME.match(str(name)): raise ValueError(f"Invalid log name: {name!r}")
+        suffix = f".{index:04d}" if index is not None else ''
+        return os.path.join(self.directory, f"{name}{suffix}.jsonl")
+
+    def rotated(self, name):
+        """Indexes of rotated files, oldest first"""
+        pattern = re.compile(re.escape(name) + r'\.(\d{4})\.jsonl$')
+        try: found = [pattern.match(f) for f in os.listdir(self.directory)]
+        except FileNotFoundError: return []
+        return sorted(int(m.group(1)) for m in found if m)
+
+    def known(self, name):
+        """Names from clients (get_transcript_log, plan requests) must be one of this directory's logs"""
+        return isinstance(name, str) and bool(SAFE_NAME.match(name)) and name in self.sessions()
+
+    def tail(self, name, n=100):
+        """Last n records of a session, newest file first; lags the writer by at most fsync_interval"""
+        if not self.known(name): return []  # Unknown or unsafe name: nothing outside the log directory is read
+        records = read_tail(self.path(name), n)
+        for index in reversed(self.rotated(name)):
+            if len(records) >= n: break
+            records = read_tail(self.path(name, index), n - len(records)) + records
+        return records
+
+    def latest(self, session_id):
+        """Newest log started by log_name(session_id), e.g. after the session itself was closed"""
+        pattern = re.compile(re.escape(_safe_id(session_id)) + r'-\d{8}-\d{6}$')
+        names = [name for name in self.sessions() if pattern.match(name)]
+        return max(names, key=lambda name: name[-15:]) if names else None
+
+    def sessions(self):
+        try: names = os.listdir(self.directory)
+        except FileNotFoundError: return []
+        return sorted({f[:-6] for f in names if f.endswith('.jsonl') and not re.search(r'\.\d{4}\.jsonl$', f)})
+
+    def _open(self, name):
+        path = self.path(name)
+        f = open(path, 'ab')
+        size = f.tell()
+        if size:
+            # Trim a half-written last line so the file stays valid JSONL
+            with open(path, 'rb') as r:
+                r.seek(max(0, size - TAIL_BLOCK))
+                data = r.read()
+            if not data.endswith(b'\n'):
+                cut = data.rfind(b'\n')
+                size = size - len(data) + cut + 1
+                f.truncate(size)
+                print(f"🩹 Trimmed torn record in {os.path.basename(path)}")
+        entry = self.files[name] = [f, size, time.monotonic()]
+        return entry
+
+    def _rotate(self, name, entry):
+        entry[0].close()
+        indexes = self.rotated(name)
+        os.replace(self.path(name), self.path(name, (indexes[-1] + 1) if indexes else 1))
+        for index in indexes[:max(0, len(indexes) + 1 - self.keep)]:
+            try: os.remove(self.path(name, index))
+            except OSError: pass
+        del self.files[name]
+        return self._open(name)
+
+    def _write(self, batch):
+        grouped = {}
+        for name, record in batch:
+            grouped.setdefault(name, []).append(
+                json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        dirty = []
+        for name, lines in grouped.items():
+            try:
+                entry = self.files.get(name) or self._open(name)
+                if entry[1] and entry[1] + sum(map(len, lines)) > self.max_bytes:
+                    entry = self._rotate(name, entry)
+                data = b''.join(lines)
+                entry[0].write(data)
+                entry[1] += len(data)
+                entry[2] = time.monotonic()
+                dirty.append(entry[0])
+                self.written += len(lines)
+            except Exception as e:
+                print(f"⚠️ Transcript log write failed ({name}): {e}")
+        for f in dirty:
+            try:
+                f.flush()
+                os.fsync(f.fileno())
+            except Exception as e:
+                print(f"⚠️ Transcript log fsync failed: {e}")
+        if dirty: self.syncs += 1
+
+    def _close_idle(self):
+        now = time.monotonic()
+        for name, entry in list(self.files.items()):
+            if now - entry[2] > IDLE_CLOSE:
+                entry[0].close()
+                del self.files[name]
+
+    def _run(self):
+        running = True
+        while running:
+            try:
+                item = self.queue.get(timeout=IDLE_CLOSE)
+            except queue.Empty:
+                self._close_idle()
+                continue
+            # Collect everything arriving within one fsync interval into a single batch
+            batch = []
+            deadline = time.monotonic() + self.fsync_interval
+            while True:
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch: self._write(batch)
+            self._close_idle()
+        for entry in self.files.values(): entry[0].close()
+        self.files.clear()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Clova Upload Dispatcher
+Fixed pool of upload workers, each holding a warm keep-alive connection.
+Jobs are grouped by key (session/room) and served round-robin so one busy
+room cannot starve the others.
+"""
+
+import threading
+import time
+from collections import deque
+import requests
+
+_STOP = object()
+
+
+class UploadDispatcher:
+    """Runs upload jobs on a fixed number of workers with pooled HTTPS connections"""
+
+    def __init__(self, base_url, max_workers=4, max_pending=64, keepalive_interval=30.0, name="upload"):
+        self.base_url = base_url
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self.keepalive_interval = keepalive_interval
+        self.name = name
+
+        self.workers = []
+        self.ready = threading.Event()
+        self.stopping = False
+        self._warm_count = 0
+        self._warm_done = 0
+
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.pending = {}       # key -> deque of (fn, args)
+        self.order = deque()    # keys with waiting jobs, round-robin
+        self.pending_count = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self, wait=True, timeout=5.0):
+        """Start workers and open one connection per worker before the first segment"""
+        if self.workers: return
+        self.stopping = False
+        for i in range(self.max_workers):
+            t = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self.workers.append(t)
+        if wait: self.ready.wait(timeout)
+        print(f"🔌 {self.name}: {self._warm_count}/{self.max_workers} connections warm")
+
+    def stop(self, timeout=2.0):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        for t in self.workers: t.join(timeout=timeout)
+        self.workers = []
+
+    def submit(self, fn, *args, key=None):
+        """Queue fn(session, *args) for a worker. Returns False when the queue is full."""
+        with self.cond:
+            if self.pending_count >= self.max_pending:
+                self.rejected += 1
+                print(f"⚠️ {self.name}: queue full ({self.max_pending}), segment dropped")
+                return False
+            jobs = self.pending.get(key)
+            if jobs is None:
+                jobs = self.pending[key] = deque()
+                self.order.append(key)
+            jobs.append((fn, args))
+            self.pending_count += 1
+            waiting, in_flight = self.pending_count, self.in_flight
+            self.cond.notify()
+        if in_flight >= self.max_workers:
+            print(f"📤 {self.name}: waiting {waiting}, in flight {in_flight}")
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.max_workers,
+                'pending': self.pending_count,
+                'in_flight': self.in_flight,
+                'waiting_sessions': len(self.order),
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+
+    def _next_job(self, timeout):
+        with self.cond:
+            if not self.order and not self.stopping:
+                self.cond.wait(timeout)
+            if self.stopping: return _STOP
+            if not self.order: return None
+            key = self.order.popleft()
+            jobs = self.pending[key]
+            job = jobs.popleft()
+            if jobs: self.order.append(key)
+            else: del self.pending[key]
+            self.pending_count -= 1
+            self.in_flight += 1
+            return job
+
+    def _warm(self, session):
+        # Any response (even 404) leaves an open TLS connection in the pool
+        try:
+            session.head(self.base_url, timeout=5)
+            return True
+        except Exception as e:
+            print(f"⚠️ {self.name}: warm-up failed: {e}")
+            return False
+
+    def _worker(self):
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        warm = self._warm(session)
+        with self.lock:
+            self._warm_count += int(warm)
+            self._warm_done += 1
+            if self._warm_done >= self.max_workers: self.ready.set()
+        last_used = time.time()
+
+        while True:
+            job = self._next_job(self.keepalive_interval)
+            if job is _STOP: break
+            if job is None:
+                # Keep the connection from idling out between utterances
+                if time.time() - last_used >= self.keepalive_interval:
+                    self._warm(session)
+                    last_used = time.time()
+                continue
+
+            fn, args = job
+            try:
+                fn(session, *args)
+                with self.lock: self.completed += 1
+            except Exception as e:
+                with self.lock: self.failed += 1
+                print(f"❌ {self.name}: job failed: {e}")
+            finally:
+                with self.lock: self.in_flight -= 1
+                last_used = time.time()
+
+        session.close()
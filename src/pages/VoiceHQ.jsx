@@ -18,6 +18,8 @@ const VoiceHQ = () => {
     const [corrections, setCorrections] = useState({});
     const [newWrong, setNewWrong] = useState('');
     const [newCorrect, setNewCorrect] = useState('');
+    // Latest line per speaker ({seq, text, id: Promise}) so a continuation can trim its cut-off tail
+    const lastLines = useRef({});
 
     const containerRef = useRef(null);
     const lastLogIdRef = useRef(null);
@@ -61,8 +63,8 @@ const VoiceHQ = () => {
                 pythonVoiceService.getCorrections(); // Fetch initial corrections
             },
             onTranscript: (msg) => {
-                // msg = {type: 'transcript', speaker: 'Director', text: '...'}
-                handleTranscript(msg.text);
+                // msg = {type: 'transcript', speaker: 'Director', text: '...', seq, continues?, trim_prev?}
+                handleTranscript(msg);
             },
             onCorrections: (data) => {
                 setCorrections(data);
@@ -115,15 +117,25 @@ const VoiceHQ = () => {
         }
     };
 
-    const handleTranscript = (text) => {
+    const handleTranscript = (msg) => {
+        const text = msg.text;
         if (!text || text.trim() === '') return;
 
-        voiceLogService.addLog({
+        // A forced-cut continuation has the whole word the previous line ends with a piece of:
+        // drop that piece from the previous line instead of showing it twice
+        const prev = lastLines.current[msg.speaker];
+        if (msg.trim_prev && prev && prev.seq === msg.continues) {
+            const trimmed = prev.text.split(/\s+/).slice(0, -msg.trim_prev).join(' ');
+            prev.id.then(id => id && voiceLogService.updateLog(id, { text: trimmed }));
+        }
+
+        const id = voiceLogService.addLog({
             roleId: 'Director',
             roleName: '원장님',
             text: text,
             stationId: 'main'
         });
+        lastLines.current[msg.speaker] = { seq: msg.seq, text, id };
     };
 
     const showToast = (message) => {
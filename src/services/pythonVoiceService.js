@@ -4,6 +4,7 @@
  */
 
 import AudioProcessor from '../utils/audioProcessor';
+import { getStationConfig } from '../config/stationConfig';
 
 class PythonVoiceService {
     constructor() {
@@ -57,6 +58,10 @@ class PythonVoiceService {
                     this.callbacks.onTranscript(msg);
                 }
 
+                if (msg.type === 'transcript_partial' && this.callbacks.onTranscriptPartial) {
+                    this.callbacks.onTranscriptPartial(msg);
+                }
+
                 if (msg.type === 'error' && this.callbacks.onError) {
                     this.callbacks.onError(new Error(msg.message));
                 }
@@ -65,6 +70,15 @@ class PythonVoiceService {
                     this.callbacks.onCorrections(msg.data);
                 }
 
+                if (msg.type === 'treatment_plan_delta' && this.callbacks.onTreatmentPlanDelta) {
+                    this.callbacks.onTreatmentPlanDelta(msg.delta, msg.provider);
+                }
+
+                // 'fastest' mode: the provider that was streaming failed; drop its partial preview
+                if (msg.type === 'treatment_plan_reset' && this.callbacks.onTreatmentPlanReset) {
+                    this.callbacks.onTreatmentPlanReset(msg.provider);
+                }
+
                 if (msg.type === 'treatment_plan' && this.callbacks.onTreatmentPlan) {
                     this.callbacks.onTreatmentPlan(msg.plan, msg.provider);
                 }
@@ -89,8 +103,8 @@ class PythonVoiceService {
 
     async start() {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
-            // Send start command
-            this.ws.send(JSON.stringify({ command: 'start' }));
+            // Send start command (station id keys the relay session)
+            this.ws.send(JSON.stringify({ command: 'start', station: getStationConfig()?.id }));
 
             // Start audio capture
             await this.audioProcessor.startCapture({
@@ -150,12 +164,16 @@ class PythonVoiceService {
         }
     }
 
-    generateTreatmentPlan(transcript, provider = 'openai') {
+    // conversationLog: relay log name; the server merges its speakers in spoken order and ignores transcript
+    generateTreatmentPlan(transcript, provider = 'openai', patientName = null, refresh = false, conversationLog = null) {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
             this.ws.send(JSON.stringify({
                 command: 'generate_treatment_plan',
                 transcript: transcript,
-                provider: provider
+                provider: provider,
+                patient_name: patientName,
+                refresh: refresh,
+                log: conversationLog
             }));
             console.log(`🧠 Requested treatment plan using ${provider}`);
         } else {
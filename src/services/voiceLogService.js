@@ -1,5 +1,5 @@
 import { db } from '../lib/firebase';
-import { collection, addDoc, query, orderBy, limit, onSnapshot, serverTimestamp } from 'firebase/firestore';
+import { collection, addDoc, doc, updateDoc, query, orderBy, limit, onSnapshot, serverTimestamp } from 'firebase/firestore';
 
 class VoiceLogService {
     constructor() {
@@ -25,14 +25,28 @@ class VoiceLogService {
 
         if (this.useFirebase) {
             try {
-                await addDoc(collection(db, this.collectionName), log);
+                const ref = await addDoc(collection(db, this.collectionName), log);
+                return ref.id;
             } catch (error) {
                 console.error('Error adding log to Firestore:', error);
-                this.saveToLocal(log); // Fallback
+                return this.saveToLocal(log); // Fallback
             }
-        } else {
-            this.saveToLocal(log);
         }
+        return this.saveToLocal(log);
+    }
+
+    // Rewrites fields of a log added earlier (id as returned by addLog)
+    async updateLog(id, changes) {
+        if (this.useFirebase) {
+            try {
+                await updateDoc(doc(db, this.collectionName, id), changes);
+                return;
+            } catch (error) {
+                console.error('Error updating log in Firestore:', error); // May be a local fallback entry
+            }
+        }
+        const logs = this.getLocalLogs().map(log => (log.id === id ? { ...log, ...changes } : log));
+        localStorage.setItem(this.collectionName, JSON.stringify(logs));
     }
 
     subscribeLogs(callback) {
@@ -61,9 +75,11 @@ class VoiceLogService {
     // LocalStorage Fallback Methods
     saveToLocal(log) {
         const logs = this.getLocalLogs();
-        logs.push({ ...log, id: Date.now().toString() + Math.random().toString(36).substr(2, 9) });
+        const id = Date.now().toString() + Math.random().toString(36).substr(2, 9);
+        logs.push({ ...log, id });
         if (logs.length > 200) logs.shift(); // Keep last 200
         localStorage.setItem(this.collectionName, JSON.stringify(logs));
+        return id;
     }
 
     getLocalLogs() {